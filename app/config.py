@@ -25,3 +25,92 @@ OLLAMA_CHAT_MODEL = os.getenv("OLLAMA_CHAT_MODEL", "llama3")
 
 # Tavily API key (web search)
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", "")
+
+# Vector store: khoảng thời gian (giây) tối thiểu giữa 2 lần kiểm tra file
+# trên đĩa để tự load lại store dùng chung
+STORE_RELOAD_INTERVAL = float(os.getenv("STORE_RELOAD_INTERVAL", "2"))
+
+# Số chiều hash cho vector store chế độ sparse (CSR), có thể để lớn
+# hơn nhiều so với 512 chiều của chế độ dense mà không tốn RAM
+SPARSE_N_FEATURES = int(os.getenv("SPARSE_N_FEATURES", str(2 ** 18)))
+
+# ANN (IVF): số cụm được quét mỗi lần search; tăng để recall cao hơn, giảm để nhanh hơn
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+
+# Hybrid search (BM25 + cosine, gộp bằng reciprocal rank fusion) khi store có index BM25
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+# số ứng viên lấy từ mỗi phía (BM25 / vector) trước khi gộp
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Layout segment: ingest gộp toàn bộ store thành 1 segment khi số segment vượt quá
+# số này (mỗi segment được memory-map, giữ 3 file descriptor)
+SEGMENT_COMPACT_MAX = int(os.getenv("SEGMENT_COMPACT_MAX", "8"))
+
+# Cache embedding: số vector giữ trong LRU trên RAM (query + chunk)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+# Tầng cache trên đĩa (SQLite) cho embedding chunk giữa các lần ingest
+EMBED_DISK_CACHE_PATH = PROCESSED_DIR / "embedding_cache.sqlite"
+# Giới hạn tầng đĩa: số embedding tối đa (vượt thì xoá bản dùng lâu nhất) và số ngày
+# tối đa kể từ lần dùng cuối; 0 = không giới hạn
+EMBED_DISK_CACHE_MAX_ROWS = int(os.getenv("EMBED_DISK_CACHE_MAX_ROWS", "100000"))
+EMBED_DISK_CACHE_MAX_AGE_DAYS = float(os.getenv("EMBED_DISK_CACHE_MAX_AGE_DAYS", "90"))
+
+# Backend embedding: "hashing" (HashingVectorizer 512 chiều, mặc định) hoặc
+# "sentence-transformers" (model chạy CPU, load lười ở lần embed đầu tiên)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing")
+EMBEDDING_MODEL = os.getenv(
+    "EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+# Micro-batching: gom các query embed đồng thời thành 1 lần forward
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+
+# Lượng tử hoá embedding cho lượt quét đầu: "" (tắt), "float16" hoặc "int8";
+# ingest tự build lại khi bật. Số ứng viên re-rank float32 = top_k * QUANT_RERANK_FACTOR
+QUANTIZE_MODE = os.getenv("QUANTIZE_MODE", "")
+QUANT_RERANK_FACTOR = int(os.getenv("QUANT_RERANK_FACTOR", "10"))
+
+# HTTP client dùng chung (keep-alive): số kết nối tối đa giữ trong pool cho mỗi
+# host, nên bằng số thread xử lý request (threadpool mặc định của FastAPI là 40)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "40"))
+# Timeout (giây) tách riêng: connect (mở kết nối) và read (chờ phản hồi)
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))
+TAVILY_CONNECT_TIMEOUT = float(os.getenv("TAVILY_CONNECT_TIMEOUT", "5"))
+TAVILY_READ_TIMEOUT = float(os.getenv("TAVILY_READ_TIMEOUT", "20"))
+
+# Đường /chat async: số kết nối tối đa của client httpx dùng chung cho mỗi dịch vụ
+# (request chờ Ollama/Tavily không giữ thread nên có thể lớn hơn nhiều HTTP_POOL_SIZE)
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "200"))
+# Số thread chạy phần retrieval tốn CPU (embed + vector search) cho /chat
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+# Hạn chót (giây, tính từ lúc nhận câu hỏi) cho từng nhánh chạy song song của /chat:
+# quá hạn thì bỏ nhánh đó (phân loại -> GENERAL, local/web -> ghi chú lỗi vào ngữ cảnh)
+CLASSIFY_TIMEOUT = float(os.getenv("CLASSIFY_TIMEOUT", "15"))
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "20"))
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "20"))
+
+# Phân loại câu hỏi tại chỗ (luật + mô hình tuyến tính): độ tin cậy dưới ngưỡng
+# thì hỏi LLM như cũ (1.01 = luôn hỏi LLM, 0 = không bao giờ)
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.6"))
+
+# Cache câu trả lời /chat: số câu tối đa (0 = tắt), thời gian sống (giây) và ngưỡng
+# cosine để dùng lại câu trả lời của câu hỏi gần giống (> 1 = chỉ khớp chính xác).
+# Ngưỡng mặc định theo backend: embedding hashing cho câu diễn đạt lại cosine chỉ
+# khoảng 0.75-0.8. Ngoài cosine, 2 câu còn phải chung tối thiểu ANSWER_CACHE_MIN_OVERLAP
+# (Jaccard) từ nội dung và cùng các từ có chữ số (Điều 10, mã lớp, tuần)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+ANSWER_CACHE_SIM_THRESHOLD = float(os.getenv(
+    "ANSWER_CACHE_SIM_THRESHOLD",
+    "0.9" if EMBEDDING_BACKEND in ("sentence-transformers", "st") else "0.75",
+))
+ANSWER_CACHE_MIN_OVERLAP = float(os.getenv("ANSWER_CACHE_MIN_OVERLAP", "0.75"))
+
+# Kiểm soát tải LLM: số lời gọi Ollama chạy đồng thời (<= 0: không giới hạn), số lời
+# gọi được xếp hàng chờ (đầy -> 429) và thời gian chờ tối đa trong hàng (quá -> 503)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
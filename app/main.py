@@ -1,17 +1,69 @@
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+import asyncio
+import json
+import logging
 import re
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 
 from app.schemas import ChatRequest, ChatResponse
-from app.services.llm import chat_llm, LLMError
-from app.services.web_search import web_search, WebSearchError
-from app.rag.vector_store import SimpleVectorStore
+from app.config import (
+    CLASSIFY_TIMEOUT,
+    RETRIEVAL_TIMEOUT,
+    RETRIEVAL_WORKERS,
+    WEB_SEARCH_TIMEOUT,
+)
+from app.services.llm import achat_llm, astream_chat_llm, LLMError
+from app.services.web_search import aweb_search, WebSearchError
+from app.rag.vector_store import get_store, reload_store
+from app.rag.schedule_index import format_schedule_row, get_schedule_index
+from app.services.classifier import (
+    CLASS_CODE_RE,
+    classifier_stats,
+    classify_local,
+    get_model as get_classifier_model,
+    record_llm_label,
+)
+from app.services.admission import OverloadedError, PRIORITY_CLASSIFY, llm_admission
+from app.services.answer_cache import answer_cache, normalize_question
+from app.services.embeddings import cache_stats
+from app.services.http_client import aclose_clients, close_sessions
+from app.services.single_flight import AsyncSingleFlight
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# Thread riêng cho phần retrieval tốn CPU (embed + vector search, tra lịch học)
+# của /chat async: giới hạn số việc CPU chạy song song, không chặn event loop
+retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+
+async def run_retrieval(fn: Callable[..., T], *args) -> T:
+    return await asyncio.get_running_loop().run_in_executor(retrieval_pool, fn, *args)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load sẵn vector store + index lịch học + bộ phân loại câu hỏi để request
+    # đầu tiên không phải đọc đĩa / huấn luyện
+    try:
+        get_classifier_model()
+        get_store("default")
+        get_schedule_index()
+    except Exception as e:
+        logger.warning("Không load sẵn được dữ liệu local: %s", e)
+    yield
+    await aclose_clients()
+    close_sessions()
+    retrieval_pool.shutdown(wait=False)
 
 
-app = FastAPI(title="Chatbot học vụ")
+app = FastAPI(title="Chatbot học vụ", lifespan=lifespan)
 
 
 # ====== CORS (nếu sau này bạn tách frontend riêng) ======
@@ -25,14 +77,21 @@ app.add_middleware(
 
 
 # ====== PHÂN LOẠI CÂU HỎI ======
-def classify_question(question: str) -> str:
+async def allm_classify(question: str) -> str:
     """
     Phân loại câu hỏi vào 4 nhóm:
     - REGULATION: quy chế/điều khoản, xét tốt nghiệp, học vụ.
     - TUITION: học phí, lệ phí.
     - SCHEDULE: lịch học, thời khoá biểu của lớp/môn/tuần.
     - GENERAL: kiến thức chung / ngoài lề.
+    Phân loại bằng LLM (async), chỉ dùng khi classify_local không đủ tin cậy.
     """
+    label = (await achat_llm(classify_messages(question), PRIORITY_CLASSIFY)).strip().upper()
+    record_llm_label(label)
+    return label
+
+
+def classify_messages(question: str) -> List[Dict[str, str]]:
     system_prompt = (
         "Bạn phân loại CÂU HỎI của người dùng vào một trong 4 nhóm sau "
         "(chỉ trả về đúng MỘT từ khoá, viết hoa):\n"
@@ -42,20 +101,15 @@ def classify_question(question: str) -> str:
         "- GENERAL: câu hỏi kiến thức chung hoặc ngoài lề (ví dụ AI, thời sự...).\n"
         "Bạn CHỈ trả về một trong 4 từ: REGULATION, TUITION, SCHEDULE hoặc GENERAL."
     )
-    label = chat_llm(
-        [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": question},
-        ]
-    )
-    return label.strip().upper()
-
-CLASS_CODE_RE = re.compile(r"\b\d{2}[A-Z]{2}\d{4}\b")
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question},
+    ]
 
 
 def extract_class_code(text: str) -> str | None:
     """
-    Tìm mã lớp kiểu 25TH0101, 25AV0101...
+    Tìm mã lớp kiểu 25TH0101, 25AV0101, 242101TH001...
     """
     m = CLASS_CODE_RE.search(text.upper())
     return m.group(0) if m else None
@@ -69,72 +123,107 @@ def extract_week(text: str) -> int | None:
     return int(m.group(1)) if m else None
 
 
-# ====== BUILD CONTEXT (LOCAL + WEB, tuỳ loại câu hỏi) ======
-def build_context(question: str) -> Tuple[str, List[str]]:
-    used_sources: List[str] = []
-    context_blocks: List[str] = []
+# Nhãn câu hỏi -> doc_type của chunk (metadata lúc ingest) dùng để lọc khi search
+LABEL_DOC_TYPES = {
+    "SCHEDULE": "schedule",
+    "REGULATION": "regulation",
+    "TUITION": "tuition",
+}
 
-    MIN_LOCAL_SCORE = 0.20
 
-    # 1) Phân loại câu hỏi + trích mã lớp / tuần
-    try:
-        label = classify_question(question)
-    except Exception:
-        label = "GENERAL"
+def search_local(vs, question: str, top_k: int, label: str) -> List[Tuple[str, float]]:
+    """
+    Search local, chỉ chấm điểm các chunk có doc_type ứng với nhãn câu hỏi.
+    Nếu store chưa gắn metadata / không có tài liệu loại đó thì tìm trên toàn bộ
+    (ghi cảnh báo: thường là metadata lúc ingest sai).
+    """
+    doc_type = LABEL_DOC_TYPES.get(label)
+    if doc_type:
+        results = vs.search(question, top_k=top_k, where={"doc_type": doc_type})
+        if results:
+            return results
+        logger.warning(
+            "Store '%s' không có chunk doc_type=%s (nhãn %s): tìm trên toàn bộ store",
+            vs.name, doc_type, label,
+        )
+    return vs.search(question, top_k=top_k)
 
-    class_code = extract_class_code(question)
-    week = extract_week(question)
 
-    # ===== TRƯỜNG HỢP LỊCH HỌC (SCHEDULE) =====
-    if label == "SCHEDULE":
-        try:
-            vs = SimpleVectorStore(name="default")
-            # lấy nhiều chunk hơn một chút
-            local_results = vs.search(question, top_k=20)  # List[(text, score)]
-
-            schedule_filtered: List[Tuple[str, float]] = []
-            for text, score in local_results:
-                # phải có mã lớp
-                if class_code and class_code in text:
-                    # nếu người dùng hỏi kèm tuần thì lọc thêm theo tuần
-                    if week is not None:
-                        if f"tuần {week}" in text.lower() or f"tuan {week}" in text.lower():
-                            schedule_filtered.append((text, score))
-                    else:
-                        schedule_filtered.append((text, score))
-
-            if schedule_filtered:
-                used_sources.append("local")
-                for text, score in schedule_filtered:
-                    context_blocks.append(f"[LOCAL schedule score={score:.2f}] {text}")
+def schedule_from_vectors(
+    question: str, label: str, class_code: str | None, week: int | None
+) -> List[str]:
+    """
+    Tìm lịch học bằng vector search + lọc chuỗi (dùng khi chưa có index lịch học).
+    """
+    vs = get_store("default")
+    # lấy nhiều chunk hơn một chút
+    local_results = search_local(vs, question, 20, label)  # List[(text, score)]
+
+    blocks: List[str] = []
+    for text, score in local_results:
+        # phải có mã lớp
+        if class_code and class_code in text:
+            # nếu người dùng hỏi kèm tuần thì lọc thêm theo tuần
+            if week is not None:
+                if f"tuần {week}" in text.lower() or f"tuan {week}" in text.lower():
+                    blocks.append(f"[LOCAL schedule score={score:.2f}] {text}")
             else:
-                # Không tìm được gì phù hợp -> ghi chú rõ cho LLM
-                msg = (
-                    f"[SYSTEM_NOTE] Không tìm thấy thông tin lịch học"
-                    f"{f' tuần {week}' if week else ''}"
-                    f"{f' của lớp {class_code}' if class_code else ''} "
-                    f"trong các file lịch học đã nạp."
-                )
-                context_blocks.append(msg)
+                blocks.append(f"[LOCAL schedule score={score:.2f}] {text}")
+    return blocks
 
-        except Exception as e:
-            context_blocks.append(f"(Lỗi khi truy vấn dữ liệu local: {e})")
 
-        # Với lịch học: không dùng web
-        context = "\n\n".join(context_blocks)
-        return context, used_sources
+# ====== BUILD CONTEXT (LOCAL + WEB, tuỳ loại câu hỏi) ======
+MIN_LOCAL_SCORE = 0.20
+
+
+def schedule_context(
+    question: str, label: str, class_code: str | None, week: int | None
+) -> Tuple[List[str], List[str]]:
+    """
+    Ngữ cảnh cho câu hỏi lịch học: (context_blocks, used_sources).
+    """
+    used_sources: List[str] = []
+    context_blocks: List[str] = []
+    try:
+        schedule = get_schedule_index()
+        if len(schedule) > 0:
+            # tra cứu chính xác theo (mã lớp, tuần), không cần vector search
+            rows = schedule.lookup(class_code, week) if class_code else []
+            schedule_blocks = [
+                f"[LOCAL schedule] {format_schedule_row(row, class_code)}" for row in rows
+            ]
+        else:
+            # chưa build index lịch học (chưa chạy lại ingest) -> cách cũ
+            schedule_blocks = schedule_from_vectors(question, label, class_code, week)
+
+        if schedule_blocks:
+            used_sources.append("local")
+            context_blocks.extend(schedule_blocks)
+        else:
+            # Không tìm được gì phù hợp -> ghi chú rõ cho LLM
+            msg = (
+                f"[SYSTEM_NOTE] Không tìm thấy thông tin lịch học"
+                f"{f' tuần {week}' if week else ''}"
+                f"{f' của lớp {class_code}' if class_code else ''} "
+                f"trong các file lịch học đã nạp."
+            )
+            context_blocks.append(msg)
+
+    except Exception as e:
+        context_blocks.append(f"(Lỗi khi truy vấn dữ liệu local: {e})")
+    return context_blocks, used_sources
 
-    # ===== CÁC LOẠI CÂU HỎI KHÁC GIỮ NGUYÊN NHƯ CŨ =====
-    # Quyết định có dùng web không
-    use_web = True
-    if label in ("REGULATION", "CURRICULUM"):
-        use_web = False
 
-    # 2) Local RAG (giống code trước đây của bạn)
+def local_context(question: str, label: str) -> Tuple[List[str], List[str]]:
+    """
+    Local RAG cho các loại câu hỏi còn lại: (context_blocks, used_sources).
+    """
+    used_sources: List[str] = []
+    context_blocks: List[str] = []
     try:
-        vs = SimpleVectorStore(name="default")
+        vs = get_store("default")
         top_k = 5 if label != "GENERAL" else 3
-        local_results = vs.search(question, top_k=top_k)
+        local_results = search_local(vs, question, top_k, label)
         filtered = [(t, s) for (t, s) in local_results if s >= MIN_LOCAL_SCORE]
 
         if filtered:
@@ -143,22 +232,252 @@ def build_context(question: str) -> Tuple[str, List[str]]:
                 context_blocks.append(f"[LOCAL score={score:.2f}] {text}")
     except Exception as e:
         context_blocks.append(f"(Lỗi khi truy vấn dữ liệu local: {e})")
+    return context_blocks, used_sources
+
+
+def uses_web(label: str) -> bool:
+    # Quy chế: chỉ dựa vào tài liệu local; lịch học cũng không dùng web
+    return label not in ("REGULATION", "CURRICULUM", "SCHEDULE")
+
+
+def web_context(web_results: List[str]) -> Tuple[List[str], List[str]]:
+    if not web_results:
+        return [], []
+    return [f"[WEB] {snippet}" for snippet in web_results], ["web"]
+
+
+def join_context(
+    parts: List[Tuple[List[str], List[str]]]
+) -> Tuple[str, List[str]]:
+    context_blocks: List[str] = []
+    used_sources: List[str] = []
+    for blocks, sources in parts:
+        context_blocks.extend(blocks)
+        used_sources.extend(sources)
+    return "\n\n".join(context_blocks), list(dict.fromkeys(used_sources))
+
+
+def prefetch_query(question: str) -> None:
+    get_store("default").prefetch_query(question)
+
+
+async def await_stage(task: "asyncio.Future[T]", deadline: float) -> T:
+    """
+    Chờ 1 nhánh tới hạn chót deadline (theo loop.time()); quá hạn thì huỷ nhánh
+    và ném TimeoutError.
+    """
+    timeout = max(0.0, deadline - asyncio.get_running_loop().time())
+    return await asyncio.wait_for(task, timeout)
+
 
-    # 3) Web search
-    if use_web:
+async def abuild_context(question: str) -> Tuple[str, List[str]]:
+    """
+    Phân loại tại chỗ trước; nếu không đủ tin cậy thì chạy song song các nhánh
+    không phụ thuộc nhau:
+    - phân loại câu hỏi (LLM)
+    - tính sẵn embedding query cho local retrieval (retrieval_pool)
+    - web search (Tavily)
+    ngay từ đầu, không chờ nhãn. Có nhãn rồi mới search local với bộ lọc
+    doc_type tương ứng và huỷ các nhánh nhãn đó không cần (vd web cho quy chế,
+    lịch học). Mỗi nhánh có hạn chót riêng tính từ lúc nhận câu hỏi.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        label = classify_local(question)
+    except Exception:
+        # lỗi phân loại tại chỗ: xử lý như lỗi phân loại LLM bên dưới
+        label = "GENERAL"
+    if label is None:
+        classify_task = asyncio.ensure_future(allm_classify(question))
+    else:
+        classify_task = loop.create_future()
+        classify_task.set_result(label)
+    # chưa biết nhãn: gọi web ngay (huỷ sau nếu không cần); biết rồi thì chỉ gọi khi cần
+    if label is None or uses_web(label):
+        web_task = asyncio.ensure_future(aweb_search(question, num_results=3))
+    else:
+        web_task = loop.create_future()
+    prefetch_task = asyncio.ensure_future(run_retrieval(prefetch_query, question))
+    try:
         try:
-            web_results = web_search(question, num_results=3)
-            if web_results:
-                used_sources.append("web")
-                for snippet in web_results:
-                    context_blocks.append(f"[WEB] {snippet}")
-        except WebSearchError as e:
-            context_blocks.append(f"(Lỗi web search: {e})")
+            label = await await_stage(classify_task, start + CLASSIFY_TIMEOUT)
+        except Exception:
+            label = "GENERAL"
+        if not uses_web(label):
+            web_task.cancel()
+
+        try:
+            if label == "SCHEDULE":
+                class_code = extract_class_code(question)
+                week = extract_week(question)
+                local = run_retrieval(schedule_context, question, label, class_code, week)
+            else:
+                # đợi embedding tính sẵn xong để không tính 2 lần song song; lỗi
+                # của nhánh này (vd store chưa có) sẽ hiện ra lại ở local_context
+                await asyncio.wait(
+                    [prefetch_task],
+                    timeout=max(0.0, start + RETRIEVAL_TIMEOUT - asyncio.get_running_loop().time()),
+                )
+                local = run_retrieval(local_context, question, label)
+            parts = [await await_stage(asyncio.ensure_future(local), start + RETRIEVAL_TIMEOUT)]
+        except asyncio.TimeoutError:
+            parts = [([f"(Lỗi khi truy vấn dữ liệu local: quá {RETRIEVAL_TIMEOUT:g} giây)"], [])]
+
+        if uses_web(label):
+            try:
+                parts.append(web_context(await await_stage(web_task, start + WEB_SEARCH_TIMEOUT)))
+            except asyncio.TimeoutError:
+                parts.append(([f"(Lỗi web search: quá {WEB_SEARCH_TIMEOUT:g} giây)"], []))
+            except WebSearchError as e:
+                parts.append(([f"(Lỗi web search: {e})"], []))
+        return join_context(parts)
+    finally:
+        # request bị huỷ / lỗi giữa chừng: không để nhánh nào chạy tiếp vô ích
+        for task in (classify_task, prefetch_task, web_task):
+            if task.done():
+                if not task.cancelled():
+                    task.exception()  # nhánh lỗi mà không ai chờ: không log cảnh báo
+            else:
+                task.cancel()
+
+
+# ====== CACHE CÂU TRẢ LỜI ======
+def data_version() -> Tuple:
+    """
+    Phiên bản dữ liệu local mà câu trả lời dựa vào: generation của store (tăng
+    mỗi lần load lại sau ingest) + chữ ký file index lịch học.
+    """
+    try:
+        generation = get_store("default").generation
+    except Exception:
+        generation = None
+    try:
+        schedule = get_schedule_index().signature
+    except Exception:
+        schedule = None
+    return generation, schedule
 
-    used_sources = list(dict.fromkeys(used_sources))
-    context = "\n\n".join(context_blocks)
-    return context, used_sources
 
+async def cached_answer(question: str, mode: str) -> Tuple[Tuple, Optional[Tuple[str, List[str]]]]:
+    """
+    (phiên bản dữ liệu, (answer, used_sources) nếu có trong cache). Phần có thể
+    đọc đĩa / tính embedding chạy trong retrieval_pool.
+    """
+    version = await run_retrieval(data_version)
+    hit = answer_cache.get(question, mode, version)
+    if hit is None:
+        hit = await run_retrieval(answer_cache.get_similar, question, mode, version)
+    return version, hit
+
+
+def overloaded_response(e: OverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail=f"Hệ thống đang quá tải, vui lòng thử lại sau: {e}",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def reject_if_saturated() -> None:
+    """
+    Hàng đợi LLM đã đầy: từ chối ngay (429) trước khi tốn công phân loại / retrieval.
+    """
+    if llm_admission.saturated():
+        raise overloaded_response(
+            OverloadedError("hàng đợi LLM đã đầy.", 429, llm_admission.retry_after())
+        )
+
+
+def cacheable(context: str) -> bool:
+    # ngữ cảnh có nhánh lỗi / quá hạn -> câu trả lời thiếu thông tin, không giữ lại
+    return "(Lỗi " not in context
+
+
+# ====== GỘP REQUEST TRÙNG NHAU ======
+# Nhiều sinh viên hỏi cùng 1 câu trong vài giây (vd vừa có thông báo): các request
+# cùng câu hỏi (đã chuẩn hoá) + chế độ nguồn đang chạy dùng chung 1 lượt
+# phân loại + retrieval + sinh câu trả lời.
+chat_flight = AsyncSingleFlight()
+context_flight = AsyncSingleFlight()
+
+
+def flight_key(question: str, mode: str) -> Tuple[str, str]:
+    return normalize_question(question), mode
+
+
+async def answer_question(question: str, mode: str) -> Tuple[str, List[str]]:
+    """
+    Toàn bộ đường trả lời của /chat: cache -> ngữ cảnh -> LLM -> lưu cache.
+    """
+    version, hit = await cached_answer(question, mode)
+    if hit is not None:
+        return hit
+
+    context, used_sources = await abuild_context(question)
+    answer = await achat_llm(answer_messages(question, context))
+    if cacheable(context):
+        await run_retrieval(answer_cache.put, question, mode, version, answer, used_sources)
+    return answer, used_sources
+
+
+# ====== PROMPT TRẢ LỜI ======
+ANSWER_SYSTEM_PROMPT = (
+    "Bạn là chatbot hỗ trợ học vụ của Trường Đại học Bình Dương. "
+    "Trong mọi câu trả lời, bạn phải xưng là 'tôi'.\n\n"
+
+    "Bạn phải PHÂN BIỆT 2 LOẠI CÂU HỎI:\n"
+    "1) CÂU HỎI VỀ QUY CHẾ / ĐIỀU KIỆN HỌC VỤ (ví dụ: xét tốt nghiệp, xử lý vi phạm, học lại, bảo lưu...).\n"
+    "   - Với LOẠI NÀY, bạn được phép trích dẫn Điều, Khoản trong Quy chế và NÊN nêu rõ nếu có.\n"
+    "   - Phải liệt kê ĐẦY ĐỦ các điều kiện, trường hợp và ngoại lệ có trong ngữ cảnh, "
+    "     không được bỏ sót điều kiện quan trọng.\n"
+    "   - Nếu thực sự không tìm thấy điều khoản liên quan trong ngữ cảnh, hãy nói: "
+    "     'Trong Quy chế đào tạo hiện tại tôi không thấy điều khoản rõ về vấn đề này, nên tôi không chắc.'\n\n"
+
+    "2) CÂU HỎI KIẾN THỨC CHUNG / GIỚI THIỆU / KHÔNG LIÊN QUAN TRỰC TIẾP ĐẾN QUY CHẾ\n"
+    "   (ví dụ: ChatGPT là gì, giới thiệu về trường, hỏi về AI, tin tức,...).\n"
+    "   - Với LOẠI NÀY, TUYỆT ĐỐI KHÔNG được nhắc tới 'Điều', 'Khoản', 'Quy chế', "
+    "     cũng KHÔNG nói các câu như 'tôi không thấy Điều, Khoản nào...'.\n"
+    "   - Chỉ tập trung giải thích nội dung câu hỏi dựa trên ngữ cảnh local và web.\n\n"
+
+    "Quy tắc dùng LOCAL & WEB:\n"
+    "- Ưu tiên thông tin LOCAL khi câu hỏi liên quan đến trường, quy chế, chương trình đào tạo, học phí.\n"
+    "- Nếu dùng WEB, hãy nói rõ 'theo thông tin tham khảo từ web' rồi tổng hợp nội dung đầy đủ, "
+    "  không chỉ chép lại một câu ngắn.\n\n"
+
+    "Cách trình bày câu trả lời:\n"
+    "- Luôn trả lời HOÀN TOÀN bằng TIẾNG VIỆT.\n"
+    "- Trả lời súc tích nhưng ĐẦY ĐỦ ý chính (điều kiện, mốc thời gian, ngoại lệ, ví dụ nếu có).\n"
+    "- Ưu tiên dùng gạch đầu dòng hoặc đánh số để người đọc dễ theo dõi.\n"
+    "- Không lặp lại nguyên văn ngữ cảnh; hãy diễn đạt lại cho dễ hiểu.\n\n"
+
+    "Nếu trong NGỮ CẢNH có dòng bắt đầu bằng [SYSTEM_NOTE] thì bạn "
+    "PHẢI làm đúng theo nội dung dòng đó và KHÔNG được suy đoán hay bịa thêm thông tin."
+)
+
+
+def answer_messages(question: str, context: str) -> List[Dict[str, str]]:
+    """
+    Messages gửi LLM để trả lời câu hỏi dựa trên ngữ cảnh đã ghép.
+    """
+    if context:
+        user_content = (
+            f"Người dùng hỏi: {question}\n\n"
+            f"Ngữ cảnh (từ tài liệu & web):\n{context}\n\n"
+            "Hãy TRẢ LỜI BẰNG TIẾNG VIỆT, rõ ràng, có thể đánh số/gạch đầu dòng. "
+            "Nếu trong ngữ cảnh có Điều, Khoản liên quan thì hãy nêu rõ."
+        )
+    else:
+        user_content = (
+            f"Người dùng hỏi: {question}\n\n"
+            "Hiện tại không có ngữ cảnh từ tài liệu hoặc web. "
+            "Hãy trả lời chung chung nếu có thể, hoặc nói rõ là bạn không chắc."
+        )
+
+    return [
+        {"role": "system", "content": ANSWER_SYSTEM_PROMPT},
+        {"role": "user", "content": user_content},
+    ]
 
 
 # ====== GIAO DIỆN HTML (Chatbot học vụ) ======
@@ -379,6 +698,14 @@ def index() -> HTMLResponse:
             const sendLabel = document.getElementById('sendLabel');
             const sendSpinner = document.getElementById('sendSpinner');
 
+            function setSources(msg, sources) {
+                if (!sources || sources.length === 0) return;
+                const meta = document.createElement('div');
+                meta.className = 'meta';
+                meta.innerHTML = '<span class="source">Nguồn: ' + sources.join(', ') + '</span>';
+                msg.appendChild(meta);
+            }
+
             function appendMessage(role, text, sources) {
                 const empty = chatEl.querySelector('.empty-state');
                 if (empty) empty.remove();
@@ -391,15 +718,11 @@ def index() -> HTMLResponse:
                 bubble.textContent = text;
                 msg.appendChild(bubble);
 
-                if (role === 'bot' && sources && sources.length > 0) {
-                    const meta = document.createElement('div');
-                    meta.className = 'meta';
-                    meta.innerHTML = '<span class="source">Nguồn: ' + sources.join(', ') + '</span>';
-                    msg.appendChild(meta);
-                }
+                if (role === 'bot') setSources(msg, sources);
 
                 chatEl.appendChild(msg);
                 chatEl.scrollTop = chatEl.scrollHeight;
+                return { msg, bubble };
             }
 
             function setLoading(isLoading) {
@@ -417,18 +740,54 @@ def index() -> HTMLResponse:
                 setLoading(true);
 
                 try {
-                    const res = await fetch('/chat', {
+                    // /chat/stream trả Server-Sent Events: hiện từng đoạn câu trả lời ngay khi có
+                    const res = await fetch('/chat/stream', {
                         method: 'POST',
                         headers: { 'Content-Type': 'application/json' },
                         body: JSON.stringify({ question })
                     });
-                    const data = await res.json();
 
                     if (!res.ok) {
+                        const data = await res.json();
                         const detail = data.detail || 'Lỗi không xác định';
                         appendMessage('bot', '❌ Lỗi: ' + detail, []);
-                    } else {
-                        appendMessage('bot', data.answer, data.used_sources || []);
+                        return;
+                    }
+
+                    const { msg, bubble } = appendMessage('bot', '', []);
+                    const reader = res.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    let sources = [];
+                    while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, { stream: true });
+
+                        // mỗi event kết thúc bằng 1 dòng trống: "event: ...\\ndata: {...}\\n\\n"
+                        let end;
+                        while ((end = buffer.indexOf('\\n\\n')) >= 0) {
+                            const raw = buffer.slice(0, end);
+                            buffer = buffer.slice(end + 2);
+                            let event = 'message', data = '';
+                            for (const line of raw.split('\\n')) {
+                                if (line.startsWith('event:')) event = line.slice(6).trim();
+                                else if (line.startsWith('data:')) data += line.slice(5).trim();
+                            }
+                            const payload = data ? JSON.parse(data) : {};
+
+                            if (event === 'sources') {
+                                sources = payload.used_sources || [];
+                            } else if (event === 'token') {
+                                bubble.textContent += payload.text;
+                                chatEl.scrollTop = chatEl.scrollHeight;
+                            } else if (event === 'error') {
+                                bubble.textContent += (bubble.textContent ? '\\n\\n' : '') + '❌ Lỗi: ' + payload.detail;
+                            } else if (event === 'done') {
+                                setSources(msg, sources);
+                                chatEl.scrollTop = chatEl.scrollHeight;
+                            }
+                        }
                     }
                 } catch (err) {
                     appendMessage('bot', '❌ Lỗi kết nối tới server: ' + err, []);
@@ -453,80 +812,155 @@ def index() -> HTMLResponse:
 
 # ====== /chat ======
 @app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest) -> ChatResponse:
+async def chat(req: ChatRequest) -> ChatResponse:
     if not req.question.strip():
         raise HTTPException(status_code=400, detail="Câu hỏi không được để trống.")
 
-    try:
-        context, used_sources = build_context(req.question)
-
-        system_prompt = (
-            "Bạn là chatbot hỗ trợ học vụ của Trường Đại học Bình Dương. "
-            "Trong mọi câu trả lời, bạn phải xưng là 'tôi'.\n\n"
-
-            "Bạn phải PHÂN BIỆT 2 LOẠI CÂU HỎI:\n"
-            "1) CÂU HỎI VỀ QUY CHẾ / ĐIỀU KIỆN HỌC VỤ (ví dụ: xét tốt nghiệp, xử lý vi phạm, học lại, bảo lưu...).\n"
-            "   - Với LOẠI NÀY, bạn được phép trích dẫn Điều, Khoản trong Quy chế và NÊN nêu rõ nếu có.\n"
-            "   - Phải liệt kê ĐẦY ĐỦ các điều kiện, trường hợp và ngoại lệ có trong ngữ cảnh, "
-            "     không được bỏ sót điều kiện quan trọng.\n"
-            "   - Nếu thực sự không tìm thấy điều khoản liên quan trong ngữ cảnh, hãy nói: "
-            "     'Trong Quy chế đào tạo hiện tại tôi không thấy điều khoản rõ về vấn đề này, nên tôi không chắc.'\n\n"
-
-            "2) CÂU HỎI KIẾN THỨC CHUNG / GIỚI THIỆU / KHÔNG LIÊN QUAN TRỰC TIẾP ĐẾN QUY CHẾ\n"
-            "   (ví dụ: ChatGPT là gì, giới thiệu về trường, hỏi về AI, tin tức,...).\n"
-            "   - Với LOẠI NÀY, TUYỆT ĐỐI KHÔNG được nhắc tới 'Điều', 'Khoản', 'Quy chế', "
-            "     cũng KHÔNG nói các câu như 'tôi không thấy Điều, Khoản nào...'.\n"
-            "   - Chỉ tập trung giải thích nội dung câu hỏi dựa trên ngữ cảnh local và web.\n\n"
-
-            "Quy tắc dùng LOCAL & WEB:\n"
-            "- Ưu tiên thông tin LOCAL khi câu hỏi liên quan đến trường, quy chế, chương trình đào tạo, học phí.\n"
-            "- Nếu dùng WEB, hãy nói rõ 'theo thông tin tham khảo từ web' rồi tổng hợp nội dung đầy đủ, "
-            "  không chỉ chép lại một câu ngắn.\n\n"
-
-            "Cách trình bày câu trả lời:\n"
-            "- Luôn trả lời HOÀN TOÀN bằng TIẾNG VIỆT.\n"
-            "- Trả lời súc tích nhưng ĐẦY ĐỦ ý chính (điều kiện, mốc thời gian, ngoại lệ, ví dụ nếu có).\n"
-            "- Ưu tiên dùng gạch đầu dòng hoặc đánh số để người đọc dễ theo dõi.\n"
-            "- Không lặp lại nguyên văn ngữ cảnh; hãy diễn đạt lại cho dễ hiểu.\n\n"
-
-            "Nếu trong NGỮ CẢNH có dòng bắt đầu bằng [SYSTEM_NOTE] thì bạn "
-            "PHẢI làm đúng theo nội dung dòng đó và KHÔNG được suy đoán hay bịa thêm thông tin."
-        )
-
-        if context:
-            user_content = (
-                f"Người dùng hỏi: {req.question}\n\n"
-                f"Ngữ cảnh (từ tài liệu & web):\n{context}\n\n"
-                "Hãy TRẢ LỜI BẰNG TIẾNG VIỆT, rõ ràng, có thể đánh số/gạch đầu dòng. "
-                "Nếu trong ngữ cảnh có Điều, Khoản liên quan thì hãy nêu rõ."
-            )
-        else:
-            user_content = (
-                f"Người dùng hỏi: {req.question}\n\n"
-                "Hiện tại không có ngữ cảnh từ tài liệu hoặc web. "
-                "Hãy trả lời chung chung nếu có thể, hoặc nói rõ là bạn không chắc."
-            )
+    key = flight_key(req.question, req.source)
+    if key not in chat_flight.calls:
+        # request gộp vào lượt đang chạy không tốn thêm chỗ LLM
+        reject_if_saturated()
 
-        answer = chat_llm(
-            [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content},
-            ]
+    try:
+        answer, used_sources = await chat_flight.do(
+            key, lambda: answer_question(req.question, req.source)
         )
-
         return ChatResponse(answer=answer, used_sources=used_sources)
 
+    except OverloadedError as e:
+        raise overloaded_response(e)
     except LLMError as e:
         raise HTTPException(status_code=502, detail=f"Lỗi khi gọi mô hình LLM: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi nội bộ server: {e}")
 
 
+def sse_event(event: str, data: Dict) -> str:
+    """
+    1 event Server-Sent Events, data dạng JSON (giữ nguyên xuống dòng trong text).
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# ====== /chat/stream (Server-Sent Events) ======
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest) -> StreamingResponse:
+    """
+    Như /chat nhưng trả về từng đoạn câu trả lời ngay khi LLM sinh ra:
+    - event "sources": {"used_sources": [...]} (sau khi có ngữ cảnh)
+    - event "token": {"text": "..."} (nhiều lần)
+    - event "done": {} hoặc "error": {"detail": "..."} (kết thúc)
+    """
+    if not req.question.strip():
+        raise HTTPException(status_code=400, detail="Câu hỏi không được để trống.")
+    reject_if_saturated()
+
+    async def events():
+        try:
+            version, hit = await cached_answer(req.question, req.source)
+            if hit is not None:
+                # câu trả lời có sẵn: gửi 1 lần
+                yield sse_event("sources", {"used_sources": hit[1]})
+                yield sse_event("token", {"text": hit[0]})
+                yield sse_event("done", {})
+                return
+
+            # stream: mỗi request tự sinh câu trả lời (token đi thẳng về client),
+            # chỉ gộp phần dựng ngữ cảnh
+            context, used_sources = await context_flight.do(
+                flight_key(req.question, req.source), lambda: abuild_context(req.question)
+            )
+            yield sse_event("sources", {"used_sources": used_sources})
+            tokens: List[str] = []
+            # aclosing: client ngắt giữa chừng thì đóng stream LLM ngay (trả kết nối
+            # và slot kiểm soát tải), không chờ GC dọn generator
+            async with aclosing(astream_chat_llm(answer_messages(req.question, context))) as stream:
+                async for token in stream:
+                    tokens.append(token)
+                    yield sse_event("token", {"text": token})
+            yield sse_event("done", {})
+            if cacheable(context):
+                await run_retrieval(
+                    answer_cache.put, req.question, req.source, version, "".join(tokens).strip(), used_sources
+                )
+        except OverloadedError as e:
+            yield sse_event(
+                "error",
+                {"detail": f"Hệ thống đang quá tải, vui lòng thử lại sau: {e}", "retry_after": e.retry_after},
+            )
+        except LLMError as e:
+            yield sse_event("error", {"detail": f"Lỗi khi gọi mô hình LLM: {e}"})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Lỗi nội bộ server: {e}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # không cache / không để reverse proxy (nginx) gom buffer các event
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
 
+@app.post("/admin/reload-store")
+def admin_reload_store(name: str = "default"):
+    """
+    Load lại vector store từ đĩa ngay (không chờ kiểm tra mtime).
+    """
+    try:
+        vs = reload_store(name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Không load lại được store '{name}': {e}")
+    return {"name": name, "generation": vs.generation, "chunks": len(vs.texts)}
+
+
+@app.get("/admin/classifier")
+def admin_classifier():
+    """
+    Thống kê phân loại câu hỏi: số lần phân loại tại chỗ / phải hỏi LLM.
+    """
+    return classifier_stats()
+
+
+@app.get("/admin/answer-cache")
+def admin_answer_cache():
+    """
+    Thống kê cache câu trả lời (hit exact / semantic, miss, tỉ lệ hit...).
+    """
+    return answer_cache.stats_dict()
+
+
+@app.get("/admin/llm-queue")
+def admin_llm_queue():
+    """
+    Hàng đợi gọi LLM: số lời gọi đang chạy / đang chờ, thời gian chờ, số lần từ chối.
+    """
+    return llm_admission.stats_dict()
+
+
+@app.get("/admin/single-flight")
+def admin_single_flight():
+    """
+    Số lượt chạy thật và số request được gộp vào lượt đang chạy.
+    """
+    return {
+        "chat": dict(chat_flight.stats, in_flight=len(chat_flight.calls)),
+        "stream_context": dict(context_flight.stats, in_flight=len(context_flight.calls)),
+    }
+
+
+@app.get("/admin/embedding-cache")
+def admin_embedding_cache():
+    """
+    Thống kê cache embedding (hit/miss, kích thước).
+    """
+    return cache_stats()
+
+
 # ====== Chạy trực tiếp: python -m app.main ======
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,184 @@
+# app/rag/ann.py
+# Index xấp xỉ (ANN) kiểu IVF cho vector store dense:
+# - k-means (spherical) chia corpus thành n_lists cụm
+# - search chỉ chấm điểm các chunk thuộc nprobe cụm gần query nhất
+# nprobe càng lớn recall càng cao nhưng càng chậm (nprobe = n_lists <=> exact).
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional, Tuple
+import hashlib
+import os
+import numpy as np
+from scipy import sparse as sp
+
+from app.rag.scoring import normalize_rows, top_k_indices
+
+
+def embeddings_fingerprint(embeddings: np.ndarray) -> str:
+    """
+    Dấu vân tay rẻ của ma trận embedding dense hoặc CSR (shape + tối đa ~64 dòng lấy mẫu),
+    dùng để biết index có còn khớp với store hay không.
+    """
+    n = embeddings.shape[0]
+    step = max(1, n // 64)
+    h = hashlib.sha1()
+    h.update(str(tuple(embeddings.shape)).encode("ascii"))
+    sample = embeddings[::step]
+    if sp.issparse(sample):
+        # store sparse: băm cấu trúc CSR thay vì densify (2**18 cột)
+        sample = sp.csr_matrix(sample)
+        for arr in (sample.indptr, sample.indices, sample.data):
+            h.update(np.ascontiguousarray(arr).tobytes())
+    else:
+        h.update(np.ascontiguousarray(sample, dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+    """
+    Gán mỗi dòng của x vào centroid gần nhất (cosine), theo batch để
+    không tạo ma trận tạm (n, n_lists) quá lớn.
+    """
+    out = np.empty(x.shape[0], dtype=np.int64)
+    for i in range(0, x.shape[0], batch_size):
+        out[i:i + batch_size] = np.argmax(x[i:i + batch_size] @ centroids.T, axis=1)
+    return out
+
+
+def _kmeans(
+    x: np.ndarray, n_lists: int, n_iter: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Spherical k-means trên các dòng đã chuẩn hoá, trả về centroids (n_lists, dim).
+    """
+    centroids = np.array(x[rng.choice(x.shape[0], n_lists, replace=False)], dtype=np.float32)
+    for _ in range(n_iter):
+        assign = _assign(x, centroids)
+        # tổng các dòng theo cụm = ma trận chỉ báo (n_lists, n) @ x
+        member = sp.csr_matrix(
+            (np.ones(x.shape[0], dtype=np.float32), (assign, np.arange(x.shape[0]))),
+            shape=(n_lists, x.shape[0]),
+        )
+        sums = np.asarray(member @ x, dtype=np.float32)
+        counts = np.bincount(assign, minlength=n_lists)
+        empty = counts == 0
+        if empty.any():
+            # cụm rỗng: khởi tạo lại bằng dòng ngẫu nhiên
+            sums[empty] = x[rng.choice(x.shape[0], int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums, copy=False)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index: centroids + danh sách chunk của từng cụm
+    (order sắp theo cụm, cụm c là order[offsets[c]:offsets[c + 1]]).
+    Index không giữ bản sao vector; khi search dùng ma trận embedding của store.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        order: np.ndarray,
+        offsets: np.ndarray,
+        fingerprint: str,
+    ):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.fingerprint = fingerprint
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_iter: int = 10,
+        max_train: int = 256,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """
+        Xây index từ embedding đã chuẩn hoá (n, dim).
+        n_lists mặc định ~ sqrt(n); k-means huấn luyện trên tối đa
+        max_train * n_lists dòng lấy mẫu rồi gán toàn bộ corpus.
+        """
+        n = embeddings.shape[0]
+        if n == 0:
+            raise ValueError("Không thể xây ANN index cho store rỗng.")
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(seed)
+        n_train = min(n, max_train * n_lists)
+        train_idx = np.sort(rng.choice(n, n_train, replace=False))
+        train = np.asarray(embeddings[train_idx], dtype=np.float32)
+        centroids = _kmeans(train, n_lists, n_iter, rng)
+
+        assign = _assign(embeddings, centroids)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=n_lists), out=offsets[1:])
+        return cls(centroids, order, offsets, embeddings_fingerprint(embeddings))
+
+    def matches(self, embeddings: np.ndarray) -> bool:
+        return (
+            self.offsets[-1] == embeddings.shape[0]
+            and self.centroids.shape[1] == embeddings.shape[1]
+            and self.fingerprint == embeddings_fingerprint(embeddings)
+        )
+
+    def search(
+        self, embeddings: np.ndarray, q_norm: np.ndarray, top_k: int, nprobe: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        q_norm: (m, dim) đã chuẩn hoá. Trả về (indices, scores) shape (m, k)
+        giống SimpleVectorStore.search_many_arrays; query nào có ít ứng viên
+        hơn k thì phần thiếu có index -1, score -inf.
+        """
+        m = q_norm.shape[0]
+        k = min(top_k, embeddings.shape[0])
+        idx_out = np.full((m, k), -1, dtype=np.int64)
+        score_out = np.full((m, k), -np.inf, dtype=np.float32)
+        if k <= 0:
+            return idx_out, score_out
+
+        probes = top_k_indices(q_norm @ self.centroids.T, max(1, nprobe))  # (m, nprobe)
+        for r in range(m):
+            cand = np.concatenate(
+                [self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes[r]]
+            )
+            if cand.size == 0:
+                continue
+            cand.sort()  # đọc embedding theo thứ tự tăng -> truy cập tuần tự hơn (mmap)
+            sims = embeddings[cand] @ q_norm[r]
+            best = top_k_indices(sims, k)
+            idx_out[r, :best.size] = cand[best]
+            score_out[r, :best.size] = sims[best]
+        return idx_out, score_out
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                order=self.order,
+                offsets=self.offsets,
+                fingerprint=np.array(self.fingerprint),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(
+                data["centroids"],
+                data["order"],
+                data["offsets"],
+                str(data["fingerprint"]),
+            )
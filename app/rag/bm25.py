@@ -0,0 +1,161 @@
+# app/rag/bm25.py
+# Inverted index BM25 cho các chunk của vector store:
+# term -> postings (doc id + trọng số tf đã chuẩn hoá theo độ dài), lưu dạng
+# mảng NumPy liền khối. Query chỉ đọc postings của các term có trong câu hỏi.
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import os
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+from app.rag.scoring import top_k_indices
+
+# unigram + bigram: tiếng Việt nhiều từ ghép 2 âm tiết ("học phí", "tốt nghiệp")
+NGRAM_RANGE = (1, 2)
+
+
+def _analyzer() -> Callable[[str], List[str]]:
+    return CountVectorizer(ngram_range=NGRAM_RANGE).build_analyzer()
+
+
+class BM25Index:
+    """
+    Postings theo term: doc của term t là doc_ids[offsets[t]:offsets[t + 1]],
+    weights tương ứng = tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)).
+    Điểm BM25 của doc = tổng idf[t] * weight qua các term của query.
+    """
+
+    def __init__(
+        self,
+        terms: Sequence[str],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        weights: np.ndarray,
+        idf: np.ndarray,
+        n_docs: int,
+        fingerprint: str,
+    ):
+        self.terms = list(terms)
+        self.vocab: Dict[str, int] = {t: i for i, t in enumerate(self.terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.idf = idf
+        self.n_docs = n_docs
+        self.fingerprint = fingerprint
+        self._analyze = _analyzer()
+
+    @classmethod
+    def build(
+        cls,
+        texts: Sequence[str],
+        fingerprint: str = "",
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> "BM25Index":
+        vectorizer = CountVectorizer(ngram_range=NGRAM_RANGE, dtype=np.float32)
+        try:
+            counts = vectorizer.fit_transform(texts)  # (n_docs, n_terms)
+        except ValueError:
+            # corpus rỗng / không có term nào
+            return cls([], np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32),
+                       np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32),
+                       len(texts), fingerprint)
+
+        n_docs = counts.shape[0]
+        doc_len = np.asarray(counts.sum(axis=1)).ravel()
+        avgdl = float(doc_len.mean()) or 1.0
+
+        postings = counts.tocsc()  # cột = term -> indptr chính là offsets
+        postings.sort_indices()
+        tf = postings.data
+        dl = doc_len[postings.indices]
+        weights = tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+
+        df = np.diff(postings.indptr)
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+        return cls(
+            vectorizer.get_feature_names_out(),
+            postings.indptr.astype(np.int64),
+            postings.indices.astype(np.int32),
+            weights.astype(np.float32),
+            idf.astype(np.float32),
+            n_docs,
+            fingerprint,
+        )
+
+    def search(
+        self, query: str, top_k: int, rows: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top_k doc theo BM25, trả về (doc ids, scores) đã sắp giảm dần.
+        rows (tăng dần): chỉ xét các doc này (lọc metadata).
+        """
+        term_ids = {self.vocab[t] for t in self._analyze(query) if t in self.vocab}
+        if not term_ids or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        docs = np.concatenate([self.doc_ids[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        contrib = np.concatenate(
+            [self.idf[t] * self.weights[self.offsets[t]:self.offsets[t + 1]] for t in term_ids]
+        )
+        if rows is not None:
+            pos = np.searchsorted(rows, docs)
+            keep = (pos < rows.size) & (rows[np.minimum(pos, rows.size - 1)] == docs)
+            docs, contrib = docs[keep], contrib[keep]
+            if docs.size == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        uniq, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib).astype(np.float32)
+        best = top_k_indices(scores, top_k)
+        return uniq[best].astype(np.int64), scores[best]
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                terms=np.array(self.terms, dtype=str),
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                weights=self.weights,
+                idf=self.idf,
+                n_docs=np.array(self.n_docs, dtype=np.int64),
+                fingerprint=np.array(self.fingerprint),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with np.load(path) as data:
+            return cls(
+                data["terms"].tolist(),
+                data["offsets"],
+                data["doc_ids"],
+                data["weights"],
+                data["idf"],
+                int(data["n_docs"]),
+                str(data["fingerprint"]),
+            )
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gộp nhiều danh sách doc id đã xếp hạng: score = sum 1 / (k + rank).
+    Trả về (doc ids, scores) sắp giảm dần theo score.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking.tolist()):
+            if doc < 0:
+                continue
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (k + rank + 1)
+    if not fused:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    docs = np.fromiter(fused.keys(), dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=np.float32, count=len(fused))
+    order = np.argsort(-scores, kind="stable")
+    return docs[order], scores[order]
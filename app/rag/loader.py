@@ -1,7 +1,9 @@
 # app/rag/loader.py
 
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+import hashlib
+import re
 import fitz       # PyMuPDF
 import docx
 import pandas as pd
@@ -19,6 +21,11 @@ def load_pdf(path: Path) -> str:
     return "\n".join(texts)
 
 
+def pdf_page_count(path: Path) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
 def load_docx(path: Path) -> str:
     document = docx.Document(str(path))
     return "\n".join([para.text for para in document.paragraphs])
@@ -77,3 +84,162 @@ def chunk_text(text: str, chunk_size: int = 800, overlap: int = 200) -> List[str
         chunks.append(chunk)
         start += chunk_size - overlap
     return chunks
+
+
+# ====== BẢN STREAMING (generator) ======
+# Đọc file dần dần theo trang / phần, bộ nhớ chỉ tốn cỡ 1 trang, không phụ
+# thuộc kích thước file; chunk theo cấu trúc ở phần dưới (iter_document_chunks).
+
+SUPPORTED_EXTENSIONS = {".txt", ".pdf", ".docx", ".doc", ".csv", ".xlsx", ".xls"}
+
+
+def iter_pdf_pages(path: Path, start: int = 0, end: int = None) -> Iterator[str]:
+    with fitz.open(path) as doc:
+        stop = doc.page_count if end is None else min(end, doc.page_count)
+        for i in range(start, stop):
+            yield doc[i].get_text()
+
+
+def iter_txt_lines(path: Path) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        yield from f
+
+
+def iter_csv_blocks(path: Path, rows_per_block: int = 10000) -> Iterator[str]:
+    # đọc theo từng khối dòng; tiêu đề cột chỉ ở khối đầu như load_csv
+    for i, df in enumerate(pd.read_csv(path, chunksize=rows_per_block)):
+        yield df.to_csv(index=False, header=(i == 0))
+
+
+def iter_excel_sheets(path: Path) -> Iterator[str]:
+    xls = pd.ExcelFile(path)
+    for sheet_name in xls.sheet_names:
+        df = xls.parse(sheet_name)
+        yield f"=== Sheet: {sheet_name} ===\n" + df.to_csv(index=False)
+
+
+def iter_pages(path: Path) -> Iterator[str]:
+    """
+    Như load_any nhưng yield từng phần (trang PDF, dòng txt, đoạn docx,
+    khối dòng csv, sheet excel) thay vì nối thành 1 chuỗi.
+    """
+    ext = path.suffix.lower()
+    if ext == ".txt":
+        return iter_txt_lines(path)
+    if ext == ".pdf":
+        return iter_pdf_pages(path)
+    if ext in [".docx", ".doc"]:
+        return (para.text for para in docx.Document(str(path)).paragraphs)
+    if ext == ".csv":
+        return iter_csv_blocks(path)
+    if ext in [".xlsx", ".xls"]:
+        return iter_excel_sheets(path)
+    raise ValueError(f"Không hỗ trợ định dạng file: {ext}")
+
+
+# ====== CHUNK THEO CẤU TRÚC (trang / Điều) ======
+# Không chồng lấn: mỗi chunk nằm trọn trong 1 trang, bắt đầu mới tại mỗi
+# "Điều N"; vị trí gốc lưu bằng (page, char_start, char_end) thay vì lặp text.
+
+ARTICLE_RE = re.compile(r"^[ \t]*Điều[ \t]+\d+", re.MULTILINE)
+WORD_RE = re.compile(r"\S+")
+
+
+def _article_title(text: str) -> str:
+    return " ".join(text.split("\n", 1)[0].split())[:120]
+
+
+def _split_long(text: str, start: int, end: int, max_words: int) -> Iterator[Tuple[int, int]]:
+    """
+    Cắt [start, end) thành các khúc <= max_words từ, tại ranh giới từ.
+    """
+    words = [m.span() for m in WORD_RE.finditer(text, start, end)]
+    for i in range(0, len(words), max_words):
+        yield words[i][0], words[min(i + max_words, len(words)) - 1][1]
+
+
+def iter_structured_chunks(
+    pages: Iterable[str], max_words: int = 800, min_words: int = 30
+) -> Iterator[Dict[str, Any]]:
+    """
+    Chia text theo trang và theo "Điều": yield dict
+    {text, page (từ 1), char_start, char_end (vị trí trong text của trang), section}.
+    Đoạn ngắn hơn min_words được gộp với đoạn kế tiếp trong cùng trang; đoạn
+    dài hơn max_words được cắt tiếp (không chồng lấn). section = Điều đang
+    hiệu lực ở đầu chunk (kể cả khi Điều kéo dài sang trang sau).
+    """
+    section = ""
+    for page_no, text in enumerate(pages, start=1):
+        articles = {m.start() for m in ARTICLE_RE.finditer(text)}
+        starts = sorted({0} | articles)
+        ends = starts[1:] + [len(text)]
+
+        pieces: List[Tuple[int, int, str]] = []
+        cur_start, cur_end, cur_words, cur_section = -1, 0, 0, section
+        for start, end in zip(starts, ends):
+            n = len(WORD_RE.findall(text, start, end))
+            if n == 0:
+                continue
+            is_article = start in articles
+            if cur_start >= 0 and (
+                (is_article and cur_words >= min_words) or cur_words + n > max_words
+            ):
+                pieces.append((cur_start, cur_end, cur_section))
+                cur_start = -1
+            if is_article:
+                section = _article_title(text[start:end])
+            if cur_start < 0:
+                cur_start, cur_words, cur_section = start, 0, section
+            cur_words += n
+            cur_end = end
+        if cur_start >= 0:
+            pieces.append((cur_start, cur_end, cur_section))
+
+        for start, end, sec in pieces:
+            for c_start, c_end in _split_long(text, start, end, max_words):
+                yield {
+                    "text": " ".join(text[c_start:c_end].split()),
+                    "page": page_no,
+                    "char_start": c_start,
+                    "char_end": c_end,
+                    "section": sec,
+                }
+
+
+def group_pages(pieces: Iterable[str], max_words: int = 800) -> Iterator[str]:
+    """
+    Định dạng không có trang (txt, docx, csv...): gộp các phần do iter_pages
+    trả về thành "trang" ~max_words từ để dùng với iter_structured_chunks.
+    """
+    buf: List[str] = []
+    n = 0
+    for piece in pieces:
+        buf.append(piece)
+        n += len(piece.split())
+        if n >= max_words:
+            yield "\n".join(buf)
+            buf, n = [], 0
+    if buf:
+        yield "\n".join(buf)
+
+
+def iter_document_chunks(
+    path: Path, pages: Iterable[str] = None, max_words: int = 800
+) -> Iterator[Dict[str, Any]]:
+    """
+    Chunk theo cấu trúc cho 1 file; pages = kết quả iter_pages(path) nếu đã đọc sẵn.
+    """
+    if pages is None:
+        pages = iter_pages(path)
+    if path.suffix.lower() != ".pdf":
+        pages = group_pages(pages, max_words)
+    return iter_structured_chunks(pages, max_words=max_words)
+
+
+def content_hash(text: str) -> str:
+    """
+    Khoá so trùng gần đúng: chữ thường, bỏ dấu câu / khoảng trắng thừa.
+    2 chunk chỉ khác định dạng, dấu câu, hoa thường -> cùng khoá.
+    """
+    key = " ".join(re.findall(r"\w+", text.lower()))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,260 @@
+# app/rag/metadata.py
+# Metadata theo chunk (doc_id, doc_type, title...) lưu dạng cột:
+# - cột chỉ mục (ít giá trị khác nhau: source, doc_type, section...): danh sách
+#   giá trị (vocab) + mảng mã int32, kèm inverted index giá trị -> các dòng để
+#   lọc trước khi chấm điểm
+# - cột giá trị (gần như mỗi chunk 1 giá trị: trang, vị trí ký tự, hash nội
+#   dung): lưu thẳng mảng số / chuỗi độ dài cố định theo dòng, không vocab
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+import os
+import numpy as np
+
+MetadataFilter = Mapping[str, Union[str, Sequence[str]]]
+
+# cột giá trị -> dtype; số nguyên thiếu giá trị lưu MISSING_INT, chuỗi thiếu lưu ""
+VALUE_COLUMNS: Dict[str, str] = {
+    "page": "int64",
+    "char_start": "int64",
+    "char_end": "int64",
+    "content_hash": "U16",
+}
+MISSING_INT = -1
+
+
+def _value_array(raw: Sequence[Any], dtype: str) -> np.ndarray:
+    if dtype.startswith("U"):
+        return np.array(["" if v is None else str(v) for v in raw], dtype=dtype)
+    return np.array([MISSING_INT if v is None or v == "" else int(v) for v in raw], dtype=dtype)
+
+
+def _missing_array(dtype: str, count: int) -> np.ndarray:
+    if dtype.startswith("U"):
+        return np.full(count, "", dtype=dtype)
+    return np.full(count, MISSING_INT, dtype=dtype)
+
+
+def _value_str(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return "" if value == MISSING_INT else str(value)
+
+
+def _joined(parts: Dict[str, List[np.ndarray]], key: str) -> np.ndarray:
+    # extend() chỉ nối thêm khúc mới; ghép thành 1 mảng ở lần đọc đầu tiên
+    if len(parts[key]) > 1:
+        parts[key] = [np.concatenate(parts[key])]
+    return parts[key][0]
+
+
+class ChunkMetadata:
+    def __init__(self, n: int = 0):
+        self.n = n
+        # cột chỉ mục -> vocab / giá trị -> mã / các khúc mảng mã int32
+        self._vocabs: Dict[str, List[str]] = {}
+        self._lookups: Dict[str, Dict[str, int]] = {}
+        self._codes: Dict[str, List[np.ndarray]] = {}
+        # cột giá trị -> các khúc mảng theo dòng
+        self._values: Dict[str, List[np.ndarray]] = {}
+        # cột -> (order, offsets): dòng có mã c là order[offsets[c]:offsets[c + 1]]
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return self.n
+
+    @property
+    def columns(self) -> Dict[str, Tuple[List[str], np.ndarray]]:
+        """
+        Cột chỉ mục: tên -> (vocab, mã của từng dòng).
+        """
+        return {key: (vocab, _joined(self._codes, key)) for key, vocab in self._vocabs.items()}
+
+    @property
+    def values(self) -> Dict[str, np.ndarray]:
+        """
+        Cột giá trị: tên -> mảng (n,) theo dòng.
+        """
+        return {key: _joined(self._values, key) for key in self._values}
+
+    def _set_column(self, key: str, vocab: List[str], codes: np.ndarray) -> None:
+        self._vocabs[key] = vocab
+        self._lookups.pop(key, None)
+        self._codes[key] = [codes]
+
+    def _extend_codes(self, key: str, raw: Sequence[Any]) -> None:
+        if key not in self._vocabs:
+            # cột chưa có: mọi dòng hiện tại mang giá trị rỗng
+            self._set_column(key, [""], np.zeros(self.n, dtype=np.int32))
+        vocab = self._vocabs[key]
+        lookup = self._lookups.get(key)
+        if lookup is None:
+            # dựng 1 lần rồi giữ lại: mỗi batch chỉ tốn theo số dòng mới
+            lookup = self._lookups[key] = {v: i for i, v in enumerate(vocab)}
+        codes = np.empty(len(raw), dtype=np.int32)
+        for i, value in enumerate(raw):
+            value = "" if value is None else str(value)
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(vocab)
+                vocab.append(value)
+            codes[i] = code
+        self._codes[key].append(codes)
+
+    def _extend_values(self, key: str, raw: Sequence[Any]) -> None:
+        dtype = VALUE_COLUMNS[key]
+        if key not in self._values:
+            self._values[key] = [_missing_array(dtype, self.n)]
+        self._values[key].append(_value_array(raw, dtype))
+
+    def extend(self, metadatas: Optional[Sequence[Mapping[str, Any]]], count: int) -> None:
+        """
+        Thêm metadata cho count chunk mới (metadatas=None -> để trống).
+        Chi phí theo số chunk mới, không theo kích thước hiện có.
+        """
+        if metadatas is not None and len(metadatas) != count:
+            raise ValueError("Số metadata phải bằng số chunk.")
+        keys = set(self._vocabs) | set(self._values)
+        for m in metadatas or []:
+            keys.update(m)
+
+        for key in keys:
+            raw = [m.get(key) for m in metadatas] if metadatas else [None] * count
+            if key in VALUE_COLUMNS:
+                self._extend_values(key, raw)
+            else:
+                self._extend_codes(key, raw)
+
+        self.n += count
+        self._postings = {}
+
+    def take(self, rows: np.ndarray) -> "ChunkMetadata":
+        """
+        Metadata của các dòng rows (theo thứ tự đó), vd sau khi xoá chunk.
+        """
+        out = ChunkMetadata(len(rows))
+        for key, (vocab, codes) in self.columns.items():
+            out._set_column(key, list(vocab), codes[rows])
+        for key, values in self.values.items():
+            out._values[key] = [values[rows]]
+        return out
+
+    def get(self, i: int) -> Dict[str, str]:
+        out = {key: vocab[codes[i]] for key, (vocab, codes) in self.columns.items()}
+        out.update((key, _value_str(values[i].item())) for key, values in self.values.items())
+        return out
+
+    def _posting(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        posting = self._postings.get(key)
+        if posting is None:
+            vocab, codes = self.columns[key]
+            order = np.argsort(codes, kind="stable")
+            offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(codes, minlength=len(vocab)), out=offsets[1:])
+            posting = (order, offsets)
+            self._postings[key] = posting
+        return posting
+
+    def _value_rows(self, key: str, wanted: Sequence[str]) -> np.ndarray:
+        # cột giá trị không có inverted index: so sánh cả cột (hiếm khi dùng để lọc)
+        try:
+            targets = _value_array(list(wanted), VALUE_COLUMNS[key])
+        except ValueError:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(np.isin(self.values[key], targets))
+
+    def rows(self, where: Optional[MetadataFilter]) -> Optional[np.ndarray]:
+        """
+        Các dòng (tăng dần) thoả mọi điều kiện trong where, vd
+        {"doc_type": "schedule"} hoặc {"doc_id": ["a", "b"]}.
+        where rỗng/None -> None (không lọc).
+        """
+        if not where:
+            return None
+        result: Optional[np.ndarray] = None
+        for key, wanted in where.items():
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            if key in self._values:
+                rows = self._value_rows(key, wanted)
+            elif key in self._vocabs:
+                vocab = self._vocabs[key]
+                order, offsets = self._posting(key)
+                parts = [
+                    order[offsets[c]:offsets[c + 1]]
+                    for c, v in enumerate(vocab)
+                    if v in wanted
+                ]
+                rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+            else:
+                return np.empty(0, dtype=np.int64)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+        return result.astype(np.int64)
+
+    @classmethod
+    def concat(cls, parts: Sequence["ChunkMetadata"]) -> "ChunkMetadata":
+        """
+        Ghép metadata của nhiều segment: gộp vocab, ánh xạ lại mã (vector hoá).
+        """
+        out = cls(sum(len(p) for p in parts))
+        keys: List[str] = []
+        value_keys: List[str] = []
+        for part in parts:
+            keys.extend(k for k in part._vocabs if k not in keys)
+            value_keys.extend(k for k in part._values if k not in value_keys)
+
+        for key in keys:
+            vocab = [""]
+            lookup = {"": 0}
+            code_parts = []
+            for part in parts:
+                if key not in part._vocabs:
+                    code_parts.append(np.zeros(len(part), dtype=np.int32))
+                    continue
+                part_vocab, part_codes = part.columns[key]
+                remap = np.empty(len(part_vocab), dtype=np.int32)
+                for j, v in enumerate(part_vocab):
+                    if v not in lookup:
+                        lookup[v] = len(vocab)
+                        vocab.append(v)
+                    remap[j] = lookup[v]
+                code_parts.append(remap[part_codes])
+            out._set_column(key, vocab, np.concatenate(code_parts) if code_parts else np.zeros(0, dtype=np.int32))
+
+        for key in value_keys:
+            dtype = VALUE_COLUMNS[key]
+            out._values[key] = [np.concatenate([
+                part.values[key] if key in part._values else _missing_array(dtype, len(part))
+                for part in parts
+            ])]
+        return out
+
+    def save(self, path: Path) -> None:
+        arrays: Dict[str, np.ndarray] = {"n": np.array(self.n, dtype=np.int64)}
+        for key, (vocab, codes) in self.columns.items():
+            arrays[f"vocab__{key}"] = np.array(vocab, dtype=str)
+            arrays[f"codes__{key}"] = codes
+        for key, values in self.values.items():
+            arrays[f"values__{key}"] = values
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ChunkMetadata":
+        with np.load(path) as data:
+            out = cls(int(data["n"]))
+            for name in data.files:
+                if name.startswith("codes__"):
+                    key = name[len("codes__"):]
+                    vocab = [str(v) for v in data[f"vocab__{key}"]]
+                    codes = data[name].astype(np.int32)
+                    if key in VALUE_COLUMNS:
+                        # file cũ lưu cả cột giá trị dạng vocab + mã
+                        out._values[key] = [_value_array(vocab, VALUE_COLUMNS[key])[codes]]
+                    else:
+                        out._set_column(key, vocab, codes)
+                elif name.startswith("values__"):
+                    out._values[name[len("values__"):]] = [data[name]]
+        return out
@@ -1,8 +1,12 @@
 from typing import List, Tuple
-from app.rag.vector_store import SimpleVectorStore
-from app.services.embeddings import embed_text
+from app.rag.vector_store import get_store
 from app.services.web_search import web_search
 from app.services.llm import chat_llm
+from app.services.answer_cache import normalize_question
+from app.services.single_flight import SingleFlight
+
+# câu hỏi trùng nhau (đã chuẩn hoá, cùng source) đang chạy ở thread khác -> chờ dùng chung
+_flight = SingleFlight()
 
 
 def classify_source(question: str) -> str:
@@ -28,9 +32,8 @@ def classify_source(question: str) -> str:
 
 
 def build_context_from_local(question: str, top_k: int = 5) -> str:
-    vs = SimpleVectorStore(name="default")
-    q_emb = embed_text(question)
-    results: List[Tuple[str, float]] = vs.search(q_emb, top_k=top_k)
+    vs = get_store("default")
+    results: List[Tuple[str, float]] = vs.search(question, top_k=top_k)
     if not results:
         return ""
     parts = []
@@ -45,6 +48,12 @@ def build_context_from_web(question: str, num_results: int = 3) -> str:
 
 
 def answer_question(question: str, source: str = "auto") -> tuple[str, List[str]]:
+    return _flight.do(
+        (normalize_question(question), source), lambda: _answer_question(question, source)
+    )
+
+
+def _answer_question(question: str, source: str) -> tuple[str, List[str]]:
     used: List[str] = []
 
     if source == "auto":
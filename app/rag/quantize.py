@@ -0,0 +1,103 @@
+# app/rag/quantize.py
+# Bản lượng tử hoá của ma trận embedding dense, dùng cho lượt quét đầu:
+# - float16: 2 byte / phần tử
+# - int8: 1 byte / phần tử + 1 hệ số scale float32 mỗi dòng (x ~ codes * scale)
+# Lượt quét đầu chấm điểm xấp xỉ trên bản này, sau đó re-rank một tập ứng viên
+# nhỏ bằng embedding float32 gốc (mmap, chỉ đọc các dòng ứng viên).
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+import os
+import numpy as np
+
+from app.rag.ann import embeddings_fingerprint
+
+QUANT_MODES = ("float16", "int8")
+
+
+class QuantizedVectors:
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray], mode: str, fingerprint: str):
+        self.codes = codes
+        self.scales = scales
+        self.mode = mode
+        self.fingerprint = fingerprint
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, mode: str = "int8", block: int = 65536) -> "QuantizedVectors":
+        """
+        Lượng tử hoá embedding (n, dim) theo từng block dòng (không copy cả ma trận float32).
+        """
+        if mode not in QUANT_MODES:
+            raise ValueError(f"Chế độ lượng tử hoá không hợp lệ: {mode} (chọn {', '.join(QUANT_MODES)})")
+        n = embeddings.shape[0]
+        if mode == "float16":
+            codes = np.empty(embeddings.shape, dtype=np.float16)
+            for i in range(0, n, block):
+                codes[i:i + block] = embeddings[i:i + block]
+            return cls(codes, None, mode, embeddings_fingerprint(embeddings))
+
+        codes = np.empty(embeddings.shape, dtype=np.int8)
+        scales = np.empty(n, dtype=np.float32)
+        for i in range(0, n, block):
+            x = np.asarray(embeddings[i:i + block], dtype=np.float32)
+            s = np.abs(x).max(axis=1) / 127.0
+            s[s == 0] = 1.0
+            codes[i:i + block] = np.rint(x / s[:, None])
+            scales[i:i + block] = s
+        return cls(codes, scales, mode, embeddings_fingerprint(embeddings))
+
+    def matches(self, embeddings: np.ndarray) -> bool:
+        return (
+            self.codes.shape == embeddings.shape
+            and self.fingerprint == embeddings_fingerprint(embeddings)
+        )
+
+    def scores(self, q_norm: np.ndarray, rows: Optional[np.ndarray] = None, block: int = 512) -> np.ndarray:
+        """
+        Cosine xấp xỉ (m, n) giữa các query và toàn bộ (hoặc các dòng rows).
+        Giải nén từng block nhỏ vào 1 buffer float32 dùng lại (nằm gọn trong
+        cache CPU) rồi nhân bằng BLAS; hệ số scale int8 nhân 1 lần ở cuối.
+        Lưu ý: NumPy chuyển float16 -> float32 khá chậm, float16 chủ yếu để
+        tiết kiệm RAM; int8 vừa nhỏ hơn vừa quét nhanh hơn float32.
+        """
+        n = len(self) if rows is None else rows.size
+        m = q_norm.shape[0]
+        out = np.empty((m, n), dtype=np.float32)
+        buf = np.empty((min(block, n), self.codes.shape[1]), dtype=np.float32)
+        for i in range(0, n, block):
+            codes = self.codes[i:i + block] if rows is None else self.codes[rows[i:i + block]]
+            k = codes.shape[0]
+            np.copyto(buf[:k], codes, casting="unsafe")
+            if m == 1:
+                np.dot(buf[:k], q_norm[0], out=out[0, i:i + k])
+            else:
+                out[:, i:i + k] = q_norm @ buf[:k].T
+        if self.scales is not None:
+            out *= self.scales if rows is None else self.scales[rows]
+        return out
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        arrays = {"codes": self.codes, "mode": np.array(self.mode), "fingerprint": np.array(self.fingerprint)}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "QuantizedVectors":
+        with np.load(path) as data:
+            return cls(
+                data["codes"],
+                data["scales"] if "scales" in data.files else None,
+                str(data["mode"]),
+                str(data["fingerprint"]),
+            )
@@ -0,0 +1,259 @@
+# app/rag/schedule_index.py
+# Index lịch học có cấu trúc: parse bảng trong PDF lịch học (vd Tuan_15.pdf)
+# thành từng dòng, tra cứu chính xác theo (mã lớp, tuần) bằng dict, không
+# cần vector search.
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import re
+import threading
+import time
+
+import fitz  # PyMuPDF
+
+from app.config import PROCESSED_DIR, STORE_RELOAD_INTERVAL
+from app.rag.storage import atomic_write_json, read_json
+
+SCHEDULE_INDEX_PATH = PROCESSED_DIR / "schedule_index.json"
+
+# tiêu đề cột trong bảng lịch học -> tên field
+SCHEDULE_COLUMNS = {
+    "stt": "stt",
+    "thứ": "thu",
+    "ngày": "ngay",
+    "giờ": "gio",
+    "số tiết": "so_tiet",
+    "phòng": "phong",
+    "sl": "sl",
+    "cbgd": "cbgd",
+    "mã mh": "ma_mh",
+    "tên môn": "ten_mon",
+    "nhóm": "nhom",
+    "lớp": "lop",
+}
+
+WEEKDAYS = ["Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "Chủ nhật"]
+
+# Font TCVN3 (ABC): chữ có dấu nằm ở byte 0xA1-0xFE, text trích từ PDF ra thành
+# ký tự Latin-1 tương ứng ("Thø 2", "NguyÔn") -> bảng đổi sang Unicode
+_TCVN3 = {
+    0xA1: "Ă", 0xA2: "Â", 0xA3: "Ê", 0xA4: "Ô", 0xA5: "Ơ", 0xA6: "Ư", 0xA7: "Đ",
+    0xA8: "ă", 0xA9: "â", 0xAA: "ê", 0xAB: "ô", 0xAC: "ơ", 0xAD: "ư", 0xAE: "đ",
+    0xB5: "à", 0xB6: "ả", 0xB7: "ã", 0xB8: "á", 0xB9: "ạ",
+    0xBB: "ằ", 0xBC: "ẳ", 0xBD: "ẵ", 0xBE: "ắ", 0xC6: "ặ",
+    0xC7: "ầ", 0xC8: "ẩ", 0xC9: "ẫ", 0xCA: "ấ", 0xCB: "ậ",
+    0xCC: "è", 0xCE: "ẻ", 0xCF: "ẽ", 0xD0: "é", 0xD1: "ẹ",
+    0xD2: "ề", 0xD3: "ể", 0xD4: "ễ", 0xD5: "ế", 0xD6: "ệ",
+    0xD7: "ì", 0xD8: "ỉ", 0xDC: "ĩ", 0xDD: "í", 0xDE: "ị",
+    0xDF: "ò", 0xE1: "ỏ", 0xE2: "õ", 0xE3: "ó", 0xE4: "ọ",
+    0xE5: "ồ", 0xE6: "ổ", 0xE7: "ỗ", 0xE8: "ố", 0xE9: "ộ",
+    0xEA: "ờ", 0xEB: "ở", 0xEC: "ỡ", 0xED: "ớ", 0xEE: "ợ",
+    0xEF: "ù", 0xF1: "ủ", 0xF2: "ũ", 0xF3: "ú", 0xF4: "ụ",
+    0xF5: "ừ", 0xF6: "ử", 0xF7: "ữ", 0xF8: "ứ", 0xF9: "ự",
+    0xFA: "ỳ", 0xFB: "ỷ", 0xFC: "ỹ", 0xFD: "ý", 0xFE: "ỵ",
+}
+
+
+# chữ Latin-1 cũng có trong tiếng Việt Unicode ("Tên môn"), trùng mã với TCVN3
+_VI_LATIN1 = set("ÀÁÂÃÈÉÊÌÍÒÓÔÕÙÚÝàáâãèéêìíòóôõùúý")
+
+
+def _is_unicode(text: str) -> bool:
+    # có chữ ngoài Latin-1 (vd "Thứ") -> chắc chắn là Unicode
+    return any(ord(c) > 0xFF for c in text)
+
+
+def _is_tcvn3(text: str) -> bool:
+    for i, c in enumerate(text):
+        if ord(c) not in _TCVN3:
+            continue
+        if c not in _VI_LATIN1:
+            return True
+        # chữ hoa giữa từ ("TiÕng") chỉ gặp ở TCVN3
+        if c.isupper() and i > 0 and text[i - 1].islower():
+            return True
+    return False
+
+
+def decode_tcvn3(text: str) -> str:
+    """
+    Đổi text font TCVN3 sang Unicode; text Unicode / ASCII giữ nguyên.
+    Ô trộn 2 loại font (vd "Nguyễn Đặng Bích Tr©n") thì xét từng từ.
+    """
+    if not _is_unicode(text):
+        return text.translate(_TCVN3) if _is_tcvn3(text) else text
+    return " ".join(
+        w.translate(_TCVN3) if not _is_unicode(w) and _is_tcvn3(w) else w
+        for w in text.split(" ")
+    )
+
+
+def _clean(cell: Optional[str]) -> str:
+    return decode_tcvn3(" ".join((cell or "").split()))
+
+
+def split_class_codes(cell: str) -> List[str]:
+    """
+    Ô "Lớp" có thể chứa nhiều mã: "25KT0101; 25TC0101" hoặc xuống dòng.
+    """
+    return [c for c in re.split(r"[;,\s]+", cell.upper()) if c]
+
+
+def parse_schedule_pdf(path: Path) -> List[Dict[str, Any]]:
+    """
+    Đọc các bảng lịch học trong PDF, trả về list dòng dạng dict
+    (stt, thu, ngay, gio, so_tiet, phong, sl, cbgd, ma_mh, ten_mon, nhom, lop, classes).
+    """
+    doc = fitz.open(path)
+    rows: List[Dict[str, Any]] = []
+    header: Optional[List[Optional[str]]] = None
+
+    for page in doc:
+        for table in page.find_tables().tables:
+            for cells in table.extract():
+                names = [SCHEDULE_COLUMNS.get(_clean(c).lower()) for c in cells]
+                if "stt" in names and "lop" in names:
+                    header = names
+                    continue
+                # bảng ở trang sau không lặp lại tiêu đề -> dùng tiêu đề trước đó
+                if header is None or len(cells) != len(header):
+                    continue
+                row = {name: _clean(c) for name, c in zip(header, cells) if name}
+                if not row.get("stt", "").isdigit() or not row.get("lop"):
+                    continue
+                row["classes"] = split_class_codes(row["lop"])
+                rows.append(row)
+    return rows
+
+
+def format_schedule_row(row: Dict[str, Any], class_code: Optional[str] = None) -> str:
+    """
+    1 dòng lịch học -> câu ngắn để đưa vào ngữ cảnh LLM.
+    """
+    thu = row.get("thu", "")
+    try:
+        # suy lại thứ từ ngày cho chắc (cột "Thứ" có thể trống / sai định dạng)
+        thu = WEEKDAYS[datetime.strptime(row.get("ngay", ""), "%d/%m/%Y").weekday()]
+    except ValueError:
+        pass
+    week = row.get("week")
+    return (
+        f"Lớp {class_code or row.get('lop', '')}"
+        f"{f' - tuần {week}' if week is not None else ''}: "
+        f"{thu} {row.get('ngay', '')}, bắt đầu {row.get('gio', '')}, "
+        f"{row.get('so_tiet', '')} tiết, phòng {row.get('phong', '')}, "
+        f"môn {row.get('ma_mh', '')} {row.get('ten_mon', '')} (nhóm {row.get('nhom', '')}), "
+        f"giảng viên {row.get('cbgd', '')}"
+    )
+
+
+class ScheduleIndex:
+    """
+    Các dòng lịch học + index dict (mã lớp, tuần) -> dòng và mã lớp -> dòng.
+    """
+
+    def __init__(self, rows: Optional[List[Dict[str, Any]]] = None):
+        self.rows: List[Dict[str, Any]] = []
+        self.by_class_week: Dict[Tuple[str, Optional[int]], List[int]] = {}
+        self.by_class: Dict[str, List[int]] = {}
+        self.signature: Optional[Tuple] = None
+        for row in rows or []:
+            self._index_row(row)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _index_row(self, row: Dict[str, Any]) -> None:
+        i = len(self.rows)
+        self.rows.append(row)
+        for code in row.get("classes", []):
+            self.by_class.setdefault(code, []).append(i)
+            self.by_class_week.setdefault((code, row.get("week")), []).append(i)
+
+    def add_document(self, path: Path, meta: Dict[str, Any]) -> int:
+        """
+        Parse 1 file lịch học, gắn doc_id / tuần từ metadata. Trả về số dòng thêm.
+        """
+        week = meta.get("week")
+        rows = parse_schedule_pdf(path)
+        for row in rows:
+            row["doc_id"] = meta.get("doc_id")
+            row["source"] = meta.get("source")
+            row["week"] = int(week) if week is not None else None
+            self._index_row(row)
+        return len(rows)
+
+    def remove_sources(self, sources: Sequence[str]) -> int:
+        """
+        Bỏ các dòng lấy từ những file nguồn này (ingest lại file đã đổi/xoá).
+        Trả về số dòng đã bỏ.
+        """
+        drop = set(sources)
+        rows = [r for r in self.rows if r.get("source") not in drop]
+        removed = len(self.rows) - len(rows)
+        if removed:
+            self.rows, self.by_class_week, self.by_class = [], {}, {}
+            for row in rows:
+                self._index_row(row)
+        return removed
+
+    def lookup(self, class_code: str, week: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Tra cứu chính xác theo mã lớp (và tuần nếu có).
+        """
+        code = class_code.upper()
+        if week is None:
+            ids = self.by_class.get(code, [])
+        else:
+            ids = self.by_class_week.get((code, int(week)), [])
+        return [self.rows[i] for i in ids]
+
+    def save(self, path: Path = SCHEDULE_INDEX_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(path, {"version": 1, "rows": self.rows})
+
+    @classmethod
+    def load(cls, path: Path = SCHEDULE_INDEX_PATH) -> "ScheduleIndex":
+        if not path.exists():
+            return cls()
+        return cls(read_json(path).get("rows", []))
+
+
+def _file_signature(path: Path) -> Tuple:
+    try:
+        st = path.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return (None, None)
+
+
+_index_lock = threading.Lock()
+_index: Optional[ScheduleIndex] = None
+_last_check = 0.0
+
+
+def get_schedule_index() -> ScheduleIndex:
+    """
+    Index lịch học dùng chung cho cả process, tự load lại khi file JSON đổi
+    (kiểm tra tối đa mỗi STORE_RELOAD_INTERVAL giây).
+    """
+    global _index, _last_check
+    now = time.monotonic()
+    index = _index
+    if index is not None and now - _last_check < STORE_RELOAD_INTERVAL:
+        return index
+
+    with _index_lock:
+        _last_check = now
+        sig = _file_signature(SCHEDULE_INDEX_PATH)
+        if _index is None or _index.signature != sig:
+            try:
+                index = ScheduleIndex.load(SCHEDULE_INDEX_PATH)
+            except (OSError, ValueError):
+                if _index is not None:
+                    return _index
+                raise
+            index.signature = sig
+            _index = index
+        return _index
@@ -0,0 +1,44 @@
+# app/rag/scoring.py
+# Các phép tính dùng chung khi chấm điểm cosine: chuẩn hoá dòng, chọn top-k.
+from __future__ import annotations
+import numpy as np
+from scipy import sparse as sp
+from sklearn.preprocessing import normalize
+
+
+def normalize_rows(x: np.ndarray, copy: bool = True) -> np.ndarray:
+    """
+    Chuẩn hoá L2 từng dòng, trả về ma trận float32 C-contiguous.
+    """
+    x = np.array(x, dtype=np.float32, order="C", copy=copy or None)
+    if x.ndim == 1:
+        x = x.reshape(1, -1)
+    norms = np.sqrt(np.einsum("ij,ij->i", x, x)) + 1e-8
+    x /= norms[:, None]
+    return x
+
+
+def normalize_sparse_rows(x) -> sp.csr_matrix:
+    """
+    Chuẩn hoá L2 từng dòng cho ma trận CSR float32.
+    """
+    x = sp.csr_matrix(x, dtype=np.float32)
+    return normalize(x, norm="l2", axis=1, copy=False)
+
+
+def top_k_indices(sims: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Chỉ số top_k phần tử lớn nhất theo trục cuối của sims (1 hoặc 2 chiều),
+    đã sắp giảm dần. Dùng argpartition O(n) rồi chỉ sort k phần tử thắng.
+    """
+    n = sims.shape[-1]
+    k = min(top_k, n)
+    if k <= 0:
+        return np.empty(sims.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-sims, k - 1, axis=-1)[..., :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), sims.shape).copy()
+    part = np.take_along_axis(sims, idx, axis=-1)
+    order = np.argsort(-part, axis=-1, kind="stable")
+    return np.take_along_axis(idx, order, axis=-1)
@@ -0,0 +1,216 @@
+# app/rag/storage.py
+# Định dạng lưu trữ trên đĩa dùng chung cho vector store:
+# - ghi file an toàn (file tạm + os.replace)
+# - text dạng offsets + blob UTF-8, mở bằng memory-map, chỉ decode khi cần
+# - manifest JSON cho layout nhiều segment chỉ-ghi-thêm
+# - ghép vector / text của các segment mà không copy (ConcatRows, ConcatTexts)
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+import json
+import os
+import numpy as np
+from scipy import sparse as sp
+
+
+def atomic_save_npy(path: Path, arr: np.ndarray) -> None:
+    """
+    np.save ra file tạm rồi os.replace, reader không bao giờ thấy file ghi dở.
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def atomic_save_npy_parts(path: Path, parts: Iterable[np.ndarray], shape: Tuple[int, int]) -> None:
+    """
+    Ghi nhiều mảng (cùng số cột) nối theo dòng thành 1 file .npy có shape cho
+    trước, copy từng phần qua memory-map nên không cần ghép toàn bộ trong RAM.
+    parts có thể là generator: mỗi phần chỉ cần được đọc lúc copy.
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=shape)
+    start = 0
+    for part in parts:
+        out[start:start + part.shape[0]] = part
+        start += part.shape[0]
+    out.flush()
+    del out
+    if start != shape[0]:
+        os.remove(tmp)
+        raise ValueError(f"{path.name}: ghi {start} dòng, cần {shape[0]} dòng.")
+    os.replace(tmp, path)
+
+
+def atomic_save_npz(path: Path, mat: sp.spmatrix) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        sp.save_npz(f, mat)
+    os.replace(tmp, path)
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def atomic_write_json(path: Path, data: Dict[str, Any]) -> None:
+    atomic_write_bytes(path, json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def read_json(path: Path) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class MmapTexts(Sequence):
+    """
+    Danh sách text chỉ-đọc nằm trên đĩa:
+    - offsets: int64 (n + 1,), text i là blob[offsets[i]:offsets[i + 1]]
+    - blob: toàn bộ text nối liền, mã hoá UTF-8
+    Cả 2 đều memory-map nên nhiều worker dùng chung page cache của OS.
+    """
+
+    def __init__(self, offsets_path: Path, blob_path: Path):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        blob_size = blob_path.stat().st_size
+        if blob_size > 0:
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            # np.memmap không mở được file rỗng
+            self.blob = np.empty(0, dtype=np.uint8)
+
+        if len(self.offsets) == 0 or int(self.offsets[-1]) != blob_size:
+            raise ValueError(f"File text {blob_path.name} không khớp với {offsets_path.name}.")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def write_texts_blob(texts: Iterable[str], offsets_path: Path, blob_path: Path) -> None:
+    """
+    Ghi dãy text ra cặp file offsets (.npy) + blob UTF-8, ghi dần từng text
+    (không giữ toàn bộ blob trong RAM).
+    Blob được ghi trước để offsets mới không bao giờ trỏ vào blob cũ.
+    """
+    sizes = [0]
+    tmp = blob_path.with_name(blob_path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        for t in texts:
+            sizes.append(f.write(t.encode("utf-8")))
+    os.replace(tmp, blob_path)
+    atomic_save_npy(offsets_path, np.cumsum(sizes, dtype=np.int64))
+
+
+def read_texts_blob(offsets_path: Path, blob_path: Path) -> List[str]:
+    """
+    Đọc cặp file offsets + blob vào RAM thành list text (không memory-map,
+    không giữ file descriptor nào sau khi đọc xong).
+    """
+    offsets = np.load(offsets_path).tolist()
+    blob = blob_path.read_bytes()
+    if not offsets or offsets[-1] != len(blob):
+        raise ValueError(f"File text {blob_path.name} không khớp với {offsets_path.name}.")
+    return [blob[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+
+class ConcatRows:
+    """
+    Ghép nhiều ma trận dense cùng số cột (vd vector mmap của từng segment)
+    thành 1 ma trận chỉ-đọc theo dòng, không copy: lấy dòng nào chỉ đọc phần
+    chứa dòng đó, `@` chạy trên từng phần rồi nối kết quả.
+    Hỗ trợ các phép mà vector store / ANN / lượng tử hoá dùng: shape, dtype,
+    lấy dòng (số nguyên, slice, mảng chỉ số) và `rows @ x`.
+    """
+
+    ndim = 2
+
+    def __init__(self, parts: List[np.ndarray]):
+        self.parts = parts
+        self.starts = np.cumsum([0] + [p.shape[0] for p in parts])
+        self.shape = (int(self.starts[-1]), parts[0].shape[1])
+        self.dtype = parts[0].dtype
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(p.nbytes for p in self.parts)
+
+    def __getitem__(self, key) -> np.ndarray:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return np.concatenate([
+                    part[max(start - lo, 0):max(stop - lo, 0)]
+                    for part, lo in zip(self.parts, self.starts.tolist())
+                ])
+            key = np.arange(start, stop, step)
+        elif np.ndim(key) == 0:
+            return self[np.array([key])][0]
+        rows = np.asarray(key)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        rows = np.where(rows < 0, rows + len(self), rows)
+        seg = np.searchsorted(self.starts, rows, side="right") - 1
+        out = np.empty((rows.size, self.shape[1]), dtype=self.dtype)
+        for s in np.unique(seg).tolist():
+            mask = seg == s
+            out[mask] = self.parts[s][rows[mask] - self.starts[s]]
+        return out
+
+    def __matmul__(self, other) -> np.ndarray:
+        return np.concatenate([part @ other for part in self.parts])
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        # np.asarray(...): ghép cả ma trận vào RAM (script / benchmark)
+        out = np.concatenate(self.parts)
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+
+class ConcatTexts(Sequence):
+    """
+    Ghép nhiều dãy text (vd MmapTexts của từng segment) thành 1 dãy chỉ-đọc,
+    không copy nội dung.
+    """
+
+    def __init__(self, parts: List[Sequence]):
+        self.parts = parts
+        self.starts = np.cumsum([0] + [len(p) for p in parts])
+
+    def __len__(self) -> int:
+        return int(self.starts[-1])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        seg = int(np.searchsorted(self.starts, i, side="right")) - 1
+        return self.parts[seg][i - int(self.starts[seg])]
+
+    def __iter__(self) -> Iterator[str]:
+        for part in self.parts:
+            yield from part
@@ -1,73 +1,884 @@
 # app/rag/vector_store.py
 from __future__ import annotations
-from typing import List, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 from pathlib import Path
+import os
+import threading
+import time
 import numpy as np
 import pickle
+from scipy import sparse as sp
 
-from app.config import VECTOR_STORE_DIR
-from app.services.embeddings import embed_texts
+from app.config import (
+    VECTOR_STORE_DIR,
+    STORE_RELOAD_INTERVAL,
+    SPARSE_N_FEATURES,
+    ANN_NPROBE,
+    HYBRID_SEARCH,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    QUANT_RERANK_FACTOR,
+)
+from app.rag.ann import IVFIndex, embeddings_fingerprint
+from app.rag.bm25 import BM25Index, reciprocal_rank_fusion
+from app.rag.metadata import ChunkMetadata, MetadataFilter
+from app.rag.quantize import QuantizedVectors
+from app.rag.storage import (
+    ConcatRows,
+    ConcatTexts,
+    MmapTexts,
+    atomic_save_npy,
+    atomic_save_npy_parts,
+    atomic_save_npz,
+    atomic_write_json,
+    read_json,
+    read_texts_blob,
+    write_texts_blob,
+)
+from app.rag.scoring import normalize_rows, normalize_sparse_rows, top_k_indices
+from app.services.embeddings import embed_texts, embed_texts_sparse, embedding_id
 
 
 class SimpleVectorStore:
     """
     Lưu text + embedding ra đĩa, cho phép search theo cosine similarity.
+    Embedding được giữ (và lưu) ở dạng đã chuẩn hoá L2, float32 liền khối,
+    nên mỗi lần search chỉ còn 1 phép nhân ma trận-vector.
+
+    sparse=True: giữ embedding dạng CSR (lưu {name}_embeddings.npz), chấm điểm
+    bằng tích sparse; số chiều lấy từ ma trận đã lưu (mặc định SPARSE_N_FEATURES).
+    sparse=None: tự nhận theo file trên đĩa (có .npz -> sparse).
+    Mỗi tên store chỉ nên dùng một chế độ vì 2 chế độ dùng chung file text.
+
+    mmap=True: vector ({name}_vectors.npy, đã chuẩn hoá) mở bằng
+    np.load(mmap_mode="r"), text lưu dạng offsets + blob UTF-8 cũng memory-map;
+    các worker dùng chung page cache, khởi động gần như tức thì và chỉ decode
+    text được trả về. mmap=None: tự nhận nếu có file {name}_vectors.npy.
+    Chuyển store npy/pkl cũ sang định dạng này bằng convert_to_mmap().
+
+    segmented=True: layout chỉ-ghi-thêm. Mỗi lần add() ghi 1 segment mới
+    ({name}_seg00001_*, định dạng mmap; vector .npz nếu sparse) rồi ghi lại
+    {name}_manifest.json (atomic) liệt kê các segment -> chi phí ingest tuyến
+    tính theo dữ liệu thêm vào, reader luôn thấy 1 snapshot nhất quán.
+    compact() gộp các segment thành 1. segmented=None: tự nhận nếu có manifest.
+    Batch vừa add() chỉ nằm trên đĩa: RAM chỉ giữ metadata (mã cột) và số dòng,
+    vector + text được load lại ở lần đọc đầu tiên sau đó (thường là sau
+    compact() cuối ingest), nên RAM và số file descriptor không tăng theo số
+    batch. Khi load, mọi segment đều được memory-map; vector của các segment
+    được ghép bằng ConcatRows (không copy), search chấm điểm trên từng segment.
+
+    ANN: nếu có file {name}_ivf.npz (tạo bằng build_ann()) và còn khớp với
+    embedding hiện tại thì search dùng IVF thay vì quét toàn bộ; nprobe điều
+    chỉnh recall/độ trễ (mặc định ANN_NPROBE), exact=True để quét đầy đủ.
+    Chỉ áp dụng cho store dense.
+
+    Metadata: add() nhận kèm metadatas (doc_id, doc_type, title...) lưu dạng
+    cột ({name}_meta.npz hoặc theo segment); search(..., where={"doc_type": "schedule"})
+    chỉ chấm điểm các chunk thoả điều kiện (tra inverted index, không quét hết).
+
+    Hybrid: nếu có {name}_bm25.npz (build_bm25(), chạy lúc ingest) thì search
+    gộp xếp hạng BM25 và cosine bằng reciprocal rank fusion (HYBRID_SEARCH,
+    hoặc hybrid=True/False từng lần gọi). Thứ tự theo RRF, score trả về vẫn là
+    cosine similarity để các ngưỡng score hiện có giữ nguyên ý nghĩa.
+
+    Lượng tử hoá: nếu có {name}_quant.npz (build_quantized("int8" | "float16"))
+    thì lượt quét đầu (khi không dùng ANN) chấm điểm trên bản int8/float16,
+    rồi re-rank top_k * QUANT_RERANK_FACTOR ứng viên bằng float32 gốc.
+    exact=True bỏ qua cả ANN lẫn bản lượng tử hoá.
+
+    Định danh backend embedding đã tạo store lưu trong manifest (layout segment)
+    hoặc {name}_header.json (npy/pkl, mmap); search báo lỗi nếu khác backend hiện tại.
     """
 
-    def __init__(self, name: str = "default"):
+    def __init__(
+        self,
+        name: str = "default",
+        sparse: Optional[bool] = None,
+        mmap: Optional[bool] = None,
+        segmented: Optional[bool] = None,
+    ):
         self.name = name
         VECTOR_STORE_DIR.mkdir(parents=True, exist_ok=True)
 
         self.emb_path = VECTOR_STORE_DIR / f"{name}_embeddings.npy"
+        self.sparse_path = VECTOR_STORE_DIR / f"{name}_embeddings.npz"
         self.texts_path = VECTOR_STORE_DIR / f"{name}_texts.pkl"
+        self.vectors_path = VECTOR_STORE_DIR / f"{name}_vectors.npy"
+        self.offsets_path = VECTOR_STORE_DIR / f"{name}_text_offsets.npy"
+        self.blob_path = VECTOR_STORE_DIR / f"{name}_texts.bin"
+        self.manifest_path = VECTOR_STORE_DIR / f"{name}_manifest.json"
+        self.ann_path = VECTOR_STORE_DIR / f"{name}_ivf.npz"
+        self.bm25_path = VECTOR_STORE_DIR / f"{name}_bm25.npz"
+        self.quant_path = VECTOR_STORE_DIR / f"{name}_quant.npz"
+        self.meta_path = VECTOR_STORE_DIR / f"{name}_meta.npz"
+        self.header_path = VECTOR_STORE_DIR / f"{name}_header.json"
 
-        if self.emb_path.exists() and self.texts_path.exists():
-            self.embeddings = np.load(self.emb_path)
+        if segmented is None:
+            segmented = self.manifest_path.exists()
+        self.segmented = segmented
+        self.manifest: Optional[Dict] = None
+        # layout segment: đã ghi segment mới mà chưa load lại vector/text (xem add())
+        self._stale = False
+        # định danh backend embedding đã tạo store (manifest / {name}_header.json),
+        # None = không rõ (store cũ chưa ghi)
+        self.embedding: Optional[str] = None
+
+        if sparse is None:
+            sparse = self.sparse_path.exists()
+        if mmap is None:
+            mmap = (
+                not sparse
+                and not (self.segmented and self.manifest_path.exists())
+                and self.vectors_path.exists()
+            )
+        if sparse and mmap:
+            raise ValueError("Store sparse không hỗ trợ định dạng mmap.")
+        self.sparse = sparse
+        self.mmap = mmap
+
+        # chữ ký file trên đĩa, lấy TRƯỚC khi đọc để registry phát hiện
+        # được cả trường hợp file bị ghi lại trong lúc đang load
+        self.signature = self.disk_signature()
+        self.generation = 0
+
+        vec_path = self.sparse_path if self.sparse else self.emb_path
+        if self.segmented and self.manifest_path.exists():
+            self._load_segments()
+        elif self.mmap and self.vectors_path.exists():
+            # file mmap luôn được ghi ở dạng đã chuẩn hoá -> không copy, không chuẩn hoá lại
+            self.embeddings = np.load(self.vectors_path, mmap_mode="r")
+            self.texts = MmapTexts(self.offsets_path, self.blob_path)
+            if len(self.texts) != self.embeddings.shape[0]:
+                raise ValueError(
+                    f"Vector store '{name}' không nhất quán: "
+                    f"{self.embeddings.shape[0]} embedding nhưng {len(self.texts)} text."
+                )
+            self.meta = self._load_meta(self.meta_path, len(self.texts))
+            self._read_header()
+        elif vec_path.exists() and self.texts_path.exists():
+            # file cũ có thể chưa chuẩn hoá -> chuẩn hoá lại 1 lần lúc load
+            # (idempotent với file đã chuẩn hoá)
+            if self.sparse:
+                self.embeddings = normalize_sparse_rows(sp.load_npz(vec_path))
+            else:
+                self.embeddings = normalize_rows(np.load(vec_path), copy=False)
             with open(self.texts_path, "rb") as f:
                 self.texts: List[str] = pickle.load(f)
+            if len(self.texts) != self.embeddings.shape[0]:
+                raise ValueError(
+                    f"Vector store '{name}' không nhất quán: "
+                    f"{self.embeddings.shape[0]} embedding nhưng {len(self.texts)} text."
+                )
+            self.meta = self._load_meta(self.meta_path, len(self.texts))
+            self._read_header()
         else:
-            self.embeddings = np.empty((0, 512), dtype="float32")
+            self.embeddings = self._empty_matrix()
             self.texts: List[str] = []
+            self.meta = ChunkMetadata()
+
+        self.ann: Optional[IVFIndex] = self._load_ann()
+        self.bm25: Optional[BM25Index] = self._load_bm25()
+        self.quant: Optional[QuantizedVectors] = self._load_quant()
+
+    def _read_header(self) -> None:
+        if self.header_path.exists():
+            self.embedding = read_json(self.header_path).get("embedding")
+
+    def _write_header(self) -> None:
+        # layout npy/pkl và mmap: định danh embedding (layout segment ghi trong manifest)
+        atomic_write_json(self.header_path, {
+            "version": 1,
+            "sparse": self.sparse,
+            "dim": self.dim,
+            "embedding": self.embedding,
+        })
+
+    def _load_meta(self, path: Path, count: int) -> ChunkMetadata:
+        # store cũ chưa có metadata -> mọi cột để trống
+        if not path.exists():
+            return ChunkMetadata(count)
+        meta = ChunkMetadata.load(path)
+        if len(meta) != count:
+            raise ValueError(f"Metadata {path.name} không khớp số chunk của store '{self.name}'.")
+        return meta
+
+    def _load_ann(self) -> Optional[IVFIndex]:
+        if self.sparse or not self.ann_path.exists() or len(self.texts) == 0:
+            return None
+        ann = IVFIndex.load(self.ann_path)
+        # index cũ (store đã ingest lại) -> bỏ qua, quay về quét đầy đủ
+        return ann if ann.matches(self.embeddings) else None
+
+    def build_ann(self, n_lists: Optional[int] = None, n_iter: int = 10) -> IVFIndex:
+        """
+        Xây IVF index từ embedding hiện tại và lưu cạnh store ({name}_ivf.npz).
+        """
+        if self.sparse:
+            raise ValueError("ANN index chỉ hỗ trợ store dense.")
+        self.ann = IVFIndex.build(self.embeddings, n_lists=n_lists, n_iter=n_iter)
+        self.ann.save(self.ann_path)
+        return self.ann
+
+    def _load_bm25(self) -> Optional[BM25Index]:
+        if not self.bm25_path.exists() or len(self.texts) == 0:
+            return None
+        bm25 = BM25Index.load(self.bm25_path)
+        if bm25.n_docs != len(self.texts) or bm25.fingerprint != embeddings_fingerprint(self.embeddings):
+            return None
+        return bm25
+
+    def build_bm25(self) -> BM25Index:
+        """
+        Xây inverted index BM25 từ text hiện tại và lưu cạnh store ({name}_bm25.npz).
+        """
+        self.bm25 = BM25Index.build(self.texts, fingerprint=embeddings_fingerprint(self.embeddings))
+        self.bm25.save(self.bm25_path)
+        return self.bm25
+
+    def _load_quant(self) -> Optional[QuantizedVectors]:
+        if self.sparse or not self.quant_path.exists() or len(self.texts) == 0:
+            return None
+        quant = QuantizedVectors.load(self.quant_path)
+        return quant if quant.matches(self.embeddings) else None
+
+    def build_quantized(self, mode: str = "int8") -> QuantizedVectors:
+        """
+        Lượng tử hoá embedding hiện tại (int8 theo dòng hoặc float16), lưu {name}_quant.npz.
+        """
+        if self.sparse:
+            raise ValueError("Lượng tử hoá chỉ hỗ trợ store dense.")
+        self.quant = QuantizedVectors.build(self.embeddings, mode)
+        self.quant.save(self.quant_path)
+        return self.quant
+
+    def _empty_matrix(self, dim: Optional[int] = None):
+        if self.sparse:
+            return sp.csr_matrix((0, dim or SPARSE_N_FEATURES), dtype=np.float32)
+        # store dense rỗng: chưa biết số chiều (0), lấy theo batch add() đầu tiên;
+        # không hỏi embedding_dim() vì backend sentence-transformers sẽ load model
+        return np.empty((0, dim or 0), dtype="float32")
+
+    @property
+    def embeddings(self):
+        if self._stale:
+            self._load_segments()
+        # layout segment giữ vector theo từng phần: dense ghép bằng view ConcatRows
+        # (vẫn là mmap của từng segment, dùng chung page cache giữa các worker);
+        # sparse vốn đã nằm trong RAM, ghép 1 lần thành CSR
+        if len(self._vec_parts) > 1:
+            if not self.sparse:
+                return ConcatRows(self._vec_parts)
+            self._vec_parts = [sp.vstack(self._vec_parts, format="csr")]
+        return self._vec_parts[0]
+
+    @embeddings.setter
+    def embeddings(self, value) -> None:
+        self._vec_parts = [value]
+
+    @property
+    def texts(self) -> Sequence[str]:
+        if self._stale:
+            self._load_segments()
+        return self._texts
+
+    @texts.setter
+    def texts(self, value: Sequence[str]) -> None:
+        self._texts = value
+
+    @property
+    def dim(self) -> int:
+        return self._vec_parts[0].shape[1]
+
+    def files(self) -> List[Path]:
+        """
+        Các file trên đĩa mà store này phụ thuộc vào.
+        """
+        if self.segmented:
+            # segment không bao giờ bị sửa, mọi thay đổi đều đi qua manifest
+            return [self.manifest_path, self.ann_path, self.bm25_path, self.quant_path]
+        if self.mmap:
+            return [
+                self.vectors_path, self.offsets_path, self.blob_path, self.meta_path,
+                self.header_path, self.ann_path, self.bm25_path, self.quant_path,
+            ]
+        vec_path = self.sparse_path if self.sparse else self.emb_path
+        return [
+            vec_path, self.texts_path, self.meta_path, self.header_path,
+            self.ann_path, self.bm25_path, self.quant_path,
+        ]
+
+    def disk_signature(self) -> Tuple:
+        """
+        (tên file, mtime, size) của từng file, dùng để phát hiện dữ liệu đã đổi.
+        """
+        sig = []
+        for p in self.files():
+            try:
+                st = p.stat()
+                sig.append((p.name, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                sig.append((p.name, None, None))
+        return tuple(sig)
+
+    # ====== LAYOUT SEGMENT ======
+    def _segment_paths(self, seg_id: int) -> Dict[str, Path]:
+        prefix = f"{self.name}_seg{seg_id:05d}"
+        ext = "npz" if self.sparse else "npy"
+        return {
+            "vectors": VECTOR_STORE_DIR / f"{prefix}_vectors.{ext}",
+            "offsets": VECTOR_STORE_DIR / f"{prefix}_text_offsets.npy",
+            "blob": VECTOR_STORE_DIR / f"{prefix}_texts.bin",
+            "meta": VECTOR_STORE_DIR / f"{prefix}_meta.npz",
+        }
+
+    def _load_segments(self) -> None:
+        self.manifest = read_json(self.manifest_path)
+        self.sparse = bool(self.manifest.get("sparse", False))
+        self.embedding = self.manifest.get("embedding")
+        self.mmap = False
+        self._stale = False
+
+        vec_parts = []
+        text_parts = []
+        meta_parts = []
+        for seg in self.manifest["segments"]:
+            vecs, texts = self._open_segment(seg["id"], seg["count"])
+            vec_parts.append(vecs)
+            text_parts.append(texts)
+            meta_parts.append(self._load_meta(self._segment_paths(seg["id"])["meta"], len(texts)))
+
+        if vec_parts:
+            self._vec_parts = vec_parts
+        else:
+            self.embeddings = self._empty_matrix(self.manifest.get("dim"))
+        self.texts = text_parts[0] if len(text_parts) == 1 else ConcatTexts(text_parts)
+        self.meta = meta_parts[0] if len(meta_parts) == 1 else ChunkMetadata.concat(meta_parts)
+
+    def _open_segment(self, seg_id: int, count: int, mmap: bool = True) -> Tuple[Any, Sequence[str]]:
+        paths = self._segment_paths(seg_id)
+        if self.sparse:
+            vecs = sp.load_npz(paths["vectors"]).tocsr()
+        else:
+            vecs = np.load(paths["vectors"], mmap_mode="r" if mmap else None)
+        if mmap:
+            texts = MmapTexts(paths["offsets"], paths["blob"])
+        else:
+            texts = read_texts_blob(paths["offsets"], paths["blob"])
+        if len(texts) != vecs.shape[0] or len(texts) != count:
+            raise ValueError(f"Segment {seg_id} của store '{self.name}' không nhất quán.")
+        return vecs, texts
+
+    def _write_segment(self, seg_id: int, vec_parts: Iterable, texts: Iterable[str], meta: ChunkMetadata) -> Dict:
+        # số dòng của segment = số dòng metadata; vec_parts / texts có thể là generator
+        paths = self._segment_paths(seg_id)
+        write_texts_blob(texts, paths["offsets"], paths["blob"])
+        meta.save(paths["meta"])
+        if self.sparse:
+            atomic_save_npz(paths["vectors"], sp.vstack(list(vec_parts), format="csr"))
+        else:
+            # ghi nối từng phần, không ghép cả ma trận trong RAM
+            atomic_save_npy_parts(paths["vectors"], vec_parts, (len(meta), self.dim))
+        return {"id": seg_id, "count": len(meta)}
+
+    def _commit_manifest(self, segments: List[Dict], next_id: int) -> None:
+        # manifest được ghi atomic SAU khi segment đã nằm trọn trên đĩa
+        manifest = {
+            "version": 1,
+            "sparse": self.sparse,
+            "dim": self.dim,
+            "embedding": self.embedding,
+            "generation": (self.manifest or {}).get("generation", 0) + 1,
+            "next_id": next_id,
+            "segments": segments,
+        }
+        atomic_write_json(self.manifest_path, manifest)
+        self.manifest = manifest
+
+    def _append_segment(self, embeddings, texts: Sequence[str], meta: ChunkMetadata) -> Dict:
+        manifest = self.manifest or {"segments": [], "next_id": 1}
+        seg_id = manifest["next_id"]
+        seg = self._write_segment(seg_id, [embeddings], texts, meta)
+        self._commit_manifest(manifest["segments"] + [seg], seg_id + 1)
+        return seg
+
+    def _iter_segment_vectors(self, segments: List[Dict]) -> Iterator:
+        # mở lần lượt từng segment (mmap), segment trước được đóng khi sang segment sau
+        for seg in segments:
+            path = self._segment_paths(seg["id"])["vectors"]
+            yield sp.load_npz(path).tocsr() if self.sparse else np.load(path, mmap_mode="r")
+
+    def _iter_segment_texts(self, segments: List[Dict]) -> Iterator[str]:
+        for seg in segments:
+            paths = self._segment_paths(seg["id"])
+            yield from MmapTexts(paths["offsets"], paths["blob"])
+
+    def compact(self, since_id: Optional[int] = None) -> None:
+        """
+        Gộp các segment thành 1 segment (vector lại được mmap zero-copy khi load).
+        since_id: chỉ gộp các segment từ segment đầu tiên có id >= since_id tới
+        cuối (vd các batch của lần ingest này), segment cũ hơn giữ nguyên.
+        Đọc lần lượt từng segment từ đĩa (mỗi lúc chỉ mở 1 segment).
+        Không làm gì với các layout khác.
+        """
+        if not self.segmented or self.manifest is None:
+            return
+        segments = self.manifest["segments"]
+        first = 0
+        if since_id is not None:
+            first = next((i for i, seg in enumerate(segments) if seg["id"] >= since_id), len(segments))
+        tail = segments[first:]
+        if len(tail) <= 1:
+            return
+
+        start = sum(seg["count"] for seg in segments[:first])
+        end = start + sum(seg["count"] for seg in tail)
+        seg_id = self.manifest["next_id"]
+        seg = self._write_segment(
+            seg_id,
+            self._iter_segment_vectors(tail),
+            self._iter_segment_texts(tail),
+            self.meta.take(np.arange(start, end)),
+        )
+        self._commit_manifest(segments[:first] + [seg], seg_id + 1)
+        self._remove_segment_files(tail)
+        self._stale = True
+
+    def _remove_segment_files(self, segments: List[Dict]) -> None:
+        for old in segments:
+            for path in self._segment_paths(old["id"]).values():
+                try:
+                    path.unlink()
+                except OSError:
+                    # vd Windows không cho xoá file đang được mmap; để lại, không ảnh hưởng
+                    pass
+
+    def delete(self, rows: np.ndarray) -> int:
+        """
+        Xoá các chunk theo chỉ số dòng, vd self.meta.rows({"source": "a.pdf"}).
+        Thứ tự các chunk còn lại giữ nguyên. Layout segment: chỉ ghi lại các
+        segment có dòng bị xoá (segment hết dòng thì bỏ), segment khác giữ
+        nguyên; layout khác: ghi lại file. Trả về số chunk đã xoá.
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if rows.size == 0:
+            return 0
+        self.ann = None
+        self.bm25 = None
+        self.quant = None
+
+        if self.segmented:
+            self._delete_from_segments(rows)
+            return int(rows.size)
+
+        keep = np.ones(len(self.texts), dtype=bool)
+        keep[rows] = False
+        kept = np.flatnonzero(keep)
+        self.embeddings = self.embeddings[kept]
+        self.texts = [self.texts[i] for i in kept]
+        self.meta = self.meta.take(kept)
+        if kept.size == 0:
+            self.embedding = None
+        self._save()
+        return int(rows.size)
+
+    def _delete_from_segments(self, rows: np.ndarray) -> None:
+        if self.manifest is None:
+            # store cũ mở ở chế độ segment: chuyển thành segment đầu tiên (như add())
+            self._append_segment(self.embeddings, self.texts, self.meta)
+        segments = []
+        touched = []
+        next_id = self.manifest["next_id"]
+        start = 0
+        for seg in self.manifest["segments"]:
+            end = start + seg["count"]
+            lo, hi = np.searchsorted(rows, [start, end])
+            if lo == hi:
+                segments.append(seg)
+            else:
+                touched.append(seg)
+                keep = np.ones(seg["count"], dtype=bool)
+                keep[rows[lo:hi] - start] = False
+                kept = np.flatnonzero(keep)
+                if kept.size > 0:
+                    # đọc vào RAM (không mmap): file segment cũ sắp bị xoá
+                    vecs, texts = self._open_segment(seg["id"], seg["count"], mmap=False)
+                    meta = self._load_meta(self._segment_paths(seg["id"])["meta"], seg["count"])
+                    segments.append(self._write_segment(
+                        next_id, [vecs[kept]], [texts[i] for i in kept], meta.take(kept)
+                    ))
+                    next_id += 1
+            start = end
+
+        if not segments:
+            self.embedding = None
+        self._commit_manifest(segments, next_id)
+        self._remove_segment_files(touched)
+        # vector/text load lại khi cần, metadata cập nhật ngay (ingest tra tiếp trên đó)
+        keep = np.ones(len(self.meta), dtype=bool)
+        keep[rows] = False
+        self.meta = self.meta.take(np.flatnonzero(keep))
+        self._stale = True
 
     def _save(self) -> None:
-        np.save(self.emb_path, self.embeddings)
-        with open(self.texts_path, "wb") as f:
+        # ghi ra file tạm rồi os.replace để reader không bao giờ đọc phải file ghi dở
+        if self.mmap:
+            write_texts_blob(self.texts, self.offsets_path, self.blob_path)
+            self.meta.save(self.meta_path)
+            atomic_save_npy(self.vectors_path, self.embeddings)
+            self._write_header()
+            return
+
+        vec_path = self.sparse_path if self.sparse else self.emb_path
+        tmp_emb = vec_path.with_name(vec_path.name + ".tmp")
+        with open(tmp_emb, "wb") as f:
+            if self.sparse:
+                sp.save_npz(f, self.embeddings)
+            else:
+                np.save(f, self.embeddings)
+        os.replace(tmp_emb, vec_path)
+
+        tmp_texts = self.texts_path.with_name(self.texts_path.name + ".tmp")
+        with open(tmp_texts, "wb") as f:
             pickle.dump(self.texts, f)
+        os.replace(tmp_texts, self.texts_path)
+        self.meta.save(self.meta_path)
+        self._write_header()
 
-    def add(self, embeddings: np.ndarray, texts: List[str]) -> None:
+    def add(
+        self,
+        embeddings: np.ndarray,
+        texts: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
         """
-        Thêm batch embedding + text.
-        embeddings.shape = (batch_size, dim)
+        Thêm batch embedding + text (+ metadata cho từng chunk, nếu có).
+        embeddings.shape = (batch_size, dim); store sparse nhận cả ma trận CSR.
+        Embedding dense phải do backend hiện tại tạo (embed_texts).
         """
-        if embeddings.size == 0:
+        if embeddings.shape[0] == 0:
+            return
+        # len(self.meta) thay cho len(self.texts): không load lại các segment vừa ghi
+        if len(self.meta) > 0 and embeddings.shape[1] != self.dim:
+            raise ValueError(
+                f"Embedding {embeddings.shape[1]} chiều không khớp store '{self.name}' ({self.dim} chiều)."
+            )
+        if self.embedding is None:
+            self.embedding = f"hashing-sparse-{embeddings.shape[1]}" if self.sparse else embedding_id()
+        if len(self.meta) == 0:
+            # store rỗng: số chiều lấy theo batch đầu tiên
+            self.embeddings = self._empty_matrix(embeddings.shape[1])
+
+        # index ANN / BM25 / bản lượng tử hoá không còn khớp; build lại sau khi ingest xong
+        self.ann = None
+        self.bm25 = None
+        self.quant = None
+
+        if self.segmented:
+            if self.manifest is None and len(self.meta) > 0:
+                # store cũ (npy/pkl, mmap...) mở ở chế độ segment: chuyển dữ liệu
+                # hiện có thành segment đầu tiên (chỉ 1 lần)
+                self._append_segment(self.embeddings, self.texts, self.meta)
+
+            if self.sparse:
+                embeddings = normalize_sparse_rows(embeddings)
+            else:
+                embeddings = normalize_rows(embeddings)
+            new_meta = ChunkMetadata()
+            new_meta.extend(metadatas, len(texts))
+            self._append_segment(embeddings, texts, new_meta)
+
+            # batch vừa ghi chỉ nằm trên đĩa, RAM chỉ giữ metadata: ingest nhiều
+            # batch không tích vector/text trong RAM, cũng không mmap từng segment
+            # (mỗi mmap giữ 1 file descriptor). Vector/text load lại ở lần đọc
+            # đầu tiên, thường là sau compact() cuối ingest
+            self.meta.extend(metadatas, len(texts))
+            self._stale = True
             return
 
-        if self.embeddings.size == 0:
-            self.embeddings = embeddings
+        if self.sparse:
+            embeddings = normalize_sparse_rows(embeddings)
+            if self.embeddings.shape[0] == 0:
+                self.embeddings = embeddings
+            else:
+                self.embeddings = sp.vstack([self.embeddings, embeddings], format="csr")
         else:
-            self.embeddings = np.vstack([self.embeddings, embeddings])
+            embeddings = normalize_rows(embeddings)
+            if self.embeddings.size == 0:
+                self.embeddings = embeddings
+            else:
+                self.embeddings = np.vstack([self.embeddings, embeddings])
 
+        if not isinstance(self.texts, list):
+            # text đang memory-map (chỉ đọc) -> chuyển sang list để ghi lại
+            self.texts = list(self.texts)
         self.texts.extend(texts)
+        self.meta.extend(metadatas, len(texts))
         self._save()
 
-    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+    def _embed_queries(self, queries: List[str]):
+        """
+        Embedding đã chuẩn hoá của các query, cùng dạng (dense/CSR) với store.
+        """
+        if self.sparse:
+            return normalize_sparse_rows(embed_texts_sparse(queries, n_features=self.dim))
+        if self.embedding is not None and self.embedding != embedding_id():
+            raise ValueError(
+                f"Store '{self.name}' được tạo bằng embedding '{self.embedding}' nhưng backend "
+                f"hiện tại là '{embedding_id()}'; cần ingest lại (--full)."
+            )
+        q = embed_texts(queries)
+        if q.shape[1] != self.dim:
+            raise ValueError(
+                f"Query embedding {q.shape[1]} chiều không khớp store '{self.name}' ({self.dim} chiều)."
+            )
+        return normalize_rows(q, copy=False)
+
+    def _scores(self, q_norm, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity (m, n) giữa m query đã chuẩn hoá và toàn bộ store
+        (hoặc chỉ các dòng rows, khi đó shape (m, len(rows))).
+        """
+        emb = self.embeddings if rows is None else self.embeddings[rows]
+        if self.sparse:
+            return (q_norm @ emb.T).toarray()
+        if q_norm.shape[0] == 1:
+            # 1 query: nhân ma trận-vector, không tạo ma trận tạm (n, dim)
+            return (emb @ q_norm[0])[None, :]
+        # emb @ q.T rồi chuyển vị (thay cho q @ emb.T): với ConcatRows phép nhân
+        # chạy trên từng segment
+        return (emb @ q_norm.T).T
+
+    def _vector_search(
+        self,
+        q_norm,
+        k: int,
+        rows: Optional[np.ndarray],
+        nprobe: Optional[int],
+        exact: bool,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if rows is None and self.ann is not None and not exact:
+            return self.ann.search(self.embeddings, q_norm, k, nprobe or ANN_NPROBE)
+        if self.quant is not None and not exact:
+            return self._quantized_search(q_norm, k, rows)
+
+        # cosine similarity: embeddings đã chuẩn hoá sẵn; có filter thì chỉ
+        # chấm điểm các dòng đã lọc (quét chính xác trên tập con)
+        sims = self._scores(q_norm, rows)  # (m, n)
+        idx = top_k_indices(sims, k)
+        scores = np.take_along_axis(sims, idx, axis=1)
+        return (idx if rows is None else rows[idx]), scores
+
+    def _quantized_search(
+        self, q_norm: np.ndarray, k: int, rows: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # lượt 1: điểm xấp xỉ trên bản int8/float16 -> tập ứng viên nhỏ
+        approx = self.quant.scores(q_norm, rows)
+        cand = top_k_indices(approx, min(approx.shape[1], k * max(1, QUANT_RERANK_FACTOR)))
+        if rows is not None:
+            cand = rows[cand]
+
+        # lượt 2: cosine chính xác bằng float32 chỉ trên các ứng viên
+        m = q_norm.shape[0]
+        idx_out = np.empty((m, k), dtype=np.int64)
+        score_out = np.empty((m, k), dtype=np.float32)
+        for r in range(m):
+            c = np.sort(cand[r])  # đọc theo thứ tự tăng -> truy cập mmap tuần tự hơn
+            sims = self.embeddings[c] @ q_norm[r]
+            best = top_k_indices(sims, k)
+            idx_out[r] = c[best]
+            score_out[r] = sims[best]
+        return idx_out, score_out
+
+    def _search_arrays(
+        self,
+        queries: List[str],
+        q_norm,
+        top_k: int,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        where: Optional[MetadataFilter] = None,
+        hybrid: Optional[bool] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        rows = self.meta.rows(where)
+        n = len(self.texts) if rows is None else rows.size
+        k = min(top_k, n)
+        m = q_norm.shape[0]
+        if m == 0 or k <= 0:
+            return np.empty((m, 0), dtype=np.int64), np.empty((m, 0), dtype=np.float32)
+
+        if hybrid is None:
+            hybrid = HYBRID_SEARCH
+        if not hybrid or self.bm25 is None:
+            return self._vector_search(q_norm, k, rows, nprobe, exact)
+
+        # hybrid: lấy nhiều ứng viên từ cả 2 phía rồi gộp bằng RRF
+        n_cand = min(n, max(k, HYBRID_CANDIDATES))
+        vec_idx, _ = self._vector_search(q_norm, n_cand, rows, nprobe, exact)
+        idx_out = np.full((m, k), -1, dtype=np.int64)
+        score_out = np.full((m, k), -np.inf, dtype=np.float32)
+        for r in range(m):
+            bm25_idx, _ = self.bm25.search(queries[r], n_cand, rows)
+            fused, _ = reciprocal_rank_fusion([vec_idx[r], bm25_idx], k=RRF_K)
+            top = fused[:k]
+            if top.size == 0:
+                continue
+            idx_out[r, :top.size] = top
+            score_out[r, :top.size] = self._scores(q_norm[r:r + 1], top)[0]
+        return idx_out, score_out
+
+    def _to_results(self, idx: np.ndarray, scores: np.ndarray) -> List[List[Tuple[str, float]]]:
+        # index -1 = ANN không đủ ứng viên
+        return [
+            [(self.texts[i], float(sc)) for i, sc in zip(row_idx, row_scores) if i >= 0]
+            for row_idx, row_scores in zip(idx.tolist(), scores.tolist())
+        ]
+
+    def prefetch_query(self, query: str) -> None:
+        """
+        Tính sẵn embedding của query (vào cache embedding) khi chưa biết bộ lọc
+        metadata, để lần search sau chỉ còn phần chấm điểm.
+        """
+        if len(self.texts) > 0:
+            self._embed_queries([query])
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        where: Optional[MetadataFilter] = None,
+        hybrid: Optional[bool] = None,
+    ) -> List[Tuple[str, float]]:
         """
         Tìm top_k đoạn text phù hợp với query, trả về [(text, score), ...]
+        where: lọc theo metadata trước khi chấm điểm, vd {"doc_type": "regulation"}.
         """
         if len(self.texts) == 0:
             return []
 
-        query_emb = embed_texts([query])[0]  # (dim,)
+        q_norm = self._embed_queries([query])
+        idx, scores = self._search_arrays(
+            [query], q_norm, top_k, nprobe=nprobe, exact=exact, where=where, hybrid=hybrid
+        )
+        return self._to_results(idx, scores)[0]
+
+    def search_many_arrays(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        where: Optional[MetadataFilter] = None,
+        hybrid: Optional[bool] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search nhiều query cùng lúc: embed 1 lần, chấm điểm bằng 1 phép nhân
+        ma trận-ma trận. Trả về (indices, scores), cùng shape (len(queries), k),
+        mỗi dòng đã sắp giảm dần theo score.
+        """
+        if not queries or len(self.texts) == 0:
+            return (
+                np.empty((len(queries), 0), dtype=np.int64),
+                np.empty((len(queries), 0), dtype=np.float32),
+            )
+
+        queries = list(queries)
+        q_norm = self._embed_queries(queries)  # (m, dim)
+        return self._search_arrays(
+            queries, q_norm, top_k, nprobe=nprobe, exact=exact, where=where, hybrid=hybrid
+        )
+
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        where: Optional[MetadataFilter] = None,
+        hybrid: Optional[bool] = None,
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Như search() nhưng cho nhiều query, trả về list kết quả theo thứ tự queries.
+        """
+        idx, scores = self.search_many_arrays(
+            queries, top_k=top_k, nprobe=nprobe, exact=exact, where=where, hybrid=hybrid
+        )
+        return self._to_results(idx, scores)
+
+def convert_to_mmap(name: str = "default") -> SimpleVectorStore:
+    """
+    Chuyển store dạng {name}_embeddings.npy + {name}_texts.pkl sang định dạng
+    mmap ({name}_vectors.npy + {name}_text_offsets.npy + {name}_texts.bin).
+    File cũ được giữ nguyên; từ đó store tự nhận định dạng mmap.
+    """
+    src = SimpleVectorStore(name=name, sparse=False, mmap=False)
+    if not (src.emb_path.exists() and src.texts_path.exists()):
+        raise FileNotFoundError(f"Không tìm thấy store npy/pkl '{name}' để chuyển đổi.")
+    # ghi text trước, vectors sau: file vectors là dấu hiệu nhận định dạng mmap
+    write_texts_blob(src.texts, src.offsets_path, src.blob_path)
+    atomic_save_npy(src.vectors_path, src.embeddings)
+    return SimpleVectorStore(name=name, mmap=True)
+
+
+# ====== REGISTRY: mỗi store chỉ load 1 lần / process ======
+_registry_lock = threading.Lock()
+_stores: Dict[str, SimpleVectorStore] = {}
+_generations: Dict[str, int] = {}
+_last_check: Dict[str, float] = {}
 
-        # cosine similarity
-        emb = self.embeddings
-        emb_norm = emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-8)
-        q_norm = query_emb / (np.linalg.norm(query_emb) + 1e-8)
 
-        sims = emb_norm @ q_norm  # (n,)
-        idx = np.argsort(-sims)[:top_k]
+def _load_into_registry(name: str) -> SimpleVectorStore:
+    # gọi khi đang giữ _registry_lock
+    store = SimpleVectorStore(name=name)
+    _generations[name] = _generations.get(name, 0) + 1
+    store.generation = _generations[name]
+    # gán 1 lần -> request đang chạy vẫn giữ snapshot cũ, request mới thấy snapshot mới
+    _stores[name] = store
+    return store
 
-        results: List[Tuple[str, float]] = []
-        for i in idx:
-            results.append((self.texts[i], float(sims[i])))
-        return results
+
+def get_store(name: str = "default") -> SimpleVectorStore:
+    """
+    Trả về store dùng chung cho cả process (an toàn giữa các thread).
+    Tự load lại khi file trên đĩa thay đổi (kiểm tra mtime tối đa mỗi
+    STORE_RELOAD_INTERVAL giây). Store trả về chỉ nên dùng để đọc.
+    """
+    store = _stores.get(name)
+    now = time.monotonic()
+    if store is not None and now - _last_check.get(name, 0.0) < STORE_RELOAD_INTERVAL:
+        return store
+
+    with _registry_lock:
+        store = _stores.get(name)
+        if store is not None and now - _last_check.get(name, 0.0) < STORE_RELOAD_INTERVAL:
+            # thread khác vừa kiểm tra xong
+            return store
+        _last_check[name] = now
+
+        if store is not None and store.disk_signature() == store.signature:
+            return store
+
+        try:
+            return _load_into_registry(name)
+        except Exception:
+            # dữ liệu trên đĩa đang ghi dở / hỏng: giữ snapshot cũ nếu có
+            if store is None:
+                raise
+            return store
+
+
+def reload_store(name: str = "default") -> SimpleVectorStore:
+    """
+    Ép load lại store từ đĩa (vd sau khi chạy ingest).
+    """
+    with _registry_lock:
+        _last_check[name] = time.monotonic()
+        return _load_into_registry(name)
+
+
+def loaded_stores() -> Dict[str, SimpleVectorStore]:
+    """
+    Snapshot các store đang nằm trong registry.
+    """
+    return dict(_stores)
@@ -0,0 +1,229 @@
+# app/services/admission.py
+# Kiểm soát số lời gọi LLM chạy đồng thời (Ollama xử lý gần như tuần tự):
+# - tối đa max_concurrency lời gọi chạy cùng lúc, phần còn lại xếp hàng
+# - hàng đợi có giới hạn: đầy thì từ chối ngay (429) kèm Retry-After
+# - chờ quá hạn (queue_timeout) thì bỏ (503) thay vì giữ request tới 300 giây
+# - ưu tiên: lời gọi phân loại (ngắn) được cấp chỗ trước lời gọi sinh câu trả lời
+# Dùng chung cho code sync (thread) và async (event loop).
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from app.config import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT
+
+PRIORITY_CLASSIFY = 0
+PRIORITY_ANSWER = 1
+
+_WAITING, _GRANTED, _ABANDONED = 0, 1, 2
+
+
+class OverloadedError(RuntimeError):
+    """
+    LLM đang quá tải: status_code 429 (hàng đợi đầy) hoặc 503 (chờ quá hạn),
+    retry_after = số giây gợi ý cho header Retry-After.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "enqueued", "state", "event", "loop", "future")
+
+    def __init__(self, priority: int, seq: int, loop: Optional[asyncio.AbstractEventLoop]):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.state = _WAITING
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Semaphore có hàng đợi ưu tiên (heap theo (priority, thứ tự đến)). Khi 1 lời
+    gọi xong, chỗ của nó được trao thẳng cho người chờ đầu hàng.
+    max_concurrency <= 0: không giới hạn.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.heap: List[_Waiter] = []
+        self.seq = itertools.count()
+        self.avg_service = 0.0  # EWMA thời gian giữ chỗ (giây), để ước lượng Retry-After
+        self.stats = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "timed_out": 0,
+            "max_queue_depth": 0,
+            "wait_seconds_total": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    def retry_after(self) -> int:
+        per_slot = self.avg_service or 1.0
+        return max(1, math.ceil(per_slot * (self.queued + 1) / max(1, self.max_concurrency)))
+
+    def saturated(self) -> bool:
+        """
+        Hàng đợi đã đầy (request mới chắc chắn bị từ chối): kiểm tra rẻ để
+        từ chối sớm trước khi làm retrieval.
+        """
+        return self.enabled and self.active >= self.max_concurrency and self.queued >= self.max_queue
+
+    def _admitted(self, wait: float) -> None:
+        # gọi khi đang giữ lock
+        self.stats["admitted"] += 1
+        self.stats["wait_seconds_total"] += wait
+        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], wait)
+
+    def _enter(self, priority: int, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """
+        Còn chỗ -> nhận luôn (None); hàng đợi đầy -> OverloadedError 429;
+        ngược lại xếp hàng, trả về waiter để chờ.
+        """
+        with self.lock:
+            if self.active < self.max_concurrency:
+                self.active += 1
+                self._admitted(0.0)
+                return None
+            if self.queued >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                raise OverloadedError(
+                    f"Hàng đợi LLM đã đầy ({self.max_queue} yêu cầu đang chờ).", 429, self.retry_after()
+                )
+            waiter = _Waiter(priority, next(self.seq), loop)
+            heapq.heappush(self.heap, waiter)
+            self.queued += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queued)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Người chờ bỏ cuộc (quá hạn / bị huỷ). True nếu thực ra vừa được cấp chỗ
+        (bên gọi đang giữ chỗ đó).
+        """
+        with self.lock:
+            if waiter.state == _GRANTED:
+                return True
+            waiter.state = _ABANDONED  # còn trong heap, _release bỏ qua
+            self.queued -= 1
+            return False
+
+    def _timeout_error(self, timeout: float) -> OverloadedError:
+        with self.lock:
+            self.stats["timed_out"] += 1
+        return OverloadedError(
+            f"LLM đang quá tải, đã chờ quá {timeout:g} giây.", 503, self.retry_after()
+        )
+
+    def _release(self, held: Optional[float]) -> None:
+        with self.lock:
+            if held is not None:
+                self.avg_service = held if not self.avg_service else 0.8 * self.avg_service + 0.2 * held
+            while self.heap:
+                waiter = heapq.heappop(self.heap)
+                if waiter.state != _WAITING:
+                    continue
+                # trao chỗ cho người chờ đầu hàng (active giữ nguyên)
+                waiter.state = _GRANTED
+                self.queued -= 1
+                self._admitted(time.monotonic() - waiter.enqueued)
+                waiter.wake()
+                return
+            self.active -= 1
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_ANSWER, timeout: Optional[float] = None) -> Iterator[None]:
+        """
+        Giữ 1 chỗ gọi LLM trong khối with (code sync). timeout: hạn chờ trong
+        hàng đợi của request này (mặc định queue_timeout).
+        """
+        if not self.enabled:
+            yield
+            return
+        timeout = self.queue_timeout if timeout is None else timeout
+        waiter = self._enter(priority, None)
+        if waiter is not None and not waiter.event.wait(timeout):
+            if not self._abandon(waiter):
+                raise self._timeout_error(timeout)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = PRIORITY_ANSWER, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Như slot nhưng chờ không chiếm thread (code async).
+        """
+        if not self.enabled:
+            yield
+            return
+        timeout = self.queue_timeout if timeout is None else timeout
+        waiter = self._enter(priority, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(waiter.future, timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._timeout_error(timeout)
+            except asyncio.CancelledError:
+                # request bị huỷ khi đang chờ; nếu vừa được cấp chỗ thì trả lại ngay
+                if self._abandon(waiter):
+                    self._release(None)
+                raise
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def stats_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["active"] = self.active
+            stats["queue_depth"] = self.queued
+            avg_service = self.avg_service
+        admitted = stats["admitted"]
+        stats["avg_wait_ms"] = stats.pop("wait_seconds_total") * 1000 / admitted if admitted else 0.0
+        stats["max_wait_ms"] = stats.pop("max_wait_seconds") * 1000
+        stats["avg_service_s"] = avg_service
+        stats["max_concurrency"] = self.max_concurrency
+        stats["max_queue"] = self.max_queue
+        stats["queue_timeout"] = self.queue_timeout
+        return stats
+
+
+llm_admission = AdmissionController(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT)
@@ -0,0 +1,243 @@
+# app/services/answer_cache.py
+# Cache câu trả lời của /chat cho các câu hỏi lặp lại (mùa đóng học phí, xét tốt nghiệp...):
+# - tầng exact: khoá = câu hỏi đã chuẩn hoá + chế độ nguồn + phiên bản dữ liệu
+# - tầng semantic: embedding câu hỏi mới đủ gần (cosine) một câu đã cache, cùng nhãn
+#   phân loại tại chỗ, chung phần lớn từ nội dung và cùng các từ có chữ số thì dùng lại
+# Có TTL + LRU; phiên bản dữ liệu (generation của store...) đổi thì xoá sạch.
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import re
+import threading
+import time
+import numpy as np
+
+from app.config import (
+    ANSWER_CACHE_MIN_OVERLAP,
+    ANSWER_CACHE_SIM_THRESHOLD,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+)
+from app.rag.scoring import normalize_rows
+from app.services.classifier import get_model, predict
+from app.services.embeddings import embed_texts
+
+# hư từ / đại từ / tiểu từ lịch sự: bỏ khi so tập từ nội dung của 2 câu hỏi.
+# Không bỏ từ để hỏi (gì, nào, bao nhiêu...) hay "không", "được" vì chúng đổi ý của câu
+STOPWORDS = frozenset(
+    "à ạ ơi nhé nha nhỉ vậy thế là thì mà của cho em anh chị tôi mình bạn các những "
+    "một có và với xin hỏi giúp biết hả đi ấy này đó".split()
+)
+
+
+def normalize_question(text: str) -> str:
+    """
+    Chữ thường, gộp khoảng trắng, bỏ dấu câu ở 2 đầu ("Học phí?" == "học phí").
+    Giữ dấu tiếng Việt: bỏ dấu có thể gộp nhầm các từ khác nghĩa.
+    """
+    return " ".join(text.lower().split()).strip(" ?!.,;:")
+
+
+def content_tokens(question: str) -> frozenset:
+    """
+    Tập từ nội dung (bỏ STOPWORDS) của câu đã chuẩn hoá.
+    """
+    return frozenset(t for t in re.findall(r"\w+", question) if t not in STOPWORDS)
+
+
+def _numbered(tokens: frozenset) -> frozenset:
+    return frozenset(t for t in tokens if any(c.isdigit() for c in t))
+
+
+def same_topic(a: frozenset, b: frozenset, min_overlap: float) -> bool:
+    """
+    2 câu hỏi có embedding rất gần vẫn có thể hỏi 2 thứ khác nhau ("ngành kế toán"
+    / "ngành luật", "Điều 10" / "Điều 11"). Coi là cùng câu hỏi khi các từ có chữ
+    số (số điều, mã lớp, tuần, năm) trùng hết và tỉ lệ từ nội dung chung (Jaccard)
+    >= min_overlap: câu diễn đạt lại chỉ thêm / bớt vài từ phụ.
+    """
+    if _numbered(a) != _numbered(b):
+        return False
+    union = len(a | b)
+    return union == 0 or len(a & b) / union >= min_overlap
+
+
+class AnswerEntry:
+    __slots__ = ("answer", "used_sources", "expires", "slot", "label", "tokens")
+
+    def __init__(
+        self, answer: str, used_sources: List[str], expires: float, slot: int,
+        label: Optional[str], tokens: Optional[frozenset],
+    ):
+        self.answer = answer
+        self.used_sources = used_sources
+        self.expires = expires
+        self.slot = slot
+        self.label = label
+        self.tokens = tokens
+
+
+class AnswerCache:
+    """
+    entries: OrderedDict khoá exact -> AnswerEntry (cuối = mới dùng nhất).
+    Embedding đã chuẩn hoá của mỗi entry nằm ở 1 dòng (slot) của ma trận
+    vectors, tầng semantic chấm điểm cả ma trận bằng 1 phép nhân.
+    """
+
+    def __init__(
+        self, max_size: int, ttl: float, threshold: float, min_overlap: float = ANSWER_CACHE_MIN_OVERLAP
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.entries: "OrderedDict[Tuple, AnswerEntry]" = OrderedDict()
+        self.version: Optional[Hashable] = None
+        self.vectors: Optional[np.ndarray] = None  # (max_size, dim), tạo khi cần
+        self.slot_keys: List[Optional[Tuple]] = [None] * max_size
+        self.free = list(range(max_size - 1, -1, -1))
+        self.lock = threading.Lock()
+        self.stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @property
+    def semantic(self) -> bool:
+        # ngưỡng > 1: không câu nào đạt -> tắt tầng semantic (không tốn embed khi put)
+        return self.enabled and self.threshold <= 1.0
+
+    def _check_version(self, version: Hashable) -> None:
+        # dữ liệu đã ingest lại / store load lại -> mọi câu trả lời cũ không còn đúng
+        if version != self.version:
+            if self.entries:
+                self.stats["invalidations"] += 1
+            self.entries.clear()
+            self.slot_keys = [None] * self.max_size
+            self.free = list(range(self.max_size - 1, -1, -1))
+            self.version = version
+
+    def _drop(self, key: Tuple) -> None:
+        entry = self.entries.pop(key)
+        self.slot_keys[entry.slot] = None
+        self.free.append(entry.slot)
+
+    def get(self, question: str, mode: str, version: Hashable) -> Optional[Tuple[str, List[str]]]:
+        """
+        Tầng exact: (answer, used_sources) hoặc None. Không tính miss ở đây
+        (bên gọi thử tiếp get_similar).
+        """
+        if not self.enabled:
+            return None
+        key = (normalize_question(question), mode)
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                self._drop(key)
+                self.stats["expirations"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entry.answer, list(entry.used_sources)
+
+    def embed(self, question: str) -> np.ndarray:
+        return normalize_rows(embed_texts([normalize_question(question)]), copy=False)[0]
+
+    def get_similar(self, question: str, mode: str, version: Hashable) -> Optional[Tuple[str, List[str]]]:
+        """
+        Tầng semantic: câu đã cache (cùng mode, cùng nhãn phân loại tại chỗ, cùng
+        chủ đề theo same_topic) có cosine với câu hỏi >= threshold, chọn câu gần nhất.
+        Miss cả 2 tầng được tính ở đây.
+        """
+        if not self.enabled:
+            return None
+        vec = label = tokens = None
+        if self.semantic:
+            norm = normalize_question(question)
+            vec = self.embed(question)
+            label = predict(get_model(), norm)[0]
+            tokens = content_tokens(norm)
+        now = time.monotonic()
+        with self.lock:
+            self._check_version(version)
+            if vec is not None and self.vectors is not None and self.entries:
+                sims = self.vectors @ vec
+                for slot in np.argsort(-sims):
+                    if sims[slot] < self.threshold:
+                        break
+                    key = self.slot_keys[slot]
+                    if key is None or key[1] != mode:
+                        continue
+                    entry = self.entries[key]
+                    if entry.expires < now:
+                        self._drop(key)
+                        self.stats["expirations"] += 1
+                        continue
+                    if entry.label != label or not same_topic(entry.tokens, tokens, self.min_overlap):
+                        continue
+                    self.entries.move_to_end(key)
+                    self.stats["semantic_hits"] += 1
+                    return entry.answer, list(entry.used_sources)
+            self.stats["misses"] += 1
+            return None
+
+    def put(
+        self, question: str, mode: str, version: Hashable, answer: str, used_sources: List[str]
+    ) -> None:
+        if not self.enabled:
+            return
+        norm = normalize_question(question)
+        key = (norm, mode)
+        vec = label = tokens = None
+        if self.semantic:
+            vec = self.embed(question)
+            label = predict(get_model(), norm)[0]
+            tokens = content_tokens(norm)
+        with self.lock:
+            if version != self.version:
+                # dữ liệu đã đổi trong lúc trả lời: câu trả lời này đã cũ, không lưu
+                return
+            if key in self.entries:
+                self._drop(key)
+            while not self.free:
+                self._drop(next(iter(self.entries)))  # LRU: entry dùng lâu nhất
+                self.stats["evictions"] += 1
+            slot = self.free.pop()
+            if vec is not None:
+                if self.vectors is None or self.vectors.shape[1] != vec.shape[0]:
+                    self.vectors = np.zeros((self.max_size, vec.shape[0]), dtype=np.float32)
+                self.vectors[slot] = vec
+            self.slot_keys[slot] = key
+            self.entries[key] = AnswerEntry(
+                answer, list(used_sources), time.monotonic() + self.ttl, slot, label, tokens
+            )
+
+    def clear(self) -> None:
+        with self.lock:
+            self._check_version(object())
+
+    def stats_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self.entries)
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = hits / total if total else 0.0
+        stats["max_size"] = self.max_size
+        stats["ttl"] = self.ttl
+        stats["threshold"] = self.threshold
+        stats["min_overlap"] = self.min_overlap
+        return stats
+
+
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIM_THRESHOLD)
@@ -0,0 +1,311 @@
+# app/services/classifier.py
+# Phân loại câu hỏi ngay trong process (không gọi LLM):
+# - luật từ khoá (đã bỏ dấu, để bắt cả câu gõ không dấu)
+# - tín hiệu regex: mã lớp, "tuần N", "Điều N"
+# - mô hình tuyến tính nhỏ (logistic regression) trên đặc trưng băm n-gram ký tự
+# Độ tin cậy thấp -> trả về None để bên gọi hỏi LLM như cũ. Nhãn nghiệp vụ
+# (khác GENERAL) không có tín hiệu luật đủ mạnh luôn bị coi là độ tin cậy thấp.
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import re
+import threading
+import time
+import unicodedata
+import zlib
+import numpy as np
+from scipy import sparse
+from sklearn.linear_model import LogisticRegression
+
+from app.config import CLASSIFIER_MIN_CONFIDENCE
+
+LABELS = ["REGULATION", "TUITION", "SCHEDULE", "GENERAL"]
+
+CLASS_CODE_RE = re.compile(r"\b(?:\d{2}[A-Z]{2}\d{4}|\d{6}[A-Z]{2}\d{3})\b")
+WEEK_RE = re.compile(r"tu[ầa]n\s*(\d+)")
+ARTICLE_REF_RE = re.compile(r"\bdieu\s+\d+")
+
+# từ khoá (không dấu) -> trọng số, theo nhãn
+KEYWORDS: Dict[str, Dict[str, float]] = {
+    "REGULATION": {
+        "quy che": 2.0, "quy dinh": 1.5, "dieu kien": 1.0, "tot nghiep": 1.5,
+        "bao luu": 1.5, "hoc lai": 1.5, "thi lai": 1.5, "hoc vu": 1.5,
+        "canh bao": 1.0, "buoc thoi hoc": 2.0, "thoi hoc": 1.0, "xep loai": 1.5,
+        "diem trung binh": 1.5, "tin chi tich luy": 1.5, "hoc phan": 0.5,
+        "ky luat": 1.5, "vi pham": 1.0, "chuyen nganh": 0.5, "khoan": 0.5,
+        "hoc ky phu": 1.0, "gpa": 1.5,
+    },
+    "TUITION": {
+        "hoc phi": 2.5, "le phi": 2.0, "dong tien": 1.5, "nop tien": 1.5,
+        "mien giam": 2.0, "hoan phi": 2.0, "thu phi": 2.0, "bao nhieu tien": 1.5,
+        "chuyen khoan": 1.5, "han nop": 1.0, "don gia": 1.5, "phi": 0.5,
+        "hoc bong": 1.5,
+    },
+    "SCHEDULE": {
+        "lich hoc": 2.5, "thoi khoa bieu": 2.5, "tkb": 2.0, "phong hoc": 1.5,
+        "hoc phong": 1.5, "may gio": 1.0, "tiet": 1.0, "thu may": 1.0,
+        "hoc ngay": 1.0, "giang vien day": 1.0, "lich": 0.5,
+    },
+    # không có "la gi": câu "<thuật ngữ học vụ> là gì" (Điểm F, tín chỉ...) vẫn là câu trong phạm vi
+    "GENERAL": {
+        "chatgpt": 2.0, "tri tue nhan tao": 1.5, "hom nay": 0.5,
+        "tin tuc": 1.5, "thoi tiet": 2.0, "ty gia": 2.0, "ti gia": 2.0,
+        "gioi thieu": 1.0, "xin chao": 1.5,
+    },
+}
+
+# Câu mẫu huấn luyện mô hình tuyến tính (có dấu; lúc học/đoán đều bỏ dấu)
+SEED_QUESTIONS: Dict[str, List[str]] = {
+    "REGULATION": [
+        "Điều kiện xét tốt nghiệp là gì?",
+        "Sinh viên bị cảnh báo học vụ khi nào?",
+        "Quy chế đào tạo quy định bảo lưu kết quả học tập thế nào?",
+        "Muốn học lại một học phần thì làm sao?",
+        "Bao nhiêu tín chỉ thì được xét tốt nghiệp?",
+        "Trường hợp nào bị buộc thôi học?",
+        "Điểm trung bình tích lũy bao nhiêu thì xếp loại giỏi?",
+        "Quy định về thi lại và cải thiện điểm",
+        "Sinh viên vi phạm quy chế thi bị xử lý ra sao?",
+        "Được đăng ký tối đa bao nhiêu tín chỉ mỗi học kỳ?",
+        "Điều 10 quy chế nói gì?",
+        "Thời gian tối đa hoàn thành khoá học là bao lâu?",
+        "Có được học cùng lúc hai chương trình không?",
+        "Nghỉ học tạm thời cần những điều kiện gì?",
+        "Tín chỉ là gì?",
+        "Điểm F là gì?",
+        "Học phần tiên quyết là gì?",
+        "Cảnh báo học vụ là gì?",
+        "Học kỳ phụ là gì?",
+    ],
+    "TUITION": [
+        "Học phí học kỳ này là bao nhiêu?",
+        "Hạn đóng học phí học kỳ 1 năm 2025-2026?",
+        "Một tín chỉ bao nhiêu tiền?",
+        "Đóng học phí bằng chuyển khoản được không?",
+        "Sinh viên được miễn giảm học phí khi nào?",
+        "Lệ phí thi lại là bao nhiêu?",
+        "Nộp tiền học ở đâu?",
+        "Đóng học phí trễ có bị phạt không?",
+        "Số tài khoản để nộp học phí",
+        "Học phí ngành công nghệ thông tin",
+        "Có được hoàn học phí khi rút học phần không?",
+        "Thông báo thu học phí học kỳ 1",
+        "Học bổng là gì?",
+        "Học bổng khuyến khích học tập là gì?",
+        "Lệ phí là gì?",
+        "Miễn giảm học phí là gì?",
+    ],
+    "SCHEDULE": [
+        "Lịch học lớp 25TH0101 tuần 15",
+        "Thời khoá biểu của lớp 25AV0101",
+        "Tuần này lớp em học phòng nào?",
+        "Thứ 2 lớp 25KT0101 học môn gì?",
+        "Tuần 16 lớp 25TC0101 học mấy giờ?",
+        "Môn cơ sở dữ liệu học tiết mấy?",
+        "Lịch học tuần sau của lớp tôi",
+        "Giảng viên dạy lớp 25TH0102 tuần 15 là ai?",
+        "Ngày mai lớp 242101TH001 có học không?",
+        "Cho em xem thời khoá biểu tuần 15",
+        "Lớp 25QT0101 học ở phòng nào?",
+        "Chiều thứ 5 lớp em học môn gì?",
+    ],
+    "GENERAL": [
+        "ChatGPT là gì?",
+        "Trí tuệ nhân tạo là gì?",
+        "Giới thiệu về trường Đại học Bình Dương",
+        "Thời tiết hôm nay thế nào?",
+        "Tin tức mới nhất về AI",
+        "Python là gì?",
+        "Làm sao để học lập trình hiệu quả?",
+        "Xin chào",
+        "Bạn là ai?",
+        "Tỷ giá đô la hôm nay",
+        "Máy học khác học sâu thế nào?",
+        "Viết giúp tôi một email xin việc",
+        "Blockchain là gì?",
+        "Thủ đô của Nhật Bản là gì?",
+        "Ai là tác giả Truyện Kiều?",
+        # câu ngoài phạm vi (du lịch, ăn uống, thể thao, mua sắm...): mô hình
+        # n-gram ký tự không tự gán nhầm nhãn nghiệp vụ cho chúng
+        "Đi du lịch Phú Quốc nên ở đâu?",
+        "Món ăn đặc sản Huế là gì?",
+        "Kết quả trận đấu của đội tuyển Việt Nam",
+        "Giá xăng hôm nay bao nhiêu?",
+        "Cách giảm căng thẳng khi làm việc",
+        "Cuối tuần nên xem phim gì?",
+        "Mua điện thoại nào tốt?",
+        "Cách nấu canh chua cá lóc",
+        "Sài Gòn có chỗ nào vui chơi?",
+        "Hướng dẫn tạo tài khoản Gmail",
+    ],
+}
+
+RULE_WEIGHT = 1.0  # trọng số phân bố từ luật khi trộn với xác suất của mô hình
+# Nhãn nghiệp vụ cần điểm luật >= MIN_RULE_SCORE (1 từ khoá mạnh, mã lớp, tuần N,
+# Điều N); chỉ có mô hình thì độ tin cậy tối đa MODEL_ONLY_MAX_CONFIDENCE (< ngưỡng
+# mặc định -> hỏi LLM): n-gram ký tự dễ trùng ngẫu nhiên ("Đà Lạt" ~ "đào tạo")
+MIN_RULE_SCORE = 1.0
+MODEL_ONLY_MAX_CONFIDENCE = 0.5
+
+
+def normalize_question(text: str) -> str:
+    """
+    Chữ thường, bỏ dấu tiếng Việt (đ -> d), gộp khoảng trắng.
+    """
+    text = unicodedata.normalize("NFD", text.lower().replace("đ", "d"))
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return " ".join(text.split())
+
+
+def rule_scores(question: str) -> np.ndarray:
+    """
+    Điểm luật theo nhãn (thứ tự LABELS): từ khoá + regex mã lớp / tuần / Điều N.
+    """
+    norm = normalize_question(question)
+    padded = f" {norm} "
+    scores = np.zeros(len(LABELS), dtype=np.float64)
+    for j, label in enumerate(LABELS):
+        for kw, w in KEYWORDS[label].items():
+            if f" {kw} " in padded:
+                scores[j] += w
+
+    schedule = LABELS.index("SCHEDULE")
+    if CLASS_CODE_RE.search(question.upper()):
+        scores[schedule] += 2.0
+    if WEEK_RE.search(question.lower()) or re.search(r"\btuan\s*\d+", norm):
+        scores[schedule] += 1.5
+    if ARTICLE_REF_RE.search(norm):
+        scores[LABELS.index("REGULATION")] += 2.0
+    return scores
+
+
+def hashed_features(text: str, n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    N-gram ký tự 2..4 trong từng từ (có đệm khoảng trắng 2 đầu, như char_wb của
+    sklearn) của câu đã bỏ dấu, băm crc32 về n_features cột, chuẩn hoá L2.
+    Trả về (cột, giá trị). Tự băm thay vì HashingVectorizer.transform vì với
+    1 câu ngắn chi phí kiểm tra đầu vào của sklearn (~250 µs) lớn hơn phần tính.
+    """
+    counts: Counter = Counter()
+    for word in normalize_question(text).split():
+        word = f" {word} ".encode("utf-8")
+        for n in (2, 3, 4):
+            for i in range(len(word) - n + 1):
+                counts[zlib.crc32(word[i:i + n]) % n_features] += 1
+    cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    vals = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    if vals.size:
+        vals /= np.sqrt(vals @ vals)
+    return cols, vals
+
+
+class LocalClassifier:
+    """
+    Logistic regression trên đặc trưng băm (hashed_features). Lúc đoán chỉ tính
+    tích vô hướng với các cột khác 0 của câu hỏi.
+    """
+
+    def __init__(self, n_features: int = 2 ** 14):
+        self.n_features = n_features
+        self.coef = np.zeros((len(LABELS), n_features))
+        self.intercept = np.zeros(len(LABELS))
+
+    def fit(self, questions: List[str], labels: List[str]) -> "LocalClassifier":
+        rows = [hashed_features(q, self.n_features) for q in questions]
+        X = sparse.csr_matrix(
+            (
+                np.concatenate([vals for _, vals in rows]),
+                np.concatenate([cols for cols, _ in rows]),
+                np.cumsum([0] + [cols.size for cols, _ in rows]),
+            ),
+            shape=(len(rows), self.n_features),
+        )
+        y = np.array([LABELS.index(label) for label in labels])
+        model = LogisticRegression(C=20.0, max_iter=1000).fit(X, y)
+        # classes_ theo thứ tự tăng dần = thứ tự LABELS (mọi nhãn đều có mẫu)
+        self.coef = model.coef_
+        self.intercept = model.intercept_
+        return self
+
+    def predict_proba(self, question: str) -> np.ndarray:
+        cols, vals = hashed_features(question, self.n_features)
+        logits = self.coef[:, cols] @ vals + self.intercept
+        logits = np.exp(logits - logits.max())
+        return logits / logits.sum()
+
+
+def predict(model: LocalClassifier, question: str) -> Tuple[str, float]:
+    """
+    (nhãn, độ tin cậy) = trộn xác suất của mô hình với phân bố điểm luật.
+    """
+    proba = model.predict_proba(question)
+    rules = rule_scores(question)
+    if rules.sum() > 0:
+        proba = (proba + RULE_WEIGHT * rules / rules.sum()) / (1 + RULE_WEIGHT)
+    best = int(np.argmax(proba))
+    confidence = float(proba[best])
+    if LABELS[best] != "GENERAL" and rules[best] < MIN_RULE_SCORE:
+        confidence = min(confidence, MODEL_ONLY_MAX_CONFIDENCE)
+    return LABELS[best], confidence
+
+
+_model: Optional[LocalClassifier] = None
+_model_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {
+    "total": 0,
+    "local": 0,
+    "llm_fallback": 0,
+    "local_seconds": 0.0,
+    "labels": {label: 0 for label in LABELS},
+}
+
+
+def get_model() -> LocalClassifier:
+    """
+    Mô hình dùng chung, huấn luyện 1 lần / process trên SEED_QUESTIONS (~0.1 giây).
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                questions = [q for label in LABELS for q in SEED_QUESTIONS[label]]
+                labels = [label for label in LABELS for _ in SEED_QUESTIONS[label]]
+                _model = LocalClassifier().fit(questions, labels)
+    return _model
+
+
+def classify_local(question: str) -> Optional[str]:
+    """
+    Nhãn của câu hỏi nếu độ tin cậy >= CLASSIFIER_MIN_CONFIDENCE, ngược lại None
+    (bên gọi hỏi LLM rồi báo lại bằng record_llm_label).
+    """
+    t0 = time.perf_counter()
+    label, confidence = predict(get_model(), question)
+    elapsed = time.perf_counter() - t0
+
+    confident = confidence >= CLASSIFIER_MIN_CONFIDENCE
+    with _stats_lock:
+        _stats["total"] += 1
+        _stats["local_seconds"] += elapsed
+        if confident:
+            _stats["local"] += 1
+            _stats["labels"][label] += 1
+        else:
+            _stats["llm_fallback"] += 1
+    return label if confident else None
+
+
+def record_llm_label(label: str) -> None:
+    with _stats_lock:
+        _stats["labels"][label] = _stats["labels"].get(label, 0) + 1
+
+
+def classifier_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["labels"] = dict(_stats["labels"])
+    total = stats["total"]
+    stats["fallback_rate"] = stats["llm_fallback"] / total if total else 0.0
+    stats["avg_local_us"] = stats.pop("local_seconds") * 1e6 / total if total else 0.0
+    stats["min_confidence"] = CLASSIFIER_MIN_CONFIDENCE
+    return stats
@@ -1,23 +1,403 @@
 # app/services/embeddings.py
-from typing import List
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
 import numpy as np
+from scipy import sparse
 from sklearn.feature_extraction.text import HashingVectorizer
 
-# Vectorizer đơn giản, 512 chiều
+from app.config import (
+    SPARSE_N_FEATURES,
+    EMBED_CACHE_SIZE,
+    EMBED_DISK_CACHE_MAX_ROWS,
+    EMBED_DISK_CACHE_MAX_AGE_DAYS,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    EMBEDDING_DEVICE,
+    EMBED_MAX_BATCH,
+    EMBED_MAX_WAIT_MS,
+)
+
+EMBEDDING_DIM = 512
+
+# Vectorizer đơn giản, 512 chiều (backend "hashing")
 _vectorizer = HashingVectorizer(
-    n_features=512,
+    n_features=EMBEDDING_DIM,
     alternate_sign=False,
     norm=None
 )
 
+# Vectorizer cho chế độ sparse, cache theo n_features
+_sparse_vectorizers: Dict[int, HashingVectorizer] = {EMBEDDING_DIM: _vectorizer}
+
+
+def _get_vectorizer(n_features: int) -> HashingVectorizer:
+    vec = _sparse_vectorizers.get(n_features)
+    if vec is None:
+        vec = HashingVectorizer(
+            n_features=n_features,
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float32,
+        )
+        _sparse_vectorizers[n_features] = vec
+    return vec
+
+
+# ====== BACKEND ======
+# Mỗi backend có: config (chuỗi định danh, ghi vào header store + khoá cache),
+# dim, encode(texts) -> ndarray float32 (n, dim), micro_batch.
+
+class HashingBackend:
+    """
+    HashingVectorizer (mặc định): không cần model, embed 1 câu chỉ vài chục µs.
+    """
+
+    micro_batch = False
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.config = f"hashing-{dim}"
+        self._vectorizer = _vectorizer if dim == EMBEDDING_DIM else _get_vectorizer(dim)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self._vectorizer.transform(texts).toarray().astype("float32")
+
+
+class SentenceTransformerBackend:
+    """
+    Model sentence-transformers chạy CPU. Model chỉ được import/load ở lần
+    dùng đầu tiên; query đồng thời được gom batch (micro_batch) nên mỗi lần
+    forward phục vụ nhiều request.
+    """
+
+    micro_batch = True
+
+    def __init__(self, model_name: str, device: str = "cpu", batch_size: int = 32):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.config = f"st-{model_name}"
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    # import nặng (torch), chỉ làm khi thật sự cần
+                    from sentence_transformers import SentenceTransformer
+
+                    self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return self._load().get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self._load().encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ).astype(np.float32)
+
+
+class MicroBatcher:
+    """
+    Gom các lời gọi encode đồng thời thành 1 batch: thread nền lấy text từ
+    hàng đợi, chờ tối đa max_wait giây (hoặc tới khi đủ max_batch) rồi encode 1 lần.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch: int, max_wait: float):
+        self._encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+        futures = []
+        for text in texts:
+            fut: Future = Future()
+            self._queue.put((text, fut))
+            futures.append(fut)
+        return np.stack([f.result() for f in futures])
+
+    def _run(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                vecs = self._encode([text for text, _ in items])
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), vec in zip(items, vecs):
+                fut.set_result(vec)
+
+
+_backend = None
+_batcher: Optional[MicroBatcher] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Backend theo EMBEDDING_BACKEND, tạo 1 lần / process (chưa load model).
+    """
+    global _backend, _batcher
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if EMBEDDING_BACKEND == "hashing":
+                    backend = HashingBackend()
+                elif EMBEDDING_BACKEND in ("sentence-transformers", "st"):
+                    backend = SentenceTransformerBackend(EMBEDDING_MODEL, EMBEDDING_DEVICE)
+                else:
+                    raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: {EMBEDDING_BACKEND}")
+                if backend.micro_batch:
+                    _batcher = MicroBatcher(backend.encode, EMBED_MAX_BATCH, EMBED_MAX_WAIT_MS / 1000)
+                _backend = backend
+    return _backend
+
+
+def embedding_dim() -> int:
+    return get_backend().dim
+
+
+def embedding_id() -> str:
+    """
+    Định danh backend + model, ghi vào header vector store để phát hiện lệch.
+    """
+    return get_backend().config
+
+
+# ====== CACHE ======
+# LRU trên RAM: khoá = sha1(cấu hình vectorizer + text đã chuẩn hoá khoảng trắng),
+# giá trị = 1 dòng embedding (ndarray hoặc CSR 1 dòng). Tầng đĩa (SQLite, chỉ
+# cho dense) bật bằng enable_disk_cache(), dùng khi ingest lại corpus.
+
+class DiskEmbeddingCache:
+    """
+    Mỗi dòng lưu kèm ts = lần dùng cuối (giây, đọc trúng cũng cập nhật).
+    Giới hạn: tối đa max_rows dòng (vượt thì xoá các dòng dùng lâu nhất) và
+    bỏ dòng không dùng quá max_age_days ngày; 0 = không giới hạn.
+    """
+
+    def __init__(self, path: Path, max_rows: int = 0, max_age_days: float = 0):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        self.pruned = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS emb (key TEXT PRIMARY KEY, vec BLOB)")
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(emb)")]
+            if "ts" not in columns:
+                # file cache cũ chưa có cột ts: coi mọi dòng như vừa dùng
+                self._conn.execute("ALTER TABLE emb ADD COLUMN ts INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE emb SET ts = ?", (int(time.time()),))
+            self._conn.execute("CREATE INDEX IF NOT EXISTS emb_ts ON emb (ts)")
+        with self._lock:
+            self._rows = self._count()
+            self._prune()
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM emb").fetchone()[0]
+
+    def _prune(self) -> None:
+        # gọi khi đang giữ _lock
+        with self._conn:
+            if self.max_age_days > 0:
+                cutoff = int(time.time() - self.max_age_days * 86400)
+                self.pruned += self._conn.execute("DELETE FROM emb WHERE ts < ?", (cutoff,)).rowcount
+            self._rows = self._count()
+            if self.max_rows > 0 and self._rows > self.max_rows:
+                # xoá xuống 90% giới hạn để không phải dọn lại ở mỗi lần ghi sau đó
+                self.pruned += self._conn.execute(
+                    "DELETE FROM emb WHERE key IN (SELECT key FROM emb ORDER BY ts LIMIT ?)",
+                    (self._rows - int(self.max_rows * 0.9),),
+                ).rowcount
+                self._rows = self._count()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        out: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                query = f"SELECT key, vec FROM emb WHERE key IN ({','.join('?' * len(part))})"
+                for key, blob in self._conn.execute(query, part):
+                    out[key] = np.frombuffer(blob, dtype=np.float32)
+            if out:
+                now = int(time.time())
+                with self._conn:
+                    self._conn.executemany("UPDATE emb SET ts = ? WHERE key = ?", [(now, k) for k in out])
+        return out
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        now = int(time.time())
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO emb (key, vec, ts) VALUES (?, ?, ?)",
+                    [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items.items()],
+                )
+            # số dòng ước lượng (dòng thay thế cũng được cộng): chỉ đếm lại
+            # và xoá bớt khi có thể đã vượt giới hạn
+            self._rows += len(items)
+            if self.max_rows > 0 and self._rows > self.max_rows:
+                self._prune()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._count()
+        return {
+            "path": str(self.path),
+            "rows": rows,
+            "bytes": self.path.stat().st_size if self.path.exists() else 0,
+            "max_rows": self.max_rows,
+            "max_age_days": self.max_age_days,
+            "pruned": self.pruned,
+        }
+
+
+_cache_lock = threading.Lock()
+_cache: "OrderedDict[str, Any]" = OrderedDict()
+_cache_stats = {"hits": 0, "misses": 0, "disk_hits": 0}
+_disk_cache: Optional[DiskEmbeddingCache] = None
+
+
+def enable_disk_cache(path: Path) -> None:
+    global _disk_cache
+    _disk_cache = DiskEmbeddingCache(path, EMBED_DISK_CACHE_MAX_ROWS, EMBED_DISK_CACHE_MAX_AGE_DAYS)
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["size"] = len(_cache)
+    stats["max_size"] = EMBED_CACHE_SIZE
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / total if total else 0.0
+    stats["disk"] = _disk_cache.stats() if _disk_cache else None
+    return stats
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+        for k in _cache_stats:
+            _cache_stats[k] = 0
+
+
+def _cache_key(config: str, text: str) -> str:
+    norm = " ".join(text.split())
+    return hashlib.sha1(f"{config}\x00{norm}".encode("utf-8")).hexdigest()
+
+
+def _cached_rows(
+    texts: List[str], config: str, compute: Callable[[List[str]], Any], use_disk: bool
+) -> List[Any]:
+    """
+    Embedding từng text (mỗi phần tử = 1 dòng), chỉ tính những text chưa có
+    trong cache; text trùng nhau trong cùng batch chỉ tính 1 lần.
+    """
+    keys = [_cache_key(config, t) for t in texts]
+    found: Dict[str, Any] = {}
+    with _cache_lock:
+        for key in keys:
+            row = _cache.get(key)
+            if row is not None:
+                _cache.move_to_end(key)
+                found[key] = row
+        _cache_stats["hits"] += sum(1 for k in keys if k in found)
+        _cache_stats["misses"] += sum(1 for k in keys if k not in found)
+
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            missing.setdefault(key, text)
+
+    new: Dict[str, Any] = {}
+    if missing and use_disk and _disk_cache is not None:
+        new = _disk_cache.get_many(list(missing))
+        with _cache_lock:
+            _cache_stats["disk_hits"] += len(new)
+        for key in new:
+            del missing[key]
+    if missing:
+        computed = compute(list(missing.values()))
+        fresh = {key: computed[i] for i, key in enumerate(missing)}
+        if use_disk and _disk_cache is not None:
+            _disk_cache.put_many(fresh)
+        new.update(fresh)
+
+    if new and EMBED_CACHE_SIZE > 0:
+        with _cache_lock:
+            _cache.update(new)
+            while len(_cache) > EMBED_CACHE_SIZE:
+                _cache.popitem(last=False)
+    found.update(new)
+    return [found[key] for key in keys]
+
+
+def _compute_dense(texts: List[str]) -> np.ndarray:
+    backend = get_backend()
+    if _batcher is not None:
+        return _batcher.encode(texts)
+    return backend.encode(texts)
+
+
 def embed_texts(texts: List[str]) -> np.ndarray:
     """
-    Nhận list string, trả về np.ndarray (n_samples, dim)
+    Nhận list string, trả về np.ndarray (n_samples, dim) theo backend đang cấu hình
+    """
+    if not texts:
+        return np.empty((0, embedding_dim()), dtype="float32")
+    rows = _cached_rows(texts, embedding_id(), _compute_dense, use_disk=True)
+    return np.stack(rows).astype("float32", copy=False)
+
+
+def embed_texts_sparse(texts: List[str], n_features: int = SPARSE_N_FEATURES) -> sparse.csr_matrix:
+    """
+    Như embed_texts nhưng giữ nguyên dạng CSR (không .toarray()),
+    nên có thể dùng n_features lớn (vd 2**18) để giảm va chạm hash.
     """
+    vec = _get_vectorizer(n_features)
     if not texts:
-        return np.empty((0, 512), dtype="float32")
-    X = _vectorizer.transform(texts)
-    return X.toarray().astype("float32")
+        return sparse.csr_matrix((0, n_features), dtype=np.float32)
+
+    def compute(batch: List[str]) -> List[sparse.csr_matrix]:
+        X = vec.transform(batch).astype(np.float32).tocsr()
+        return [X[i] for i in range(X.shape[0])]
+
+    rows = _cached_rows(texts, f"hashing-sparse-{n_features}", compute, use_disk=False)
+    return sparse.vstack(rows, format="csr")
 
 
 def embed_text(text: str) -> np.ndarray:
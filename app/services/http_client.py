@@ -0,0 +1,72 @@
+# app/services/http_client.py
+# Session HTTP dùng chung (connection pool + keep-alive) cho các client gọi
+# dịch vụ ngoài (Ollama, Tavily): không phải mở TCP/TLS mới cho mỗi lần gọi.
+# - requests.Session: cho code sync (script, thread)
+# - httpx.AsyncClient: cho đường /chat async, chờ I/O không chiếm thread
+import threading
+from typing import Dict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import ASYNC_HTTP_MAX_CONNECTIONS, HTTP_POOL_SIZE
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def make_session(pool_size: int = HTTP_POOL_SIZE) -> requests.Session:
+    session = requests.Session()
+    # pool_maxsize = số kết nối giữ lại cho mỗi host; pool_block=False: vượt
+    # quá thì vẫn mở kết nối tạm thay vì chờ
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(name: str) -> requests.Session:
+    """
+    Session theo tên (vd "ollama", "tavily"), tạo 1 lần / process.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = make_session()
+                _sessions[name] = session
+    return session
+
+
+def close_sessions() -> None:
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get_async_client(name: str) -> httpx.AsyncClient:
+    """
+    AsyncClient theo tên, tạo 1 lần / process. Chỉ gọi từ event loop của app
+    (kết nối trong pool gắn với loop đã mở nó). Timeout truyền theo từng lần gọi.
+    """
+    client = _async_clients.get(name)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+            ),
+        )
+        _async_clients[name] = client
+    return client
+
+
+async def aclose_clients() -> None:
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    for client in clients:
+        await client.aclose()
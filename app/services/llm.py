@@ -1,31 +1,109 @@
 # app/services/llm.py
-from typing import List, Dict
+from typing import Any, AsyncIterator, Dict, List
+import json
+import httpx
 import requests
-from app.config import OLLAMA_BASE_URL, OLLAMA_CHAT_MODEL
+from app.config import (
+    OLLAMA_BASE_URL,
+    OLLAMA_CHAT_MODEL,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+)
+from app.services.admission import PRIORITY_ANSWER, llm_admission
+from app.services.http_client import get_async_client, get_session
 
 
 class LLMError(RuntimeError):
     pass
 
 
-def chat_llm(messages: List[Dict[str, str]]) -> str:
-    """
-    messages: [{"role": "system"|"user"|"assistant", "content": "..."}]
-    Gọi Ollama /api/chat, có xử lý lỗi cơ bản.
-    """
-    payload = {
+def _chat_payload(messages: List[Dict[str, str]], stream: bool = False) -> Dict[str, Any]:
+    return {
         "model": OLLAMA_CHAT_MODEL,
         "messages": messages,
-        "stream": False,
+        "stream": stream,
     }
+
+
+def _answer(data: Dict[str, Any]) -> str:
+    try:
+        return data["message"]["content"].strip()
+    except (KeyError, TypeError):
+        raise LLMError("Phản hồi từ LLM không đúng định dạng mong đợi.")
+
+
+def chat_llm(messages: List[Dict[str, str]], priority: int = PRIORITY_ANSWER) -> str:
+    """
+    messages: [{"role": "system"|"user"|"assistant", "content": "..."}]
+    Gọi Ollama /api/chat qua session dùng chung (keep-alive), có xử lý lỗi cơ bản.
+    Mỗi lời gọi phải có chỗ trong llm_admission (priority thấp = được cấp trước);
+    quá tải thì ném admission.OverloadedError.
+    """
     url = f"{OLLAMA_BASE_URL}/api/chat"
 
     try:
-        r = requests.post(url, json=payload, timeout=300)
+        with llm_admission.slot(priority):
+            r = get_session("ollama").post(
+                url, json=_chat_payload(messages), timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+            )
         r.raise_for_status()
         data = r.json()
-        return data["message"]["content"].strip()
     except requests.exceptions.RequestException as e:
         raise LLMError(f"Lỗi khi gọi LLM tại {url}: {e}")
-    except KeyError:
-        raise LLMError("Phản hồi từ LLM không đúng định dạng mong đợi.")
+    return _answer(data)
+
+
+async def achat_llm(messages: List[Dict[str, str]], priority: int = PRIORITY_ANSWER) -> str:
+    """
+    Bản async của chat_llm (client httpx dùng chung): trong lúc chờ Ollama
+    sinh câu trả lời, event loop vẫn phục vụ request khác.
+    """
+    url = f"{OLLAMA_BASE_URL}/api/chat"
+
+    try:
+        async with llm_admission.aslot(priority):
+            r = await get_async_client("ollama").post(
+                url,
+                json=_chat_payload(messages),
+                timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            )
+        r.raise_for_status()
+        data = r.json()
+    except (httpx.HTTPError, ValueError) as e:
+        raise LLMError(f"Lỗi khi gọi LLM tại {url}: {e}")
+    return _answer(data)
+
+
+async def astream_chat_llm(
+    messages: List[Dict[str, str]], priority: int = PRIORITY_ANSWER
+) -> AsyncIterator[str]:
+    """
+    Như achat_llm nhưng "stream": True: Ollama trả từng dòng JSON
+    ({"message": {"content": "..."}, "done": false}), yield từng đoạn text ngay
+    khi nhận được. Read timeout tính giữa 2 đoạn liên tiếp, không phải cả câu trả lời.
+    Đóng generator giữa chừng (client ngắt) -> đóng kết nối, Ollama dừng sinh.
+    Giữ chỗ trong llm_admission suốt thời gian stream.
+    """
+    url = f"{OLLAMA_BASE_URL}/api/chat"
+
+    try:
+        async with llm_admission.aslot(priority), get_async_client("ollama").stream(
+            "POST",
+            url,
+            json=_chat_payload(messages, stream=True),
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+        ) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise LLMError(f"LLM báo lỗi: {data['error']}")
+                token = (data.get("message") or {}).get("content", "")
+                if token:
+                    yield token
+                if data.get("done"):
+                    break
+    except (httpx.HTTPError, ValueError) as e:
+        raise LLMError(f"Lỗi khi gọi LLM tại {url}: {e}")
@@ -0,0 +1,101 @@
+# app/services/single_flight.py
+# Gộp các lời gọi trùng nhau đang chạy (single-flight): nhiều request cùng khoá
+# cùng lúc chỉ chạy 1 lần, tất cả nhận chung kết quả (hoặc chung exception).
+# - SingleFlight: code sync (thread)
+# - AsyncSingleFlight: code async (1 event loop)
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.calls: Dict[Hashable, _Call] = {}
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """
+        Chạy fn() nếu chưa có lời gọi nào cùng key đang chạy, ngược lại chờ
+        lời gọi đó xong và dùng chung kết quả / exception của nó.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # bỏ khoá trước khi báo xong: request đến sau lúc này chạy lượt mới
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+
+class _AsyncCall:
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """
+    Lời gọi chung chạy trong 1 Task riêng; mỗi request chờ qua asyncio.shield
+    nên 1 request bị huỷ (client ngắt) không huỷ kết quả của các request khác.
+    Chỉ khi mọi request đang chờ đều bị huỷ thì Task chung mới bị huỷ theo.
+    """
+
+    def __init__(self):
+        self.calls: Dict[Hashable, _AsyncCall] = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def _forget(self, key: Hashable, call: _AsyncCall) -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self.calls.get(key)
+        if call is None:
+            call = _AsyncCall(asyncio.ensure_future(fn()))
+            self.calls[key] = call
+            call.task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+            self.stats["calls"] += 1
+        else:
+            self.stats["coalesced"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # request cuối cùng còn chờ cũng bỏ đi: dừng lời gọi chung, và
+                # bỏ khoá ngay để request mới không bám vào Task đang bị huỷ
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
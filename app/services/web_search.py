@@ -1,36 +1,32 @@
 # app/services/web_search.py
-from typing import List
+from typing import Any, Dict, List
+import httpx
 import requests
-from app.config import TAVILY_API_KEY
+from app.config import TAVILY_API_KEY, TAVILY_CONNECT_TIMEOUT, TAVILY_READ_TIMEOUT
+from app.services.http_client import get_async_client, get_session
+
+TAVILY_URL = "https://api.tavily.com/search"
 
 
 class WebSearchError(RuntimeError):
     pass
 
 
-def web_search(query: str, num_results: int = 3) -> List[str]:
-    """
-    Search web bằng Tavily, trả về list snippet text.
-    """
-    if not TAVILY_API_KEY:
-        # Không ném exception để /chat vẫn chạy được
-        return [f"(Chưa cấu hình TAVILY_API_KEY trong .env, không thể search '{query}')"]
+def _missing_key(query: str) -> List[str]:
+    # Không ném exception để /chat vẫn chạy được
+    return [f"(Chưa cấu hình TAVILY_API_KEY trong .env, không thể search '{query}')"]
+
 
-    url = "https://api.tavily.com/search"
-    payload = {
+def _search_payload(query: str, num_results: int) -> Dict[str, Any]:
+    return {
         "api_key": TAVILY_API_KEY,
         "query": query,
         "search_depth": "basic",
         "max_results": num_results,
     }
 
-    try:
-        r = requests.post(url, json=payload, timeout=20)
-        r.raise_for_status()
-        data = r.json()
-    except requests.exceptions.RequestException as e:
-        raise WebSearchError(f"Lỗi khi gọi Tavily: {e}")
 
+def _snippets(data: Dict[str, Any], query: str, num_results: int) -> List[str]:
     snippets: List[str] = []
     for item in data.get("results", [])[:num_results]:
         title = item.get("title", "")
@@ -41,3 +37,43 @@ def web_search(query: str, num_results: int = 3) -> List[str]:
     if not snippets:
         snippets.append(f"(Không tìm thấy kết quả cho '{query}')")
     return snippets
+
+
+def web_search(query: str, num_results: int = 3) -> List[str]:
+    """
+    Search web bằng Tavily, trả về list snippet text.
+    """
+    if not TAVILY_API_KEY:
+        return _missing_key(query)
+
+    try:
+        r = get_session("tavily").post(
+            TAVILY_URL,
+            json=_search_payload(query, num_results),
+            timeout=(TAVILY_CONNECT_TIMEOUT, TAVILY_READ_TIMEOUT),
+        )
+        r.raise_for_status()
+        data = r.json()
+    except requests.exceptions.RequestException as e:
+        raise WebSearchError(f"Lỗi khi gọi Tavily: {e}")
+    return _snippets(data, query, num_results)
+
+
+async def aweb_search(query: str, num_results: int = 3) -> List[str]:
+    """
+    Bản async của web_search (client httpx dùng chung).
+    """
+    if not TAVILY_API_KEY:
+        return _missing_key(query)
+
+    try:
+        r = await get_async_client("tavily").post(
+            TAVILY_URL,
+            json=_search_payload(query, num_results),
+            timeout=httpx.Timeout(TAVILY_READ_TIMEOUT, connect=TAVILY_CONNECT_TIMEOUT),
+        )
+        r.raise_for_status()
+        data = r.json()
+    except (httpx.HTTPError, ValueError) as e:
+        raise WebSearchError(f"Lỗi khi gọi Tavily: {e}")
+    return _snippets(data, query, num_results)
@@ -0,0 +1,73 @@
+# So sánh recall@k và độ trễ của IVF index với search exact.
+#   python -m scripts.bench_ann --store default
+#   python -m scripts.bench_ann --synthetic 200000
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+from app.rag.ann import IVFIndex
+from app.rag.scoring import normalize_rows, top_k_indices
+from app.rag.vector_store import SimpleVectorStore
+from app.services.embeddings import EMBEDDING_DIM, embed_texts
+
+
+def synthetic_corpus(n: int, dim: int, n_topics: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Corpus giả lập giống vector hashing (không âm, gom theo chủ đề), đã chuẩn hoá.
+    """
+    topics = rng.gamma(0.3, size=(n_topics, dim)).astype(np.float32)
+    labels = rng.integers(0, n_topics, size=n)
+    x = topics[labels] + rng.gamma(0.3, size=(n, dim)).astype(np.float32)
+    return normalize_rows(x, copy=False)
+
+
+def bench(embeddings: np.ndarray, queries: np.ndarray, top_k: int, n_lists, nprobes: List[int]) -> None:
+    t0 = time.perf_counter()
+    index = IVFIndex.build(embeddings, n_lists=n_lists)
+    print(f"n={embeddings.shape[0]} dim={embeddings.shape[1]} lists={index.n_lists} "
+          f"build={time.perf_counter() - t0:.2f}s queries={queries.shape[0]} k={top_k}")
+
+    exact = []
+    t0 = time.perf_counter()
+    for q in queries:
+        exact.append(top_k_indices(embeddings @ q, top_k))
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    print(f"{'exact':>10}  recall@{top_k}=1.000  {exact_ms:8.3f} ms/query")
+
+    for nprobe in nprobes:
+        hits = 0
+        t0 = time.perf_counter()
+        for q, ref in zip(queries, exact):
+            idx, _ = index.search(embeddings, q[None, :], top_k, nprobe)
+            hits += len(set(idx[0].tolist()) & set(ref.tolist()))
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        recall = hits / max(1, sum(len(r) for r in exact))
+        print(f"{'nprobe=' + str(nprobe):>10}  recall@{top_k}={recall:.3f}  {ms:8.3f} ms/query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark IVF index so với search exact.")
+    parser.add_argument("--store", default="default", help="Tên vector store (dense)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Dùng corpus giả lập N dòng thay cho store")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        emb = synthetic_corpus(args.synthetic, EMBEDDING_DIM, n_topics=max(8, args.synthetic // 500), rng=rng)
+        picks = rng.choice(emb.shape[0], args.queries, replace=False)
+        # query = chunk có sẵn + nhiễu
+        queries = normalize_rows(emb[picks] + 0.5 * rng.random((args.queries, emb.shape[1]), dtype=np.float32))
+    else:
+        vs = SimpleVectorStore(name=args.store, sparse=False)
+        emb = np.asarray(vs.embeddings)
+        picks = rng.choice(len(vs.texts), min(args.queries, len(vs.texts)), replace=False)
+        # query = 30 từ đầu của các chunk lấy mẫu
+        queries = normalize_rows(embed_texts([" ".join(vs.texts[i].split()[:30]) for i in picks]), copy=False)
+
+    bench(emb, queries, args.top_k, args.lists, args.nprobe)
@@ -0,0 +1,69 @@
+# So sánh requests.post trần (mỗi lần 1 kết nối mới) với session dùng chung
+# (keep-alive) khi gọi chat_llm, dùng 1 server giả lập Ollama chạy local.
+#   python -m scripts.bench_http --calls 500 --threads 8
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.services import llm
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # cho phép keep-alive
+    # header và body ghi 2 lần: tắt Nagle để không dính delayed-ACK (~40 ms)
+    # trên kết nối keep-alive, giống server thật
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"message": {"role": "assistant", "content": "ok"}}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def bare_call(url: str) -> str:
+    # cách gọi cũ: requests.post không session
+    r = requests.post(f"{url}/api/chat", json={"model": "x", "messages": [], "stream": False}, timeout=300)
+    r.raise_for_status()
+    return r.json()["message"]["content"]
+
+
+def run(fn, calls: int, threads: int) -> float:
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: fn(), range(calls)))
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark session HTTP dùng chung so với requests.post trần.")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    llm.OLLAMA_BASE_URL = url
+
+    messages = [{"role": "user", "content": "xin chào"}]
+    for name, fn in [
+        ("requests.post", lambda: bare_call(url)),
+        ("session", lambda: llm.chat_llm(messages)),
+    ]:
+        fn()  # warm-up
+        elapsed = run(fn, args.calls, args.threads)
+        print(f"{name:>14}: {args.calls} lần gọi, {args.threads} thread -> "
+              f"{elapsed * 1000 / args.calls:.3f} ms/lần, {args.calls / elapsed:.0f} lần/s")
+    server.shutdown()
@@ -0,0 +1,66 @@
+# So sánh recall@k và độ trễ của search 2 lượt (quét bản int8/float16 +
+# re-rank float32) với search exact float32.
+#   python -m scripts.bench_quant --store default
+#   python -m scripts.bench_quant --synthetic 200000
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+from app.rag.quantize import QUANT_MODES, QuantizedVectors
+from app.rag.scoring import normalize_rows, top_k_indices
+from app.rag.vector_store import SimpleVectorStore
+from app.services.embeddings import EMBEDDING_DIM, embed_texts
+from scripts.bench_ann import synthetic_corpus
+
+
+def bench(embeddings: np.ndarray, queries: np.ndarray, top_k: int, factors: List[int]) -> None:
+    print(f"n={embeddings.shape[0]} dim={embeddings.shape[1]} queries={queries.shape[0]} k={top_k}")
+
+    exact = []
+    t0 = time.perf_counter()
+    for q in queries:
+        exact.append(top_k_indices(embeddings @ q, top_k))
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    print(f"{'float32':>8} {'exact':>10}  recall@{top_k}=1.000  {exact_ms:8.3f} ms/query  "
+          f"{embeddings.nbytes / 2**20:8.1f} MiB")
+
+    for mode in QUANT_MODES:
+        quant = QuantizedVectors.build(embeddings, mode)
+        for factor in factors:
+            hits = 0
+            t0 = time.perf_counter()
+            for q, ref in zip(queries, exact):
+                approx = quant.scores(q[None, :])[0]
+                cand = np.sort(top_k_indices(approx, min(len(approx), top_k * factor)))
+                sims = embeddings[cand] @ q
+                idx = cand[top_k_indices(sims, top_k)]
+                hits += len(set(idx.tolist()) & set(ref.tolist()))
+            ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            recall = hits / max(1, sum(len(r) for r in exact))
+            print(f"{mode:>8} {'rerank x' + str(factor):>10}  recall@{top_k}={recall:.3f}  "
+                  f"{ms:8.3f} ms/query  {quant.nbytes / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark lượng tử hoá int8/float16 + re-rank so với exact.")
+    parser.add_argument("--store", default="default", help="Tên vector store (dense)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Dùng corpus giả lập N dòng thay cho store")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--factor", type=int, nargs="+", default=[1, 2, 5, 10])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        emb = synthetic_corpus(args.synthetic, EMBEDDING_DIM, n_topics=max(8, args.synthetic // 500), rng=rng)
+        picks = rng.choice(emb.shape[0], args.queries, replace=False)
+        queries = normalize_rows(emb[picks] + 0.5 * rng.random((args.queries, emb.shape[1]), dtype=np.float32))
+    else:
+        vs = SimpleVectorStore(name=args.store, sparse=False)
+        emb = np.asarray(vs.embeddings)
+        picks = rng.choice(len(vs.texts), min(args.queries, len(vs.texts)), replace=False)
+        queries = normalize_rows(embed_texts([" ".join(vs.texts[i].split()[:30]) for i in picks]), copy=False)
+
+    bench(emb, queries, args.top_k, args.factor)
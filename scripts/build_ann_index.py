@@ -0,0 +1,15 @@
+import argparse
+
+from app.rag.vector_store import SimpleVectorStore
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Xây IVF index (ANN) cho vector store dense.")
+    parser.add_argument("--store", default="default", help="Tên vector store")
+    parser.add_argument("--lists", type=int, default=None, help="Số cụm IVF (mặc định ~sqrt(n))")
+    parser.add_argument("--iters", type=int, default=10, help="Số vòng k-means")
+    args = parser.parse_args()
+
+    vs = SimpleVectorStore(name=args.store)
+    ann = vs.build_ann(n_lists=args.lists, n_iter=args.iters)
+    print(f"Đã xây IVF index cho store '{args.store}': {len(vs.texts)} chunks, {ann.n_lists} cụm -> {vs.ann_path}")
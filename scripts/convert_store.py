@@ -0,0 +1,14 @@
+import argparse
+
+from app.rag.vector_store import convert_to_mmap
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Chuyển vector store npy/pkl sang định dạng memory-map (dùng chung giữa các worker)."
+    )
+    parser.add_argument("--store", default="default", help="Tên vector store")
+    args = parser.parse_args()
+
+    vs = convert_to_mmap(args.store)
+    print(f"Đã chuyển store '{args.store}' sang định dạng mmap: {len(vs.texts)} chunks.")
@@ -1,18 +1,49 @@
+import argparse
+import hashlib
+import os
+import re
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, islice
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 
+import numpy as np
 from tqdm import tqdm
 
-from app.config import RAW_DIR
-from app.rag.loader import load_any, chunk_text
+from app.config import (
+    RAW_DIR,
+    VECTOR_STORE_DIR,
+    EMBED_DISK_CACHE_PATH,
+    QUANTIZE_MODE,
+    SEGMENT_COMPACT_MAX,
+)
+from app.rag.loader import (
+    SUPPORTED_EXTENSIONS,
+    content_hash,
+    iter_document_chunks,
+    iter_pages,
+    iter_pdf_pages,
+    pdf_page_count,
+)
+from app.rag.storage import atomic_write_json, read_json
+from app.rag.schedule_index import ScheduleIndex, SCHEDULE_INDEX_PATH
 from app.rag.vector_store import SimpleVectorStore
-from app.services.embeddings import embed_texts
+from app.services.embeddings import (
+    cache_stats,
+    embed_texts,
+    embed_texts_sparse,
+    embedding_id,
+    enable_disk_cache,
+)
 
 
 # Cấu hình metadata cho từng file (theo tên file trong RAW_DIR)
 FILE_CONFIG: Dict[str, Dict[str, Any]] = {
     # ví dụ: đặt file PDF vào RAW_DIR với đúng tên dưới đây
-    "Quy_che_đao_tao.pdf": {
+    "Quy_che_dao_tao.pdf": {
         "doc_id": "quy_che_dao_tao",
         "doc_type": "regulation",  # quy chế
         "title": "Quy chế đào tạo",
@@ -26,78 +57,407 @@ FILE_CONFIG: Dict[str, Dict[str, Any]] = {
         "doc_id": "lich_hoc_tuan_15_2025",
         "doc_type": "schedule",  # lịch học
         "title": "Lịch học tuần 15 (08–14/12/2025)",
+        "week": 15,
     },
     # thêm các file khác ở đây...
 }
 
 
+def _fold(text: str) -> str:
+    """
+    Chữ thường, bỏ dấu tiếng Việt (đ -> d): "Quy chế đào tạo" -> "quy che dao tao".
+    """
+    text = unicodedata.normalize("NFD", text.lower().replace("đ", "d"))
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
 def infer_metadata(path: Path) -> Dict[str, Any]:
     """
     Nếu file không nằm trong FILE_CONFIG thì suy ra metadata cơ bản.
     """
     name = path.name
     stem = path.stem
-    lower = stem.lower()
+    lower = _fold(stem)
 
-    # đoán sơ loại tài liệu theo tên file
+    # đoán sơ loại tài liệu theo tên file (đã bỏ dấu)
+    week_match = re.search(r"tuan[_\s-]*(\d+)", lower)
     if "quy_che" in lower or "quy che" in lower:
         doc_type = "regulation"
     elif "hoc_phi" in lower or "hoc phi" in lower:
         doc_type = "tuition"
-    elif "lich_hoc" in lower or "lich hoc" in lower:
+    elif "lich_hoc" in lower or "lich hoc" in lower or week_match:
         doc_type = "schedule"
     else:
         doc_type = "general"
 
-    return {
+    meta = {
         "doc_id": stem,
         "doc_type": doc_type,
         "title": name,
     }
+    if doc_type == "schedule" and week_match:
+        meta["week"] = int(week_match.group(1))
+    return meta
+
+
+def file_metadata(path: Path) -> Dict[str, Any]:
+    """
+    Metadata của 1 file: lấy từ FILE_CONFIG nếu có, ngược lại suy ra tự động.
+    """
+    # tên file trên đĩa có thể ở dạng Unicode NFD (vd macOS), khoá FILE_CONFIG là NFC
+    meta = FILE_CONFIG.get(unicodedata.normalize("NFC", path.name))
+    return meta if meta is not None else infer_metadata(path)
+
+
+def metadata_rank(path: Path) -> Tuple[int, int]:
+    """
+    Độ cụ thể của metadata 1 file: doc_type khác "general" hơn "general", có
+    trong FILE_CONFIG hơn suy ra tự động. Chunk trùng nội dung giữa nhiều file
+    được gắn metadata của file cụ thể nhất.
+    """
+    in_config = unicodedata.normalize("NFC", path.name) in FILE_CONFIG
+    return (int(file_metadata(path).get("doc_type") != "general"), int(in_config))
+
+
+# PDF dài hơn số trang này được chia thành nhiều task (mỗi task 1 khoảng trang)
+PAGES_PER_TASK = 16
+
+
+def _extract(task: Tuple[Path, int, int]) -> List[str]:
+    """
+    Chạy trong worker: đọc các trang [start, end) của PDF, hoặc cả file (start = end = 0).
+    """
+    path, start, end = task
+    if end > start:
+        return list(iter_pdf_pages(path, start, end))
+    return list(iter_pages(path))
+
+
+def _plan_tasks(files: List[Path]) -> Tuple[List[Tuple[Path, int, int]], List[int]]:
+    """
+    Chia việc đọc file thành các task; owners[i] = vị trí trong files của task i.
+    """
+    tasks: List[Tuple[Path, int, int]] = []
+    owners: List[int] = []
+    for i, path in enumerate(files):
+        n_pages = pdf_page_count(path) if path.suffix.lower() == ".pdf" else 0
+        if n_pages > PAGES_PER_TASK:
+            for start in range(0, n_pages, PAGES_PER_TASK):
+                tasks.append((path, start, min(start + PAGES_PER_TASK, n_pages)))
+                owners.append(i)
+        else:
+            tasks.append((path, 0, 0))
+            owners.append(i)
+    return tasks, owners
+
+
+def _ordered_map(executor: ProcessPoolExecutor, fn, items: List, window: int) -> Iterator:
+    """
+    Như executor.map nhưng chỉ cho tối đa window task chạy trước phần đang
+    được tiêu thụ, nên kết quả chờ xử lý không dồn lại trong RAM.
+    """
+    it = iter(items)
+    pending = deque(executor.submit(fn, x) for x in islice(it, window))
+    while pending:
+        result = pending.popleft().result()
+        for x in islice(it, 1):
+            pending.append(executor.submit(fn, x))
+        yield result
+
+
+def _supported(path: Path) -> bool:
+    return path.suffix.lower() in SUPPORTED_EXTENSIONS
+
+
+def extract_pages(files: List[Path], workers: int = 1) -> Iterator[Tuple[Path, Optional[Iterator[str]]]]:
+    """
+    Yield lần lượt (path, các trang text) theo đúng thứ tự files; các trang là
+    iterator lười, phải đọc hết trước khi sang file kế tiếp (None nếu định
+    dạng không hỗ trợ).
+    workers > 1: đọc song song bằng process pool, theo file và theo khoảng trang
+    của PDF lớn; kết quả vẫn theo thứ tự nên ingest cho ra cùng 1 store.
+    """
+    if workers <= 1:
+        for path in files:
+            yield path, (iter_pages(path) if _supported(path) else None)
+        return
+
+    supported = [p for p in files if _supported(p)]
+    tasks, owners = _plan_tasks(supported)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        results = _ordered_map(executor, _extract, tasks, window=2 * workers)
+        groups = groupby(zip(owners, results), key=itemgetter(0))
+        for path in files:
+            if not _supported(path):
+                yield path, None
+                continue
+            _, group = next(groups)
+            yield path, (page for _, pages in group for page in pages)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _add_batch(vs: SimpleVectorStore, batch: List[tuple[str, Dict[str, Any]]], sparse: bool) -> None:
+    texts = [t for (t, _) in batch]
+    metas = [m for (_, m) in batch]
+    emb = embed_texts_sparse(texts, n_features=vs.dim) if sparse else embed_texts(texts)
+    vs.add(emb, texts, metas)
+
+
+def _file_hash(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def ingest_manifest_path(store_name: str) -> Path:
+    return VECTOR_STORE_DIR / f"{store_name}_ingest.json"
+
+
+def _scan_changes(
+    folder: Path, files: List[Path], previous: Dict[str, Dict[str, Any]]
+) -> Tuple[Dict[str, Dict[str, Any]], List[Path]]:
+    """
+    So các file hiện có với manifest lần ingest trước.
+    Trả về (entry mới theo đường dẫn tương đối, các file cần ingest).
+    Chỉ băm nội dung khi size/mtime khác lần trước.
+    """
+    entries: Dict[str, Dict[str, Any]] = {}
+    changed: List[Path] = []
+    for path in files:
+        rel = path.relative_to(folder).as_posix()
+        st = path.stat()
+        old = previous.get(rel)
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            entry["sha1"] = old["sha1"]
+        else:
+            entry["sha1"] = _file_hash(path)
+        if old and old["sha1"] == entry["sha1"]:
+            entry.update({k: old[k] for k in ("chunks", "dup_of") if k in old})
+        else:
+            changed.append(path)
+        entries[rel] = entry
+    return entries, changed
+
+
+def _known_hashes(vs: SimpleVectorStore) -> Dict[str, str]:
+    """
+    content_hash -> source của các chunk đang có trong store.
+    """
+    if "content_hash" not in vs.meta.values:
+        return {}
+    hashes = vs.meta.values["content_hash"]
+    sources, source_codes = vs.meta.columns["source"]
+    return {
+        h: sources[s]
+        for h, s in zip(hashes.tolist(), source_codes.tolist())
+        if h
+    }
 
 
-def ingest_folder(folder: Path, store_name: str = "default"):
+def ingest_folder(
+    folder: Path,
+    store_name: str = "default",
+    sparse: bool = False,
+    workers: int = 1,
+    full: bool = False,
+    batch_size: int = 32,
+):
     """
-    Đọc tất cả file trong RAW_DIR, chunk text, tạo embedding và lưu vào vector store.
-    Mỗi chunk đều kèm metadata (doc_id, doc_type, title).
+    Đọc các file trong RAW_DIR, chunk text, tạo embedding và lưu vào vector store.
+    Mỗi chunk đều kèm metadata (doc_id, doc_type, title, source = đường dẫn tương đối,
+    page, char_start, char_end, section, content_hash).
+    Chunk theo trang / "Điều", không chồng lấn (iter_document_chunks); chunk
+    gần trùng với chunk đã có (cùng content_hash, kể cả của file khác) bị bỏ qua,
+    trừ khi file mới có metadata cụ thể hơn (metadata_rank): khi đó chunk cũ bị
+    thay bằng chunk của file mới. File đổi/mới được đọc theo thứ tự metadata cụ
+    thể nhất trước.
+    sparse=True: lưu embedding dạng CSR (SPARSE_N_FEATURES chiều) thay vì dense 512 chiều.
+    Store mở ở layout segment: mỗi batch ghi thành 1 segment mới, cuối cùng gộp
+    các segment của lần chạy này (compact(since_id=...)).
+    File lịch học (doc_type "schedule", PDF) được parse thêm vào index lịch học
+    có cấu trúc (tra theo mã lớp + tuần).
+    workers > 1: đọc/trích text song song (xem extract_pages).
+    Streaming: trang -> từ -> chunk được đọc lười và embedding theo batch
+    batch_size ngay khi đủ; mỗi batch ghi thẳng ra segment, RAM chỉ giữ
+    metadata, compact() cuối cùng đọc lại lần lượt từng segment, nên RAM và số
+    file descriptor không tăng theo số batch.
+
+    Ingest tăng dần: {store}_ingest.json lưu (size, mtime, sha1, khoảng chunk id)
+    của từng file. Lần chạy sau chỉ ingest file mới/đã đổi, xoá chunk của file
+    đã đổi/đã xoá, bỏ qua file không đổi. full=True (hoặc chưa có manifest):
+    xoá toàn bộ store và ingest lại từ đầu. Thư mục không tồn tại, hoặc dựng lại
+    toàn bộ mà thư mục không có file hỗ trợ nào: dừng, không đụng tới store cũ.
     """
-    vs = SimpleVectorStore(name=store_name)
+    if not folder.is_dir():
+        print(f"Không tìm thấy thư mục {folder}: giữ nguyên store.")
+        return
+    files = sorted(p for p in folder.glob("**/*") if p.is_file())
+    vs = SimpleVectorStore(name=store_name, sparse=sparse, segmented=True)
+    manifest_path = ingest_manifest_path(store_name)
+    previous: Dict[str, Dict[str, Any]] = {}
+    if not full and manifest_path.exists():
+        previous = read_json(manifest_path).get("files", {})
+    if previous and not vs.sparse and vs.embedding not in (None, embedding_id()):
+        print(f"Backend embedding đổi ({vs.embedding} -> {embedding_id()}): ingest lại toàn bộ.")
+        previous = {}
+    if previous:
+        schedule = ScheduleIndex.load(SCHEDULE_INDEX_PATH)
+    elif not any(_supported(p) for p in files):
+        # RAW_DIR rỗng / cấu hình sai: không xoá store cũ khi chưa có gì thay vào
+        print(f"Không có file hỗ trợ ({', '.join(sorted(SUPPORTED_EXTENSIONS))}) trong {folder}: giữ nguyên store.")
+        return
+    else:
+        # store cũ không rõ chunk nào thuộc file nào -> dựng lại toàn bộ
+        vs.delete(np.arange(len(vs.meta)))
+        schedule = ScheduleIndex()
+
+    entries, changed = _scan_changes(folder, files, previous)
+    # file đã đổi/đã xoá: bỏ chunk cũ (file mới cũng xoá theo source phòng
+    # trường hợp lần trước bị ngắt giữa chừng trước khi ghi manifest)
+    deleted = [rel for rel in previous if rel not in entries]
+    stale = deleted + [p.relative_to(folder).as_posix() for p in changed]
+    # file từng bỏ chunk vì trùng với file nay bị đổi/xoá -> ingest lại cho đủ
+    grown = True
+    while grown:
+        grown = False
+        for rel, entry in entries.items():
+            if rel not in stale and set(entry.get("dup_of", [])) & set(stale):
+                stale.append(rel)
+                changed.append(folder / rel)
+                grown = True
+    # file có metadata cụ thể hơn đọc trước -> giữ chunk khi trùng với file khác
+    changed.sort(key=lambda p: (tuple(-r for r in metadata_rank(p)), p))
+    if not stale:
+        if entries != previous:
+            # chỉ mtime đổi (nội dung như cũ): cập nhật để lần sau khỏi băm lại
+            atomic_write_json(manifest_path, {"version": 1, "files": entries})
+        print("Không có thay đổi.")
+        return
 
-    files = [p for p in folder.glob("**/*") if p.is_file()]
-    all_chunks: List[tuple[str, Dict[str, Any]]] = []
+    # chỉ các segment chứa chunk của file đã đổi/đã xoá bị ghi lại
+    n_removed = vs.delete(vs.meta.rows({"source": stale}))
+    schedule.remove_sources(stale)
+    first_new = (vs.manifest or {}).get("next_id", 1)
+    print(f"Đổi/mới: {len(changed)} file, đã xoá: {len(deleted)} file, bỏ {n_removed} chunk cũ")
 
-    for path in tqdm(files, desc="Đọc file"):
-        try:
-            text = load_any(path)
-        except ValueError:
+    seen = _known_hashes(vs)
+    # content_hash -> file đang giữ chunk đó trong store, bị thay vì file mới cụ thể hơn
+    displaced: Dict[str, str] = {}
+    pending: List[tuple[str, Dict[str, Any]]] = []
+    n_chunks = 0
+    n_dups = 0
+
+    for path, pages in tqdm(extract_pages(changed, workers), total=len(changed), desc="Đọc file"):
+        if pages is None:
             print(f"Bỏ qua (không hỗ trợ định dạng): {path}")
             continue
 
-        chunks = chunk_text(text)
-
-        # lấy metadata từ FILE_CONFIG nếu có, ngược lại suy ra tự động
-        meta = FILE_CONFIG.get(path.name)
-        if meta is None:
-            meta = infer_metadata(path)
+        meta = file_metadata(path)
+        rank = metadata_rank(path)
+        rel = path.relative_to(folder).as_posix()
+        dup_of = set()
 
-        for ch in chunks:
-            all_chunks.append((ch, meta))
+        for ch in iter_document_chunks(path, pages):
+            key = content_hash(ch["text"])
+            owner = seen.get(key)
+            if owner == rel or (owner is not None and metadata_rank(folder / owner) >= rank):
+                n_dups += 1
+                if owner != rel:
+                    dup_of.add(owner)
+                continue
+            if owner is not None:
+                # chunk của file không đổi (đã nằm trong store) nhưng metadata kém
+                # cụ thể hơn: thêm bản của file này, bỏ bản cũ sau khi compact;
+                # file cũ ghi nhận trùng để được ingest lại nếu file này đổi/xoá
+                displaced[key] = owner
+                entries[owner]["dup_of"] = sorted(set(entries[owner].get("dup_of", [])) | {rel})
+            seen[key] = rel
+            pending.append((ch["text"], {
+                **meta,
+                "source": rel,
+                "page": ch["page"],
+                "char_start": ch["char_start"],
+                "char_end": ch["char_end"],
+                "section": ch["section"],
+                "content_hash": key,
+            }))
+            n_chunks += 1
+            if len(pending) == batch_size:
+                _add_batch(vs, pending, sparse)
+                pending = []
+        entries[rel]["dup_of"] = sorted(dup_of)
 
-    print(f"Tổng số chunks: {len(all_chunks)}")
+        if meta.get("doc_type") == "schedule" and path.suffix.lower() == ".pdf":
+            try:
+                n_rows = schedule.add_document(path, {**meta, "source": rel})
+                print(f"Lịch học {path.name}: {n_rows} dòng")
+            except Exception as e:
+                print(f"Không parse được bảng lịch học {path}: {e}")
 
-    batch_size = 32
-    for i in tqdm(range(0, len(all_chunks), batch_size), desc="Tạo embedding"):
-        batch = all_chunks[i:i + batch_size]
-        texts = [t for (t, _) in batch]
-        metas = [m for (_, m) in batch]
+    if pending:
+        _add_batch(vs, pending, sparse)
+    print(f"Số chunks mới: {n_chunks} (bỏ {n_dups} chunk trùng), tổng trong store: {len(vs.meta)}")
+    stats = cache_stats()
+    print(f"Cache embedding: {stats['hits']} hit RAM, {stats['disk_hits']} hit đĩa, {stats['misses']} miss")
 
-        emb = embed_texts(texts)
-        # YÊU CẦU: SimpleVectorStore.add phải nhận được metadatas
-        vs.add(emb, texts)
+    # gộp các batch của lần chạy này thành 1 segment; segment cũ giữ nguyên để
+    # lần sau đổi 1 file chỉ phải ghi lại segment chứa file đó. Quá nhiều
+    # segment (nhiều lần ingest tăng dần) thì gộp hết
+    vs.compact(since_id=first_new)
+    if displaced:
+        hashes = vs.meta.values["content_hash"]
+        sources, source_codes = vs.meta.columns["source"]
+        rows = [
+            i for i in vs.meta.rows({"source": sorted(set(displaced.values()))}).tolist()
+            if displaced.get(str(hashes[i])) == sources[source_codes[i]]
+        ]
+        print(f"Thay {vs.delete(rows)} chunk trùng bằng bản có metadata cụ thể hơn")
+    if vs.manifest and len(vs.manifest["segments"]) > SEGMENT_COMPACT_MAX:
+        vs.compact()
+    # inverted index BM25 cho hybrid search, build cạnh vector store
+    vs.build_bm25()
+    if QUANTIZE_MODE and not vs.sparse and len(vs.texts) > 0:
+        # bản int8/float16 cho lượt quét đầu (xem QUANTIZE_MODE)
+        vs.build_quantized(QUANTIZE_MODE)
+    schedule.save(SCHEDULE_INDEX_PATH)
 
+    # khoảng chunk id [start, end) của từng file sau khi xoá + compact
+    for rel, entry in entries.items():
+        rows = vs.meta.rows({"source": rel})
+        entry["chunks"] = [int(rows[0]), int(rows[-1]) + 1] if rows.size else None
+    atomic_write_json(manifest_path, {"version": 1, "files": entries})
     print("Hoàn tất ingest.")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nạp tài liệu trong RAW_DIR vào vector store.")
+    parser.add_argument("--store", default="default", help="Tên vector store")
+    parser.add_argument("--sparse", action="store_true", help="Lưu embedding dạng sparse (CSR)")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Số process đọc file song song (0 = số CPU)",
+    )
+    parser.add_argument("--batch-size", type=int, default=32, help="Số chunk mỗi batch embedding")
+    parser.add_argument(
+        "--no-embed-cache", action="store_true",
+        help="Không dùng cache embedding trên đĩa giữa các lần ingest",
+    )
+    parser.add_argument("--full", action="store_true", help="Bỏ qua manifest, ingest lại toàn bộ")
+    args = parser.parse_args()
+
     RAW_DIR.mkdir(parents=True, exist_ok=True)
-    ingest_folder(RAW_DIR, store_name="default")
+    if not args.no_embed_cache:
+        enable_disk_cache(EMBED_DISK_CACHE_PATH)
+    ingest_folder(
+        RAW_DIR,
+        store_name=args.store,
+        sparse=args.sparse,
+        workers=args.workers or os.cpu_count() or 1,
+        full=args.full,
+        batch_size=args.batch_size,
+    )
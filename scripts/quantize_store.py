@@ -0,0 +1,17 @@
+import argparse
+
+from app.config import QUANTIZE_MODE
+from app.rag.quantize import QUANT_MODES
+from app.rag.vector_store import SimpleVectorStore
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lượng tử hoá embedding (int8/float16) cho lượt quét đầu.")
+    parser.add_argument("--store", default="default", help="Tên vector store")
+    parser.add_argument("--mode", choices=QUANT_MODES, default=QUANTIZE_MODE or "int8")
+    args = parser.parse_args()
+
+    vs = SimpleVectorStore(name=args.store)
+    quant = vs.build_quantized(args.mode)
+    print(f"Đã lượng tử hoá store '{args.store}' ({args.mode}): {len(vs.texts)} chunks, "
+          f"{quant.nbytes / 2**20:.1f} MiB (float32: {vs.embeddings.nbytes / 2**20:.1f} MiB) -> {vs.quant_path}")
@@ -0,0 +1,34 @@
+# tests/test_answer_cache.py
+# Tầng semantic của cache câu trả lời với backend embedding mặc định (hashing)
+import pytest
+
+from app.services.answer_cache import AnswerCache
+
+VERSION = ("v1",)
+
+
+@pytest.fixture
+def cache():
+    cache = AnswerCache(max_size=16, ttl=600, threshold=0.75, min_overlap=0.75)
+    # put() chỉ lưu khi đã biết phiên bản dữ liệu (get() đặt phiên bản)
+    assert cache.get("khởi tạo", "auto", VERSION) is None
+    return cache
+
+
+def test_paraphrase_hits_semantic_tier(cache):
+    cache.put("Học phí ngành kế toán bao nhiêu?", "auto", VERSION, "900.000đ / tín chỉ", ["local"])
+    assert cache.get("mức học phí của ngành kế toán là bao nhiêu vậy", "auto", VERSION) is None
+    hit = cache.get_similar("mức học phí của ngành kế toán là bao nhiêu vậy", "auto", VERSION)
+    assert hit == ("900.000đ / tín chỉ", ["local"])
+    assert cache.stats["semantic_hits"] == 1
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Học phí ngành kế toán bao nhiêu?", "Học phí ngành luật bao nhiêu?"),
+    ("Điều 10 quy định gì?", "Điều 11 quy định gì?"),
+    ("Lịch học lớp 25TH0101 tuần 15", "Lịch học lớp 25TH0102 tuần 15"),
+])
+def test_different_entity_misses(cache, cached, asked):
+    cache.put(cached, "auto", VERSION, "câu trả lời cũ", ["local"])
+    assert cache.get_similar(asked, "auto", VERSION) is None
+    assert cache.stats["semantic_hits"] == 0
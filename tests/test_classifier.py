@@ -0,0 +1,28 @@
+# tests/test_classifier.py
+# Phân loại cục bộ: câu ngoài phạm vi không được gán chắc chắn nhãn nghiệp vụ
+import pytest
+
+from app.services.classifier import classify_local
+
+
+@pytest.mark.parametrize("question", [
+    "Đà Lạt có gì chơi",
+    "Cách đăng ký tài khoản Facebook",
+    "Lịch sử Việt Nam thời Lý",
+    "Quán phở nào ngon ở Hà Nội",
+    "Đội nào vô địch World Cup 2022",
+    "Cách chữa đau đầu",
+    "Nên mua laptop hãng nào",
+])
+def test_off_domain_question_gets_no_confident_domain_label(question):
+    assert classify_local(question) in (None, "GENERAL")
+
+
+@pytest.mark.parametrize("question, label", [
+    ("điều kiện tốt nghiệp", "REGULATION"),
+    ("hạn nộp học phí", "TUITION"),
+    ("lịch học lớp 25TH0101 tuần 15", "SCHEDULE"),
+    ("chatgpt là gì", "GENERAL"),
+])
+def test_in_domain_question_is_classified_locally(question, label):
+    assert classify_local(question) == label
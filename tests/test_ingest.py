@@ -0,0 +1,105 @@
+# tests/test_ingest.py
+# Ingest tăng dần trên thư mục tạm (store, manifest, index lịch học không đụng tới data/)
+import shutil
+from pathlib import Path
+
+import pytest
+
+import app.rag.vector_store as vector_store
+import scripts.ingest_data as ingest_data
+from app.rag.schedule_index import ScheduleIndex
+from app.rag.vector_store import SimpleVectorStore
+
+RAW_DATA = Path(__file__).resolve().parent.parent / "data" / "raw"
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    store_dir = tmp_path / "vector_store"
+    raw.mkdir()
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_DIR", store_dir)
+    monkeypatch.setattr(ingest_data, "VECTOR_STORE_DIR", store_dir)
+    monkeypatch.setattr(ingest_data, "SCHEDULE_INDEX_PATH", tmp_path / "schedule_index.json")
+    return raw
+
+
+def _schedule(workspace: Path) -> ScheduleIndex:
+    return ScheduleIndex.load(workspace.parent / "schedule_index.json")
+
+
+def test_modified_schedule_file_replaces_its_rows(workspace):
+    pdf = workspace / "Tuan_15.pdf"
+    shutil.copy(RAW_DATA / "Tuan_15.pdf", pdf)
+    ingest_data.ingest_folder(workspace)
+    schedule = _schedule(workspace)
+    n_rows = len(schedule)
+    assert n_rows > 0
+    assert {r["source"] for r in schedule.rows} == {"Tuan_15.pdf"}
+    n_lookup = len(schedule.lookup("25AV0101", 15))
+
+    # đổi nội dung file (vẫn đọc được) -> ingest lại, số dòng không đổi
+    with open(pdf, "ab") as f:
+        f.write(b"\n% sua doi\n")
+    ingest_data.ingest_folder(workspace)
+    schedule = _schedule(workspace)
+    assert len(schedule) == n_rows
+    assert len(schedule.lookup("25AV0101", 15)) == n_lookup
+
+    # xoá file -> các dòng của nó cũng bị bỏ
+    pdf.unlink()
+    ingest_data.ingest_folder(workspace)
+    assert len(_schedule(workspace)) == 0
+    assert len(SimpleVectorStore(segmented=True).texts) == 0
+
+
+def _doc_types(store: SimpleVectorStore):
+    return {store.meta.get(i)["doc_type"] for i in range(len(store.meta))}
+
+
+def test_duplicate_files_keep_the_more_specific_metadata(workspace):
+    text = "Điều 1. Sinh viên phải đăng ký học phần đúng hạn.\n" * 20
+    # "a_ban_sao.txt" đứng trước theo tên nhưng chỉ suy ra được doc_type "general"
+    (workspace / "a_ban_sao.txt").write_text(text, encoding="utf-8")
+    (workspace / "quy_che_goc.txt").write_text(text, encoding="utf-8")
+    ingest_data.ingest_folder(workspace)
+    store = SimpleVectorStore(segmented=True)
+    n_chunks = len(store.texts)
+    assert n_chunks > 0
+    assert _doc_types(store) == {"regulation"}
+
+
+def test_more_specific_duplicate_added_later_replaces_chunks(workspace):
+    text = "Điều 2. Học phí được thu theo từng học kỳ.\n" * 20
+    (workspace / "a_ban_sao.txt").write_text(text, encoding="utf-8")
+    ingest_data.ingest_folder(workspace)
+    n_chunks = len(SimpleVectorStore(segmented=True).texts)
+    assert _doc_types(SimpleVectorStore(segmented=True)) == {"general"}
+
+    regulation = workspace / "quy_che_goc.txt"
+    regulation.write_text(text, encoding="utf-8")
+    ingest_data.ingest_folder(workspace)
+    store = SimpleVectorStore(segmented=True)
+    assert len(store.texts) == n_chunks
+    assert _doc_types(store) == {"regulation"}
+
+    # bỏ file cụ thể hơn -> chunk của bản sao quay lại
+    regulation.unlink()
+    ingest_data.ingest_folder(workspace)
+    store = SimpleVectorStore(segmented=True)
+    assert len(store.texts) == n_chunks
+    assert _doc_types(store) == {"general"}
+
+
+@pytest.mark.parametrize("raw", ["empty", "missing"])
+def test_full_run_without_supported_files_keeps_store(workspace, raw):
+    (workspace / "quy_che.txt").write_text("Điều 3. Sinh viên được bảo lưu kết quả.\n" * 20, encoding="utf-8")
+    ingest_data.ingest_folder(workspace)
+    n_chunks = len(SimpleVectorStore(segmented=True).texts)
+    assert n_chunks > 0
+
+    (workspace / "quy_che.txt").unlink()
+    (workspace / "ghi_chu.md").write_text("không phải tài liệu", encoding="utf-8")
+    folder = workspace if raw == "empty" else workspace / "khong_co"
+    ingest_data.ingest_folder(folder, full=True)
+    assert len(SimpleVectorStore(segmented=True).texts) == n_chunks